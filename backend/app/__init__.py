@@ -4,25 +4,64 @@ from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_bcrypt import Bcrypt
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import config
+from app.utils import db_routing
+from app.utils.db_routing import RoutingSession, replica_binds, READ_AFTER_HEADER
+from app.utils.db_pool import engine_options, init_db_metrics, prometheus_samples
+from app.utils.instrumentation import Instrumentation
+from app.utils.rate_limit import RateLimiter
+from app.utils.encoding import ResponseEncoder
+from app.utils.location_buffer import location_buffer
+from app.utils.change_events import change_events
+from app.utils.live import wake_bus_waiters
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 jwt = JWTManager()
 bcrypt = Bcrypt()
+instrumentation = Instrumentation()
+rate_limiter = RateLimiter()
+response_encoder = ResponseEncoder()
 
 
 def create_app(config_name='default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     app.url_map.strict_slashes = False
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+
+    # Engine options and replica binds are derived from the DB_* settings
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    if app.config.get('SQLALCHEMY_REPLICA_URIS'):
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for key, uri in replica_binds(app.config['SQLALCHEMY_REPLICA_URIS']).items():
+            binds.setdefault(key, {'url': uri, **engine_options(app.config, uri)})
+        app.config['SQLALCHEMY_BINDS'] = binds
 
     # Initialize extensions
     db.init_app(app)
+    init_db_metrics(app, db)
     migrate.init_app(app, db)
     jwt.init_app(app)
     bcrypt.init_app(app)
-    CORS(app, resources={r"/api/*": {"origins": "*"}})
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=[READ_AFTER_HEADER, 'Retry-After'])
+    app.before_request(db_routing.before_request)
+    app.after_request(db_routing.after_request)
+    instrumentation.init_app(app)
+    instrumentation.add_collector(lambda: prometheus_samples(db.engines))
+    rate_limiter.init_app(app)
+    instrumentation.add_collector(rate_limiter.prometheus_samples)
+    # After instrumentation, so metrics see the encoded size
+    response_encoder.init_app(app)
+    instrumentation.add_collector(response_encoder.prometheus_samples)
+    location_buffer.init_app(app)
+    instrumentation.add_collector(location_buffer.prometheus_samples)
+    change_events.init_app(app)
+    instrumentation.add_collector(change_events.prometheus_samples)
+    change_events.subscribe(wake_bus_waiters, entities=('bus', 'bus_location'))
 
     # Register blueprints
     from app.routes.auth import auth_bp
@@ -32,6 +71,10 @@ def create_app(config_name='default'):
     from app.routes.students import students_bp
     from app.routes.notifications import notifications_bp
     from app.routes.schools import schools_bp
+    from app.routes.trips import trips_bp
+    from app.routes.dashboard import dashboard_bp
+    from app.routes.batch import batch_bp
+    from app.routes.metrics import metrics_bp
 
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(users_bp, url_prefix='/api/users')
@@ -40,6 +83,25 @@ def create_app(config_name='default'):
     app.register_blueprint(students_bp, url_prefix='/api/students')
     app.register_blueprint(notifications_bp, url_prefix='/api/notifications')
     app.register_blueprint(schools_bp, url_prefix='/api/schools')
+    app.register_blueprint(trips_bp, url_prefix='/api/trips')
+    app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
+    app.register_blueprint(batch_bp, url_prefix='/api/batch')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+
+    # CLI commands
+    from app.commands import (
+        attendance_cli, boardings_cli, changes_cli, dashboard_cli, delays_cli, jobs_cli, locations_cli,
+        notifications_cli, trips_cli
+    )
+    app.cli.add_command(boardings_cli)
+    app.cli.add_command(locations_cli)
+    app.cli.add_command(trips_cli)
+    app.cli.add_command(delays_cli)
+    app.cli.add_command(attendance_cli)
+    app.cli.add_command(dashboard_cli)
+    app.cli.add_command(notifications_cli)
+    app.cli.add_command(changes_cli)
+    app.cli.add_command(jobs_cli)
 
     # Health check route
     @app.route('/api/health')
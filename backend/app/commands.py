@@ -0,0 +1,225 @@
+import click
+from flask.cli import AppGroup
+
+boardings_cli = AppGroup('boardings', help='Boarding history maintenance.')
+
+
+@boardings_cli.command('archive')
+@click.option('--month', help='Archive a single month (YYYY-MM) instead of every closed month.')
+def archive_boardings(month):
+    """Move closed months of boardings into the columnar archive."""
+    from app.utils.boarding_archive import archive_closed_months, archive_month
+
+    if month:
+        year, mon = (int(part) for part in month.split('-'))
+        archived = {month: archive_month(year, mon)}
+    else:
+        archived = archive_closed_months()
+
+    if not archived:
+        click.echo('Nothing to archive')
+    for key, count in archived.items():
+        click.echo(f'{key}: archived {count} boardings')
+
+
+@boardings_cli.command('manifest')
+def show_manifest():
+    """Print the archived months."""
+    from app.utils.boarding_archive import load_manifest
+
+    segments = load_manifest()['segments']
+    if not segments:
+        click.echo('Archive is empty')
+    for key in sorted(segments):
+        segment = segments[key]
+        click.echo(f"{key}: {segment['rows']} rows, {segment['bytes']} bytes ({segment['file']})")
+
+
+locations_cli = AppGroup('locations', help='Bus location history maintenance.')
+
+
+@locations_cli.command('prune')
+@click.option('--days', type=int, help='Keep this many days (default LOCATION_HISTORY_RETENTION_DAYS).')
+def prune_locations(days):
+    """Delete bus_positions rows older than the retention period."""
+    from app.utils.track import prune_positions
+
+    deleted, cutoff = prune_positions(days)
+    click.echo(f'Deleted {deleted} positions recorded before {cutoff:%Y-%m-%d %H:%M}')
+
+
+trips_cli = AppGroup('trips', help='Trip schedule maintenance.')
+
+
+@trips_cli.command('materialize')
+@click.option('--days', type=int, help='Days ahead to materialize (default TRIP_HORIZON_DAYS).')
+def materialize(days):
+    """Create the dated trips for upcoming days from the route schedules (run nightly)."""
+    from app.utils.schedule import materialize_trips
+
+    counts = materialize_trips(days=days)
+    click.echo(f"Trips: {counts['created']} created, {counts['updated']} updated, {counts['removed']} removed")
+
+
+delays_cli = AppGroup('delays', help='Automatic delay detection.')
+
+
+@delays_cli.command('detect')
+def detect():
+    """Evaluate every active trip once and alert parents of late buses."""
+    from app.utils.delays import detect_delays
+
+    click.echo(detect_delays())
+
+
+def run_forever(fn, interval, description):
+    """Call fn every `interval` seconds in a worker process, surviving failures."""
+    import logging
+    import time
+    from app import db
+
+    logger = logging.getLogger(fn.__module__)
+    while True:
+        started = time.monotonic()
+        try:
+            fn()
+        except Exception:
+            db.session.rollback()
+            logger.exception('%s pass failed', description)
+        finally:
+            db.session.remove()
+        time.sleep(max(0, interval - (time.monotonic() - started)))
+
+
+@delays_cli.command('watch')
+@click.option('--interval', type=int, help='Seconds between passes (default DELAY_DETECTOR_INTERVAL_SECONDS).')
+def watch(interval):
+    """Run the detector forever (worker process); also refreshes the dashboard counters."""
+    from flask import current_app
+    from app.utils.counters import refresh_time_counters
+    from app.utils.delays import detect_delays
+
+    def detection_pass():
+        detect_delays()
+        refresh_time_counters()
+
+    run_forever(detection_pass, interval or current_app.config['DELAY_DETECTOR_INTERVAL_SECONDS'], 'Delay detection')
+
+
+attendance_cli = AppGroup('attendance', help='Attendance reconciliation and missed-pickup alerts.')
+
+
+@attendance_cli.command('reconcile')
+def reconcile():
+    """Write attendance for every ended trip and alert parents of missed pickups."""
+    from app.utils.attendance import reconcile_trips
+
+    click.echo(reconcile_trips())
+
+
+@attendance_cli.command('watch')
+@click.option('--interval', type=int, help='Seconds between passes (default ATTENDANCE_INTERVAL_SECONDS).')
+def watch_attendance(interval):
+    """Reconcile trips as they end, forever (worker process)."""
+    from flask import current_app
+    from app.utils.attendance import reconcile_trips
+
+    run_forever(reconcile_trips, interval or current_app.config['ATTENDANCE_INTERVAL_SECONDS'],
+                'Attendance reconciliation')
+
+
+dashboard_cli = AppGroup('dashboard', help='Operator dashboard counters.')
+
+
+@dashboard_cli.command('rebuild')
+def rebuild():
+    """Recompute every dashboard counter from the source tables (after deploying or repairs)."""
+    from app.utils.counters import rebuild_counters
+
+    click.echo(f'Rebuilt {rebuild_counters()} counters')
+
+
+@dashboard_cli.command('refresh')
+def refresh():
+    """Recompute the time-driven counters (trip states, stale trackers)."""
+    from app.utils.counters import refresh_time_counters
+
+    refresh_time_counters()
+    click.echo('Refreshed trip and tracker counters')
+
+
+notifications_cli = AppGroup('notifications', help='Notification digests.')
+
+
+@notifications_cli.command('flush')
+def flush():
+    """Send every held alert that is due, merged into digests."""
+    from app.utils.digests import flush_digests
+
+    click.echo(flush_digests())
+
+
+@notifications_cli.command('watch')
+@click.option('--interval', type=int, help='Seconds between passes (default NOTIFICATION_DIGEST_INTERVAL_SECONDS).')
+def watch_notifications(interval):
+    """Flush due digests forever (worker process)."""
+    from flask import current_app
+    from app.utils.digests import flush_digests
+
+    run_forever(flush_digests, interval or current_app.config['NOTIFICATION_DIGEST_INTERVAL_SECONDS'],
+                'Notification digest')
+
+
+changes_cli = AppGroup('changes', help='Change-event outbox maintenance.')
+
+
+@changes_cli.command('prune')
+@click.option('--hours', type=int, help='Keep this many hours (default CHANGE_EVENTS_RETENTION_HOURS).')
+def prune_changes(hours):
+    """Delete change_events rows older than the retention period."""
+    from app.utils.change_events import prune_change_events
+
+    click.echo(f'Deleted {prune_change_events(hours)} change events')
+
+
+jobs_cli = AppGroup('jobs', help='Background jobs.')
+
+
+@jobs_cli.command('worker')
+@click.option('--pools', help='Threads per pool, e.g. default=4,maintenance=1 (default JOBS_POOLS).')
+@click.option('--no-schedule', is_flag=True, help='Only run queued jobs; never become the scheduler.')
+def jobs_worker(pools, no_schedule):
+    """Run scheduled and queued jobs until stopped (worker process)."""
+    from flask import current_app
+    import app.jobs  # noqa: F401  registers the jobs
+    from app.utils.jobs import Worker, parse_pools
+
+    Worker(current_app._get_current_object(), parse_pools(pools) if pools else None,
+           schedule=not no_schedule).run()
+
+
+@jobs_cli.command('list')
+def list_jobs():
+    """Show every job, its schedule and its latest run."""
+    import app.jobs  # noqa: F401
+    from app.utils.jobs import job_status
+
+    for entry in job_status():
+        last = entry['last_run']
+        summary = f"{last['status']} at {last['finished_at'] or last['started_at'] or last['run_at']}" if last else 'never run'
+        click.echo(f"{entry['name']:<24} {entry['schedule'] or 'on demand':<42} {entry['pool']:<12} {summary}")
+
+
+@jobs_cli.command('enqueue')
+@click.argument('name')
+def enqueue_job(name):
+    """Queue a job to run now on any worker."""
+    import app.jobs  # noqa: F401
+    from app import db
+    from app.utils.jobs import JOBS, enqueue
+
+    if name not in JOBS:
+        raise click.BadParameter(f'Unknown job; one of {", ".join(sorted(JOBS))}', param_hint='NAME')
+    enqueue(name)
+    db.session.commit()
+    click.echo(f'Queued {name}')
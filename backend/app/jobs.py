@@ -0,0 +1,75 @@
+# Scheduled background jobs, run by `flask jobs worker` (see app/utils/jobs.py).
+# Cron times are local to SCHEDULE_TIMEZONE. Every job must be safe to run
+# twice: a run whose worker dies is run again once its lease expires.
+from app.utils.jobs import job
+
+
+@job('delays.detect', every='DELAY_DETECTOR_INTERVAL_SECONDS', max_attempts=1, timeout=120)
+def detect_delays():
+    """Estimate delays on active trips and alert parents of late buses."""
+    from app.utils.delays import detect_delays
+
+    return detect_delays()
+
+
+@job('dashboard.refresh', every=60, max_attempts=1, timeout=120)
+def refresh_dashboard():
+    """Trip-state and stale-tracker counters, which move with the clock."""
+    from app.utils.counters import refresh_time_counters
+
+    refresh_time_counters()
+
+
+@job('attendance.reconcile', every='ATTENDANCE_INTERVAL_SECONDS', max_attempts=1, timeout=300)
+def reconcile_attendance():
+    """Settle ended trips and alert parents of missed pickups."""
+    from app.utils.attendance import reconcile_trips
+
+    return reconcile_trips()
+
+
+@job('notifications.digests', every='NOTIFICATION_DIGEST_INTERVAL_SECONDS', max_attempts=1, timeout=120)
+def flush_digests():
+    """Send held alerts that are due, merged into digests."""
+    from app.utils.digests import flush_digests
+
+    return flush_digests()
+
+
+@job('trips.materialize', cron='10 0 * * *', pool='maintenance')
+def materialize_trips():
+    from app.utils.schedule import materialize_trips
+
+    return materialize_trips()
+
+
+@job('locations.prune', cron='30 2 * * *', pool='maintenance')
+def prune_locations():
+    from app.utils.track import prune_positions
+
+    deleted, _ = prune_positions()
+    return deleted
+
+
+@job('changes.prune', cron='40 2 * * *', pool='maintenance')
+def prune_changes():
+    from app.utils.change_events import prune_change_events
+
+    return prune_change_events()
+
+
+# Deletes the archived rows, so only scheduled where every dyno reads the
+# same BOARDING_ARCHIVE_DIR (see BOARDING_ARCHIVE_SCHEDULED)
+@job('boardings.archive', cron='0 3 * * *', pool='maintenance', timeout=3600, enabled='BOARDING_ARCHIVE_SCHEDULED')
+def archive_boardings():
+    """Archive closed months; a no-op until a month closes."""
+    from app.utils.boarding_archive import archive_closed_months
+
+    return archive_closed_months()
+
+
+@job('jobs.prune', cron='50 2 * * *', pool='maintenance')
+def prune_jobs():
+    from app.utils.jobs import prune_jobs
+
+    return prune_jobs()
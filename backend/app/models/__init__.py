@@ -5,5 +5,14 @@ from app.models.school import School
 from app.models.student import Student
 from app.models.notification import Notification
 from app.models.boarding import Boarding
+from app.models.bus_position import BusPosition
+from app.models.trip import Trip
+from app.models.attendance import Attendance
+from app.models.dashboard_counter import DashboardCounter
+from app.models.broadcast import Broadcast, BroadcastMember, BroadcastReceipt
+from app.models.read_watermark import ReadWatermark
+from app.models.pending_notification import PendingNotification
+from app.models.change_event import ChangeEvent
+from app.models.job import Job
 
-__all__ = ['User', 'Bus', 'Route', 'School', 'Student', 'Notification', 'Boarding']
+__all__ = ['User', 'Bus', 'Route', 'School', 'Student', 'Notification', 'Boarding', 'BusPosition', 'Trip', 'Attendance', 'DashboardCounter', 'Broadcast', 'BroadcastMember', 'BroadcastReceipt', 'ReadWatermark', 'PendingNotification', 'ChangeEvent', 'Job']
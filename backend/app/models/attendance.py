@@ -0,0 +1,41 @@
+from app import db
+from datetime import datetime
+
+
+class Attendance(db.Model):
+    """Expected rider on a trip and whether they were checked in (see app/utils/attendance.py)."""
+    __tablename__ = 'attendance'
+    __table_args__ = (
+        db.UniqueConstraint('trip_id', 'student_id', name='uq_attendance_trip_id_student_id'),
+        db.Index('ix_attendance_student_id_service_date', 'student_id', 'service_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    trip_id = db.Column(db.Integer, db.ForeignKey('trips.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=False)
+    service_date = db.Column(db.Date, nullable=False)  # local date
+    status = db.Column(db.String(20), nullable=False)  # present, missed, unrecorded
+    boarding_id = db.Column(db.Integer, db.ForeignKey('boardings.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    trip = db.relationship('Trip', backref=db.backref('attendance', lazy='dynamic'))
+    student = db.relationship('Student')
+    boarding = db.relationship('Boarding')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'trip_id': self.trip_id,
+            'student_id': self.student_id,
+            'student_name': f'{self.student.first_name} {self.student.last_name}' if self.student else None,
+            'route_id': self.route_id,
+            'service_date': self.service_date.isoformat(),
+            'status': self.status,
+            'boarding_id': self.boarding_id,
+            'boarding_time': self.boarding.boarding_time.isoformat() if self.boarding else None
+        }
+
+    def __repr__(self):
+        return f'<Attendance {self.student_id} trip {self.trip_id} {self.status}>'
@@ -4,6 +4,10 @@ from datetime import datetime
 
 class Boarding(db.Model):
     __tablename__ = 'boardings'
+    __table_args__ = (
+        db.Index('ix_boardings_route_id_boarding_time', 'route_id', 'boarding_time'),
+        db.Index('ix_boardings_student_id_boarding_time', 'student_id', 'boarding_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
@@ -0,0 +1,86 @@
+from app import db
+from datetime import datetime
+
+
+class Broadcast(db.Model):
+    """A notification stored once for a snapshotted audience (see app/utils/broadcasts.py)."""
+    __tablename__ = 'broadcasts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    notification_type = db.Column(db.String(50), default='general')
+    priority = db.Column(db.String(20), default='normal')
+    delivery_method = db.Column(db.String(20), default='in_app')
+    related_route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=True)
+    recipient_count = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sender_id': self.sender_id,
+            'title': self.title,
+            'message': self.message,
+            'notification_type': self.notification_type,
+            'priority': self.priority,
+            'delivery_method': self.delivery_method,
+            'related_route_id': self.related_route_id,
+            'recipient_count': self.recipient_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def to_notification_dict(self, recipient_id, receipt=None, watermark=None):
+        """The broadcast as one recipient's notification, with their read state."""
+        read_at = receipt.read_at if receipt else None
+        if read_at is None and watermark is not None and watermark.covers_broadcast(self):
+            read_at = watermark.read_at
+        return {
+            'id': f'b{self.id}',
+            'broadcast_id': self.id,
+            'sender_id': self.sender_id,
+            'recipient_id': recipient_id,
+            'title': self.title,
+            'message': self.message,
+            'notification_type': self.notification_type,
+            'priority': self.priority,
+            'is_read': read_at is not None,
+            'read_at': read_at.isoformat() if read_at else None,
+            'delivery_method': self.delivery_method,
+            'related_route_id': self.related_route_id,
+            'related_student_id': None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<Broadcast {self.title} to {self.recipient_count}>'
+
+
+class BroadcastMember(db.Model):
+    """Which of 64 consecutive user ids are in a broadcast's audience.
+
+    Bit n of `members` is user id bucket * 64 + n. Buckets without
+    recipients have no row.
+    """
+    __tablename__ = 'broadcast_members'
+
+    bucket = db.Column(db.Integer, primary_key=True)
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcasts.id', ondelete='CASCADE'), primary_key=True)
+    members = db.Column(db.BigInteger, nullable=False)  # signed 64-bit bitmask
+
+    def __repr__(self):
+        return f'<BroadcastMember {self.broadcast_id} bucket {self.bucket}>'
+
+
+class BroadcastReceipt(db.Model):
+    """Per-recipient state of a broadcast; only exists once they read or delete it."""
+    __tablename__ = 'broadcast_receipts'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcasts.id', ondelete='CASCADE'), primary_key=True)
+    read_at = db.Column(db.DateTime)
+    deleted_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<BroadcastReceipt {self.broadcast_id} user {self.user_id}>'
@@ -0,0 +1,30 @@
+from app import db
+
+
+class BusPosition(db.Model):
+    """Append-only history of tracker fixes, written by the location buffer."""
+    __tablename__ = 'bus_positions'
+    __table_args__ = (
+        db.Index('ix_bus_positions_bus_id_recorded_at', 'bus_id', 'recorded_at'),
+    )
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    speed = db.Column(db.Float)  # km/h
+    heading = db.Column(db.Float)  # degrees
+
+    def to_dict(self):
+        return {
+            'bus_id': self.bus_id,
+            'recorded_at': self.recorded_at.isoformat() if self.recorded_at else None,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'speed': self.speed,
+            'heading': self.heading
+        }
+
+    def __repr__(self):
+        return f'<BusPosition {self.bus_id} @ {self.recorded_at}>'
@@ -0,0 +1,27 @@
+from app import db
+from datetime import datetime
+
+
+class ChangeEvent(db.Model):
+    """Outbox row written with each change to a tracked entity (see app/utils/change_events.py)."""
+    __tablename__ = 'change_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(30), nullable=False)  # bus, route, student, school
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # created, updated, deleted
+    fields = db.Column(db.String(500))  # changed columns, comma separated (updates only)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def to_event(self):
+        return {
+            'id': self.id,
+            'entity': self.entity,
+            'entity_id': self.entity_id,
+            'action': self.action,
+            'fields': self.fields.split(',') if self.fields else None,
+            'at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<ChangeEvent {self.entity} {self.entity_id} {self.action}>'
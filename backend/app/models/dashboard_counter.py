@@ -0,0 +1,15 @@
+from app import db
+from datetime import datetime
+
+
+class DashboardCounter(db.Model):
+    """Incrementally maintained dashboard aggregate (see app/utils/counters.py)."""
+    __tablename__ = 'dashboard_counters'
+
+    scope = db.Column(db.String(40), primary_key=True)  # fleet, day:<date>, user:<id>
+    name = db.Column(db.String(60), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DashboardCounter {self.scope} {self.name}={self.value}>'
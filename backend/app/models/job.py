@@ -0,0 +1,45 @@
+from app import db
+from datetime import datetime
+
+
+class Job(db.Model):
+    """One run of a background job (see app/utils/jobs.py)."""
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    args = db.Column(db.Text)  # JSON keyword arguments
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed, skipped
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Schedule tick (name@time) for scheduled runs, so every node enqueues it at most once
+    dedupe_key = db.Column(db.String(150), unique=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    locked_by = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime)  # lease; a running job past it is run again
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+        db.Index('ix_jobs_name_created_at', 'name', 'created_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'run_at': self.run_at.isoformat() if self.run_at else None,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'locked_by': self.locked_by,
+            'last_error': self.last_error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f'<Job {self.name} {self.status}>'
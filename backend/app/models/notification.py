@@ -21,6 +21,11 @@ class Notification(db.Model):
     related_student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Inbox listing and unread-above-watermark scans
+        db.Index('ix_notifications_recipient_id_is_read_id', 'recipient_id', 'is_read', 'id'),
+    )
+
     # Relationships
     related_route = db.relationship('Route', backref='notifications')
     related_student = db.relationship('Student', backref='notifications')
@@ -29,7 +34,12 @@ class Notification(db.Model):
         self.is_read = True
         self.read_at = datetime.utcnow()
 
-    def to_dict(self):
+    def to_dict(self, watermark=None):
+        # Rows under the recipient's read watermark count as read
+        if not self.is_read and watermark is not None and watermark.covers_notification(self):
+            is_read, read_at = True, watermark.read_at
+        else:
+            is_read, read_at = self.is_read, self.read_at
         return {
             'id': self.id,
             'sender_id': self.sender_id,
@@ -38,8 +48,8 @@ class Notification(db.Model):
             'message': self.message,
             'notification_type': self.notification_type,
             'priority': self.priority,
-            'is_read': self.is_read,
-            'read_at': self.read_at.isoformat() if self.read_at else None,
+            'is_read': is_read,
+            'read_at': read_at.isoformat() if read_at else None,
             'delivery_method': self.delivery_method,
             'related_route_id': self.related_route_id,
             'related_student_id': self.related_student_id,
@@ -0,0 +1,27 @@
+from app import db
+from datetime import datetime
+
+
+class PendingNotification(db.Model):
+    """An alert waiting to be merged into a digest (see app/utils/digests.py)."""
+    __tablename__ = 'pending_notifications'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    notification_type = db.Column(db.String(50), nullable=False, default='general')
+    priority = db.Column(db.String(20), nullable=False, default='normal')
+    delivery_method = db.Column(db.String(20), default='in_app')
+    related_route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=True)
+    related_student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    due_at = db.Column(db.DateTime, nullable=False, index=True)  # created_at + the priority's window
+
+    __table_args__ = (
+        db.Index('ix_pending_notifications_recipient_id_type', 'recipient_id', 'notification_type'),
+    )
+
+    def __repr__(self):
+        return f'<PendingNotification {self.notification_type} for {self.recipient_id}>'
@@ -0,0 +1,21 @@
+from app import db
+from datetime import datetime
+
+
+class ReadWatermark(db.Model):
+    """Everything up to these ids is read for the user (see app/utils/inbox.py)."""
+    __tablename__ = 'read_watermarks'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    notification_id = db.Column(db.Integer, nullable=False, default=0)
+    broadcast_id = db.Column(db.Integer, nullable=False, default=0)
+    read_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def covers_notification(self, notification):
+        return notification.id <= self.notification_id
+
+    def covers_broadcast(self, broadcast):
+        return broadcast.id <= self.broadcast_id
+
+    def __repr__(self):
+        return f'<ReadWatermark user {self.user_id} {self.notification_id}/{self.broadcast_id}>'
@@ -1,5 +1,7 @@
 from app import db
 from datetime import datetime
+from sqlalchemy.orm import validates
+from app.utils.schedule import days_to_mask
 
 
 class Route(db.Model):
@@ -8,7 +10,7 @@ class Route(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), nullable=True)
+    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), nullable=True, index=True)
     operator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     start_location = db.Column(db.String(200))
     end_location = db.Column(db.String(200))
@@ -19,6 +21,7 @@ class Route(db.Model):
     scheduled_start_time = db.Column(db.Time)
     scheduled_end_time = db.Column(db.Time)
     days_of_week = db.Column(db.String(50))  # e.g., "mon,tue,wed,thu,fri"
+    days_mask = db.Column(db.SmallInteger, default=0, nullable=False, index=True)  # kept in sync with days_of_week
     status = db.Column(db.String(20), default='active')  # active, inactive, completed
     is_morning_route = db.Column(db.Boolean, default=True)  # morning pickup vs afternoon dropoff
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -28,6 +31,11 @@ class Route(db.Model):
     operator = db.relationship('User', backref='routes')
     students = db.relationship('Student', backref='route', lazy='dynamic')
 
+    @validates('days_of_week')
+    def _sync_days_mask(self, key, value):
+        self.days_mask = days_to_mask(value)
+        return value
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -0,0 +1,48 @@
+from app import db
+from datetime import datetime
+
+
+class Trip(db.Model):
+    """A dated run of a route, materialized from its schedule (see app/utils/schedule.py)."""
+    __tablename__ = 'trips'
+    __table_args__ = (
+        db.UniqueConstraint('route_id', 'service_date', name='uq_trips_route_id_service_date'),
+        db.Index('ix_trips_scheduled_start_scheduled_end', 'scheduled_start', 'scheduled_end'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=False)
+    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), nullable=True)
+    operator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    service_date = db.Column(db.Date, nullable=False, index=True)  # local date
+    scheduled_start = db.Column(db.DateTime, nullable=False)  # UTC
+    scheduled_end = db.Column(db.DateTime, nullable=False)  # UTC
+    status = db.Column(db.String(20), default='scheduled', nullable=False)  # scheduled, cancelled
+    delay_minutes = db.Column(db.Integer)  # latest estimate from the delay detector
+    delay_notified_at = db.Column(db.DateTime)  # parents were alerted (once per trip)
+    reconciled_at = db.Column(db.DateTime)  # attendance records were written
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    route = db.relationship('Route', backref=db.backref('trips', lazy='dynamic'))
+    bus = db.relationship('Bus')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'route_id': self.route_id,
+            'route_name': self.route.name if self.route else None,
+            'is_morning_route': self.route.is_morning_route if self.route else None,
+            'bus_id': self.bus_id,
+            'operator_id': self.operator_id,
+            'service_date': self.service_date.isoformat(),
+            'scheduled_start': self.scheduled_start.isoformat(),
+            'scheduled_end': self.scheduled_end.isoformat(),
+            'status': self.status,
+            'delay_minutes': self.delay_minutes,
+            'delay_notified_at': self.delay_notified_at.isoformat() if self.delay_notified_at else None,
+            'reconciled_at': self.reconciled_at.isoformat() if self.reconciled_at else None
+        }
+
+    def __repr__(self):
+        return f'<Trip {self.route_id} {self.service_date}>'
@@ -1,4 +1,5 @@
-from app import db, bcrypt
+from app import db
+from app.utils.passwords import check_password_hash, generate_password_hash, needs_rehash
 from datetime import datetime
 
 
@@ -24,12 +25,15 @@ class User(db.Model):
     notifications_received = db.relationship('Notification', backref='recipient', lazy='dynamic', foreign_keys='Notification.recipient_id')
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = generate_password_hash(password)
 
     def check_password(self, password):
         if not self.password_hash:
             return False
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return check_password_hash(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return bool(self.password_hash) and needs_rehash(self.password_hash)
 
     def to_dict(self):
         return {
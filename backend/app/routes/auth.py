@@ -1,17 +1,30 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import (
     create_access_token, create_refresh_token,
     jwt_required, get_jwt_identity
 )
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-import os
 from app import db
 from app.models import User
+from app.utils.login_throttle import login_throttle
+from app.utils.passwords import HashingBusy
+from app.utils.google_tokens import get_verifier
 
 auth_bp = Blueprint('auth', __name__)
 
 
+def hashing_busy_response():
+    return jsonify({'error': 'Server is busy, please try again'}), 503, {'Retry-After': '2'}
+
+
+def login_limits(email, ip):
+    config = current_app.config
+    window = config['LOGIN_FAILURE_WINDOW']
+    return [
+        (f'account:{email.lower()}', config['LOGIN_MAX_FAILURES_PER_ACCOUNT'], window),
+        (f'ip:{ip}', config['LOGIN_MAX_FAILURES_PER_IP'], window),
+    ]
+
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -40,7 +53,10 @@ def register():
         company_name=data.get('company_name'),
         role=data['role']
     )
-    user.set_password(data['password'])
+    try:
+        user.set_password(data['password'])
+    except HashingBusy:
+        return hashing_busy_response()
 
     db.session.add(user)
     db.session.commit()
@@ -63,15 +79,40 @@ def login():
 
     if not data or 'email' not in data or 'password' not in data:
         return jsonify({'error': 'Email and password are required'}), 400
+    if not isinstance(data['email'], str) or not isinstance(data['password'], str):
+        return jsonify({'error': 'Email and password must be strings'}), 400
+
+    # Brute-force throttling per account and per client IP. Behind
+    # TRUSTED_PROXIES, ProxyFix has already set remote_addr from X-Forwarded-For.
+    limits = login_limits(data['email'], request.remote_addr)
+    retry_after = login_throttle.retry_after(limits)
+    if retry_after:
+        return jsonify({'error': 'Too many failed login attempts'}), 429, {'Retry-After': str(retry_after)}
 
     user = User.query.filter_by(email=data['email']).first()
 
-    if not user or not user.check_password(data['password']):
+    try:
+        valid = user is not None and user.check_password(data['password'])
+    except HashingBusy:
+        return hashing_busy_response()
+
+    if not valid:
+        login_throttle.record_failure([key for key, _, _ in limits])
         return jsonify({'error': 'Invalid email or password'}), 401
 
+    login_throttle.reset(limits[0][0])
+
     if not user.is_active:
         return jsonify({'error': 'Account is deactivated'}), 403
 
+    # Upgrade hashes made with an older cost factor while we have the password
+    if user.password_needs_rehash():
+        try:
+            user.set_password(data['password'])
+            db.session.commit()
+        except HashingBusy:
+            pass
+
     access_token = create_access_token(identity=str(user.id))
     refresh_token = create_refresh_token(identity=str(user.id))
 
@@ -121,7 +162,10 @@ def update_current_user():
     if 'phone' in data:
         user.phone = data['phone']
     if 'password' in data:
-        user.set_password(data['password'])
+        try:
+            user.set_password(data['password'])
+        except HashingBusy:
+            return hashing_busy_response()
 
     db.session.commit()
 
@@ -135,15 +179,14 @@ def update_current_user():
 def google_auth():
     data = request.get_json()
 
-    if 'credential' not in data:
+    if not data or 'credential' not in data:
         return jsonify({'error': 'Google credential is required'}), 400
 
     try:
-        # Verify the Google token
-        idinfo = id_token.verify_oauth2_token(
+        # Verify the Google token against the cached signing keys
+        idinfo = get_verifier(current_app).verify(
             data['credential'],
-            google_requests.Request(),
-            os.environ.get('GOOGLE_CLIENT_ID')
+            current_app.config['GOOGLE_CLIENT_ID']
         )
 
         google_id = idinfo['sub']
@@ -0,0 +1,29 @@
+from flask import Blueprint, current_app, request, jsonify
+from flask_jwt_extended import jwt_required
+from app.utils.batch import FORWARDED_HEADERS, parse_batch, run_batch
+from app.utils.db_routing import READ_AFTER_HEADER
+
+batch_bp = Blueprint('batch', __name__)
+
+
+@batch_bp.route('/', methods=['POST'])
+@jwt_required()
+def run_batch_requests():
+    """Run several API calls in one round trip.
+
+    Body: {"requests": [{"id": "kids", "method": "GET", "path": "/api/students"}, ...]}
+    """
+    try:
+        subrequests = parse_batch(request.get_json(silent=True), current_app.config['BATCH_MAX_REQUESTS'])
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    results = run_batch(subrequests, headers, request.remote_addr)
+
+    response = jsonify({'responses': results})
+    # Carry the latest read-your-writes window from any sub-request that wrote
+    read_after = [float(r['headers'][READ_AFTER_HEADER]) for r in results if READ_AFTER_HEADER in r['headers']]
+    if read_after:
+        response.headers[READ_AFTER_HEADER] = f'{max(read_after):.3f}'
+    return response, 200
@@ -1,8 +1,16 @@
-from flask import Blueprint, request, jsonify
+import time
+from flask import Blueprint, Response, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 from app import db
 from app.models import Bus, User
+from app.utils.counters import bus_status_changed
+from app.utils.live import bus_locations
+from app.utils.location_buffer import location_buffer
+from app.utils.rate_limit import rate_limit
+from app.utils.schedule import parse_utc
+from app.utils.track import parse_window, replay, window_boardings
+from app.utils.tracker_frames import CONTENT_TYPE as FRAME_CONTENT_TYPE, FrameError, decode_frame, encode_ack
 
 buses_bp = Blueprint('buses', __name__)
 
@@ -62,6 +70,7 @@ def create_bus():
     )
 
     db.session.add(bus)
+    bus_status_changed(None, bus.status)
     db.session.commit()
 
     return jsonify({
@@ -98,6 +107,7 @@ def update_bus(bus_id):
     if 'year' in data:
         bus.year = data['year']
     if 'status' in data:
+        bus_status_changed(bus.status, data['status'])
         bus.status = data['status']
 
     db.session.commit()
@@ -110,29 +120,141 @@ def update_bus(bus_id):
 
 @buses_bp.route('/<int:bus_id>/location', methods=['PUT'])
 @jwt_required()
+@rate_limit('location', device_arg='bus_id')
 def update_bus_location(bus_id):
     if not require_operator_or_admin():
         return jsonify({'error': 'Unauthorized'}), 403
 
-    bus = Bus.query.get(bus_id)
-    if not bus:
-        return jsonify({'error': 'Bus not found'}), 404
+    # Buses are only soft-deleted, so an id seen once stays valid
+    if bus_id not in location_buffer.known_buses:
+        if not db.session.query(Bus.id).filter_by(id=bus_id).first():
+            return jsonify({'error': 'Bus not found'}), 404
+        location_buffer.known_buses.add(bus_id)
 
     data = request.get_json()
 
-    if 'latitude' not in data or 'longitude' not in data:
+    if not data or 'latitude' not in data or 'longitude' not in data:
         return jsonify({'error': 'Latitude and longitude are required'}), 400
 
-    bus.current_latitude = data['latitude']
-    bus.current_longitude = data['longitude']
-    bus.last_location_update = datetime.utcnow()
+    # Validate here: a bad value would only fail later, in the batched flush
+    try:
+        latitude, longitude = float(data['latitude']), float(data['longitude'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Latitude and longitude must be numbers'}), 400
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return jsonify({'error': 'Latitude must be within -90..90 and longitude within -180..180'}), 400
 
-    db.session.commit()
+    reported_at = datetime.utcnow()
+    location_buffer.submit(bus_id, latitude, longitude, reported_at)
+
+    if location_buffer.write_through:
+        return jsonify({
+            'message': 'Location updated successfully',
+            'bus': Bus.query.get(bus_id).to_dict()
+        }), 200
 
     return jsonify({
-        'message': 'Location updated successfully',
-        'bus': bus.to_dict()
-    }), 200
+        'message': 'Location accepted',
+        'bus_id': bus_id,
+        'current_location': {
+            'latitude': latitude,
+            'longitude': longitude,
+            'updated_at': reported_at.isoformat()
+        }
+    }), 202
+
+
+@buses_bp.route('/locations', methods=['POST'])
+@jwt_required()
+@rate_limit('location_frames')
+def ingest_location_frame():
+    """Binary location ingestion for trackers (see app/utils/tracker_frames.py)."""
+    if not require_operator_or_admin():
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    if request.mimetype != FRAME_CONTENT_TYPE:
+        return jsonify({'error': f'Content-Type must be {FRAME_CONTENT_TYPE}'}), 415
+
+    try:
+        fixes = decode_frame(request.get_data(cache=False))
+    except FrameError as e:
+        return jsonify({'error': str(e)}), 400
+
+    unknown = {fix.bus_id for fix in fixes} - location_buffer.known_buses
+    if unknown:
+        location_buffer.known_buses.update(
+            bus_id for (bus_id,) in db.session.query(Bus.id).filter(Bus.id.in_(unknown))
+        )
+
+    # Tracker clocks may run ahead; never store a fix from the future
+    now = datetime.utcnow()
+    accepted = [
+        (fix.bus_id, fix.latitude, fix.longitude, min(datetime.utcfromtimestamp(fix.timestamp), now),
+         fix.speed, fix.heading)
+        for fix in fixes
+        if fix.bus_id in location_buffer.known_buses
+    ]
+    if accepted:
+        location_buffer.submit_many(accepted)
+
+    return Response(encode_ack(len(accepted), len(fixes) - len(accepted)),
+                    status=202, mimetype=FRAME_CONTENT_TYPE)
+
+
+@buses_bp.route('/<int:bus_id>/location/poll', methods=['GET'])
+@jwt_required()
+def poll_bus_location(bus_id):
+    """Long-poll until the bus reports a location newer than `since`."""
+    max_timeout = current_app.config['LONG_POLL_TIMEOUT']
+    timeout = min(request.args.get('timeout', max_timeout, type=int), max_timeout)
+    recheck = current_app.config['LONG_POLL_RECHECK_SECONDS']
+
+    since = None
+    if request.args.get('since'):
+        try:
+            since = parse_utc(request.args['since'])
+        except ValueError:
+            return jsonify({'error': 'since must be an ISO timestamp'}), 400
+
+    deadline = time.monotonic() + timeout
+    while True:
+        version = bus_locations.version(bus_id)
+        bus = Bus.query.get(bus_id)
+        if not bus:
+            return jsonify({'error': 'Bus not found'}), 404
+
+        if since is None or (bus.last_location_update and bus.last_location_update > since):
+            return jsonify({'changed': True, 'bus': bus.to_dict()}), 200
+
+        # Hand the connection back to the pool while we wait
+        db.session.remove()
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return jsonify({'changed': False, 'bus_id': bus_id}), 200
+        bus_locations.wait(bus_id, version, min(recheck, remaining))
+
+
+@buses_bp.route('/<int:bus_id>/history', methods=['GET'])
+@jwt_required()
+def get_bus_history(bus_id):
+    """Downsampled track of a bus over ?start=&end= with its boardings."""
+    if not require_operator_or_admin():
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    bus = Bus.query.get(bus_id)
+    if not bus:
+        return jsonify({'error': 'Bus not found'}), 404
+
+    config = current_app.config
+    try:
+        start, end = parse_window(request.args, config['LOCATION_HISTORY_MAX_DAYS'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    boardings = window_boardings(start, end, bus_id=bus_id)
+    tolerance = request.args.get('tolerance', config['LOCATION_HISTORY_TOLERANCE_M'], type=float)
+    return jsonify(replay(bus_id, start, end, boardings, tolerance, config['LOCATION_HISTORY_MAX_POINTS'])), 200
 
 
 @buses_bp.route('/<int:bus_id>', methods=['DELETE'])
@@ -146,6 +268,7 @@ def delete_bus(bus_id):
         return jsonify({'error': 'Bus not found'}), 404
 
     # Soft delete - set to inactive
+    bus_status_changed(bus.status, 'inactive')
     bus.status = 'inactive'
     db.session.commit()
 
@@ -0,0 +1,29 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models import User
+from app.utils.dashboard import operator_summary, parent_home
+
+dashboard_bp = Blueprint('dashboard', __name__)
+
+
+@dashboard_bp.route('/parent', methods=['GET'])
+@jwt_required()
+def get_parent_home():
+    """Children, their routes and live buses, boarding state and unread count in one call."""
+    current_user_id = int(get_jwt_identity())
+    current_user = User.query.get(current_user_id)
+    if not current_user or current_user.role != 'parent':
+        return jsonify({'error': 'Only parents have a home screen'}), 403
+
+    return jsonify(parent_home(current_user_id)), 200
+
+
+@dashboard_bp.route('/operator', methods=['GET'])
+@jwt_required()
+def get_operator_summary():
+    """Fleet dashboard from precomputed counters (one read)."""
+    current_user = User.query.get(int(get_jwt_identity()))
+    if not current_user or current_user.role not in ['admin', 'operator']:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    return jsonify(operator_summary(current_user)), 200
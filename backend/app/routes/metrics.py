@@ -0,0 +1,47 @@
+import hmac
+from flask import Blueprint, Response, current_app, request, jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from app import db, instrumentation
+from app.models import User
+from app.utils.db_pool import pool_stats
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def metrics_authorized():
+    """Metrics are available to admins, or to scrapers holding METRICS_TOKEN."""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and hmac.compare_digest(request.headers.get('X-Metrics-Token', ''), token):
+        return True
+
+    verify_jwt_in_request(optional=True)
+    current_user_id = get_jwt_identity()
+    if not current_user_id:
+        return False
+    user = User.query.get(int(current_user_id))
+    return user and user.role == 'admin'
+
+
+@metrics_bp.route('/', methods=['GET'])
+def get_metrics():
+    """Request, SQL and pool metrics in Prometheus text format."""
+    if not metrics_authorized():
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    return Response(
+        instrumentation.render_prometheus(),
+        mimetype='text/plain; version=0.0.4'
+    )
+
+
+@metrics_bp.route('/db', methods=['GET'])
+def get_db_metrics():
+    """Connection pool usage, checkout waits and slow-query counts per engine."""
+    if not metrics_authorized():
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    engines = {
+        (key or 'primary'): pool_stats(engine)
+        for key, engine in db.engines.items()
+    }
+    return jsonify({'engines': engines}), 200
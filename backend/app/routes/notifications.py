@@ -1,7 +1,12 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models import Notification, User
+from app.utils.counters import unread_changed
+from app.utils.broadcasts import create_broadcast, delete_broadcast_for, get_addressed, mark_broadcast_read
+from app.utils.inbox import inbox, mark_all_read, notification_is_read, watermark_for
+from app.utils.notifications import notify_many
+from app.utils.rate_limit import rate_limit
 
 notifications_bp = Blueprint('notifications', __name__)
 
@@ -22,24 +27,16 @@ def get_notifications():
     notification_type = request.args.get('type')
     limit = request.args.get('limit', 50, type=int)
 
-    query = Notification.query.filter_by(recipient_id=current_user_id)
-
-    if unread_only:
-        query = query.filter_by(is_read=False)
-
-    if notification_type:
-        query = query.filter_by(notification_type=notification_type)
-
-    notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
-
-    # Count unread
-    unread_count = Notification.query.filter_by(
-        recipient_id=current_user_id,
-        is_read=False
-    ).count()
+    # Own notifications merged with broadcasts, read state from flags and watermark
+    notifications, unread_count = inbox(
+        current_user_id,
+        unread_only=unread_only,
+        notification_type=notification_type,
+        limit=limit
+    )
 
     return jsonify({
-        'notifications': [n.to_dict() for n in notifications],
+        'notifications': notifications,
         'unread_count': unread_count
     }), 200
 
@@ -57,7 +54,7 @@ def get_notification(notification_id):
     if notification.recipient_id != current_user_id:
         return jsonify({'error': 'Unauthorized'}), 403
 
-    return jsonify({'notification': notification.to_dict()}), 200
+    return jsonify({'notification': notification.to_dict(watermark_for(current_user_id))}), 200
 
 
 @notifications_bp.route('/', methods=['POST'])
@@ -85,6 +82,7 @@ def create_notification():
         related_student_id=data.get('related_student_id')
     )
 
+    unread_changed({notification.recipient_id: 1})
     db.session.add(notification)
     db.session.commit()
 
@@ -98,6 +96,7 @@ def create_notification():
 
 @notifications_bp.route('/broadcast', methods=['POST'])
 @jwt_required()
+@rate_limit('broadcast')
 def broadcast_notification():
     if not require_operator_or_admin():
         return jsonify({'error': 'Unauthorized'}), 403
@@ -124,28 +123,34 @@ def broadcast_notification():
         ).distinct()
         recipients_query = recipients_query.filter(User.id.in_(parent_ids))
 
-    recipients = recipients_query.all()
-
-    notifications_created = []
-    for recipient in recipients:
-        notification = Notification(
+    recipient_ids = [user_id for (user_id,) in recipients_query.with_entities(User.id)]
+
+    fields = {
+        'notification_type': data.get('notification_type', 'general'),
+        'priority': data.get('priority', 'normal'),
+        'delivery_method': data.get('delivery_method', 'in_app'),
+        'related_route_id': data.get('route_id')
+    }
+
+    # Large audiences are stored once with a snapshot of the recipient ids
+    broadcast = None
+    if len(recipient_ids) >= current_app.config['BROADCAST_SHARED_MIN_RECIPIENTS']:
+        broadcast = create_broadcast(recipient_ids, current_user_id, data['title'], data['message'], **fields)
+        recipient_count = broadcast.recipient_count
+    else:
+        recipient_count = notify_many(
+            recipient_ids,
             sender_id=current_user_id,
-            recipient_id=recipient.id,
             title=data['title'],
             message=data['message'],
-            notification_type=data.get('notification_type', 'general'),
-            priority=data.get('priority', 'normal'),
-            delivery_method=data.get('delivery_method', 'in_app'),
-            related_route_id=data.get('route_id')
+            **fields
         )
-        db.session.add(notification)
-        notifications_created.append(notification)
-
     db.session.commit()
 
     return jsonify({
-        'message': f'Notification sent to {len(notifications_created)} recipients',
-        'recipient_count': len(notifications_created)
+        'message': f'Notification sent to {recipient_count} recipients',
+        'recipient_count': recipient_count,
+        'broadcast_id': broadcast.id if broadcast else None
     }), 201
 
 
@@ -161,6 +166,8 @@ def mark_as_read(notification_id):
     if notification.recipient_id != current_user_id:
         return jsonify({'error': 'Unauthorized'}), 403
 
+    if not notification_is_read(notification, watermark_for(current_user_id)):
+        unread_changed({current_user_id: -1})
     notification.mark_as_read()
     db.session.commit()
 
@@ -175,11 +182,8 @@ def mark_as_read(notification_id):
 def mark_all_as_read():
     current_user_id = int(get_jwt_identity())
 
-    Notification.query.filter_by(
-        recipient_id=current_user_id,
-        is_read=False
-    ).update({'is_read': True})
-
+    # A single-row watermark write, however large the unread backlog
+    mark_all_read(current_user_id)
     db.session.commit()
 
     return jsonify({'message': 'All notifications marked as read'}), 200
@@ -197,7 +201,59 @@ def delete_notification(notification_id):
     if notification.recipient_id != current_user_id:
         return jsonify({'error': 'Unauthorized'}), 403
 
+    if not notification_is_read(notification, watermark_for(current_user_id)):
+        unread_changed({current_user_id: -1})
     db.session.delete(notification)
     db.session.commit()
 
     return jsonify({'message': 'Notification deleted'}), 200
+
+
+# Broadcast copies are addressed as b<broadcast id> in the inbox, so clients
+# can use the same /notifications/<id> paths for both kinds.
+
+@notifications_bp.route('/b<int:broadcast_id>', methods=['GET'])
+@jwt_required()
+def get_broadcast(broadcast_id):
+    current_user_id = int(get_jwt_identity())
+
+    broadcast, receipt = get_addressed(broadcast_id, current_user_id)
+    if not broadcast:
+        return jsonify({'error': 'Notification not found'}), 404
+
+    return jsonify({
+        'notification': broadcast.to_notification_dict(current_user_id, receipt, watermark_for(current_user_id))
+    }), 200
+
+
+@notifications_bp.route('/b<int:broadcast_id>/read', methods=['PUT'])
+@jwt_required()
+def mark_broadcast_as_read(broadcast_id):
+    current_user_id = int(get_jwt_identity())
+
+    broadcast, receipt = get_addressed(broadcast_id, current_user_id)
+    if not broadcast:
+        return jsonify({'error': 'Notification not found'}), 404
+
+    receipt = mark_broadcast_read(broadcast_id, current_user_id, receipt)
+    db.session.commit()
+
+    return jsonify({
+        'message': 'Notification marked as read',
+        'notification': broadcast.to_notification_dict(current_user_id, receipt, watermark_for(current_user_id))
+    }), 200
+
+
+@notifications_bp.route('/b<int:broadcast_id>', methods=['DELETE'])
+@jwt_required()
+def delete_broadcast(broadcast_id):
+    current_user_id = int(get_jwt_identity())
+
+    broadcast, receipt = get_addressed(broadcast_id, current_user_id)
+    if not broadcast:
+        return jsonify({'error': 'Notification not found'}), 404
+
+    delete_broadcast_for(broadcast_id, current_user_id, receipt)
+    db.session.commit()
+
+    return jsonify({'message': 'Notification deleted'}), 200
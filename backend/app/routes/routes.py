@@ -1,8 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 from app import db
 from app.models import Route, User
+from app.utils.conflicts import assignment_conflicts, fleet_conflicts
+from app.utils.schedule import refresh_route_trips
+from app.utils.track import parse_window, replay, route_spans, window_boardings
 
 routes_bp = Blueprint('routes', __name__)
 
@@ -39,6 +42,18 @@ def get_routes():
     return jsonify({'routes': [route.to_dict() for route in routes]}), 200
 
 
+@routes_bp.route('/conflicts', methods=['GET'])
+@jwt_required()
+def get_route_conflicts():
+    """Fleet-wide report of active routes double-booking a bus."""
+    if not require_operator_or_admin():
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    current_user = User.query.get(int(get_jwt_identity()))
+    operator_id = current_user.id if current_user.role == 'operator' else None
+    return jsonify({'conflicts': fleet_conflicts(operator_id)}), 200
+
+
 @routes_bp.route('/<int:route_id>', methods=['GET'])
 @jwt_required()
 def get_route(route_id):
@@ -90,8 +105,15 @@ def create_route():
         except ValueError:
             pass
 
+    if route.status == 'active':
+        conflicts = assignment_conflicts(route.bus_id, route.days_mask,
+                                         route.scheduled_start_time, route.scheduled_end_time)
+        if conflicts:
+            return jsonify({'error': 'Bus is already booked during this schedule', 'conflicts': conflicts}), 409
+
     db.session.add(route)
     db.session.commit()
+    refresh_route_trips(route.id)
 
     return jsonify({
         'message': 'Route created successfully',
@@ -148,7 +170,16 @@ def update_route(route_id):
         except ValueError:
             pass
 
+    schedule_fields = {'bus_id', 'days_of_week', 'scheduled_start_time', 'scheduled_end_time', 'status'}
+    if route.status == 'active' and schedule_fields & data.keys():
+        conflicts = assignment_conflicts(route.bus_id, route.days_mask, route.scheduled_start_time,
+                                         route.scheduled_end_time, route_id=route.id)
+        if conflicts:
+            db.session.rollback()
+            return jsonify({'error': 'Bus is already booked during this schedule', 'conflicts': conflicts}), 409
+
     db.session.commit()
+    refresh_route_trips(route.id)
 
     return jsonify({
         'message': 'Route updated successfully',
@@ -169,10 +200,42 @@ def delete_route(route_id):
     # Soft delete
     route.status = 'inactive'
     db.session.commit()
+    refresh_route_trips(route.id)
 
     return jsonify({'message': 'Route deactivated successfully'}), 200
 
 
+@routes_bp.route('/<int:route_id>/history', methods=['GET'])
+@jwt_required()
+def get_route_history(route_id):
+    """Track of the route's bus over ?start=&end= with this route's boardings."""
+    if not require_operator_or_admin():
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    route = Route.query.get(route_id)
+    if not route:
+        return jsonify({'error': 'Route not found'}), 404
+
+    config = current_app.config
+    try:
+        start, end = parse_window(request.args, config['LOCATION_HISTORY_MAX_DAYS'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The buses that ran the route's trips in the window, not its current bus
+    spans = route_spans(route, start, end)
+    if not spans:
+        return jsonify({'error': 'Route has no bus assigned'}), 400
+    bus_ids = {bus_id for bus_id, _, _ in spans}
+
+    boardings = window_boardings(start, end, route_id=route_id)
+    tolerance = request.args.get('tolerance', config['LOCATION_HISTORY_TOLERANCE_M'], type=float)
+    result = replay(bus_ids.pop() if len(bus_ids) == 1 else None, start, end, boardings, tolerance,
+                    config['LOCATION_HISTORY_MAX_POINTS'], spans)
+    result['route_id'] = route_id
+    return jsonify(result), 200
+
+
 @routes_bp.route('/<int:route_id>/students', methods=['GET'])
 @jwt_required()
 def get_route_students(route_id):
@@ -2,7 +2,10 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 from app import db
-from app.models import Student, User, Boarding
+from app.models import Attendance, Student, User, Boarding
+from app.utils.boarding_archive import archived_boardings, archived_row_to_dict
+from app.utils.counters import boarding_recorded
+from app.utils.rate_limit import rate_limit
 
 students_bp = Blueprint('students', __name__)
 
@@ -197,6 +200,7 @@ def get_student_by_card(card_id):
 
 @students_bp.route('/<int:student_id>/checkin', methods=['POST'])
 @jwt_required()
+@rate_limit('checkin')
 def checkin_student(student_id):
     if not require_operator_or_admin():
         return jsonify({'error': 'Unauthorized'}), 403
@@ -225,6 +229,7 @@ def checkin_student(student_id):
     )
 
     db.session.add(boarding)
+    boarding_recorded(boarding.bus_id, boarding.boarding_type)
     db.session.commit()
 
     return jsonify({
@@ -247,10 +252,79 @@ def get_student_boardings(student_id):
     if current_user.role == 'parent' and student.parent_id != current_user_id:
         return jsonify({'error': 'Unauthorized'}), 403
 
-    # Get recent boardings (last 30 days by default)
-    boardings = student.boardings.order_by(Boarding.boarding_time.desc()).limit(50).all()
+    # Optional date window (YYYY-MM-DD, end exclusive)
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD'}), 400
+    limit = request.args.get('limit', 50, type=int)
+
+    query = student.boardings
+    if start:
+        query = query.filter(Boarding.boarding_time >= start)
+    if end:
+        query = query.filter(Boarding.boarding_time < end)
+
+    boardings = [
+        boarding.to_dict()
+        for boarding in query.order_by(Boarding.boarding_time.desc()).limit(limit).all()
+    ]
+
+    # Older months live in the boarding archive; top up from there
+    if len(boardings) < limit:
+        archived = archived_boardings(
+            student_id=student_id,
+            start=start,
+            end=end,
+            limit=limit - len(boardings),
+            exclude_ids={boarding['id'] for boarding in boardings}
+        )
+        boardings.extend(archived_row_to_dict(row, student) for row in archived)
 
     return jsonify({
         'student_id': student_id,
-        'boardings': [boarding.to_dict() for boarding in boardings]
+        'boardings': boardings
+    }), 200
+
+
+@students_bp.route('/<int:student_id>/attendance', methods=['GET'])
+@jwt_required()
+def get_student_attendance(student_id):
+    current_user_id = int(get_jwt_identity())
+    current_user = User.query.get(current_user_id)
+
+    student = Student.query.get(student_id)
+    if not student:
+        return jsonify({'error': 'Student not found'}), 404
+
+    # Parents can only view their own children's attendance
+    if current_user.role == 'parent' and student.parent_id != current_user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    # Optional service date window (YYYY-MM-DD, end exclusive)
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD'}), 400
+    limit = request.args.get('limit', 50, type=int)
+
+    query = Attendance.query.filter_by(student_id=student_id)
+    if start:
+        query = query.filter(Attendance.service_date >= start)
+    if end:
+        query = query.filter(Attendance.service_date < end)
+    if request.args.get('status'):
+        query = query.filter(Attendance.status == request.args['status'])
+
+    records = (
+        query.options(db.joinedload(Attendance.boarding))
+        .order_by(Attendance.service_date.desc(), Attendance.id.desc())
+        .limit(limit)
+        .all()
+    )
+    return jsonify({
+        'student_id': student_id,
+        'attendance': [record.to_dict() for record in records]
     }), 200
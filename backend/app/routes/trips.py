@@ -0,0 +1,82 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import date
+from app import db
+from app.models import Attendance, Trip, User
+from app.utils.schedule import active_trips, parse_utc, todays_trips
+
+trips_bp = Blueprint('trips', __name__)
+
+
+def trips_operator_filter():
+    """Operators see their own trips; admins see all. None means forbidden."""
+    current_user_id = int(get_jwt_identity())
+    user = User.query.get(current_user_id)
+    if not user or user.role not in ['admin', 'operator']:
+        return None
+    return {'operator_id': current_user_id if user.role == 'operator' else None}
+
+
+@trips_bp.route('/today', methods=['GET'])
+@jwt_required()
+def get_todays_trips():
+    scope = trips_operator_filter()
+    if scope is None:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    service_date = None
+    if request.args.get('date'):
+        try:
+            service_date = date.fromisoformat(request.args['date'])
+        except ValueError:
+            return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+
+    trips = todays_trips(service_date=service_date, **scope)
+    return jsonify({'trips': [trip.to_dict() for trip in trips]}), 200
+
+
+@trips_bp.route('/active', methods=['GET'])
+@jwt_required()
+def get_active_trips():
+    scope = trips_operator_filter()
+    if scope is None:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    at = None
+    if request.args.get('at'):
+        try:
+            at = parse_utc(request.args['at'])
+        except ValueError:
+            return jsonify({'error': 'at must be an ISO timestamp'}), 400
+
+    trips = active_trips(at=at, **scope)
+    return jsonify({'trips': [trip.to_dict() for trip in trips]}), 200
+
+
+@trips_bp.route('/<int:trip_id>/attendance', methods=['GET'])
+@jwt_required()
+def get_trip_attendance(trip_id):
+    scope = trips_operator_filter()
+    if scope is None:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    trip = Trip.query.get(trip_id)
+    if not trip:
+        return jsonify({'error': 'Trip not found'}), 404
+    if scope['operator_id'] is not None and trip.operator_id != scope['operator_id']:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    records = (
+        trip.attendance
+        .options(db.joinedload(Attendance.student), db.joinedload(Attendance.boarding))
+        .order_by(Attendance.status, Attendance.student_id)
+        .all()
+    )
+    counts = {}
+    for record in records:
+        counts[record.status] = counts.get(record.status, 0) + 1
+    return jsonify({
+        'trip': trip.to_dict(),
+        'counts': counts,
+        'attendance': [record.to_dict() for record in records]
+    }), 200
@@ -0,0 +1,161 @@
+# Attendance reconciliation and missed-pickup alerts
+#
+# A trip's expected riders are the active students assigned to its route.
+# Once a trip has been over for ATTENDANCE_GRACE_MINUTES, reconcile_trips()
+# settles every such trip in one batched pass, in a fixed number of queries:
+#
+#   1. one claiming UPDATE ... RETURNING (reconciled_at IS NULL), so a trip is
+#      reconciled once even with several workers running
+#   2. one INSERT ... SELECT per trip window, sent as a single executemany:
+#      active students on the route LEFT JOIN their pickups in the window, so
+#      students without a matching boarding (the anti-join) become `missed`
+#   3. one query for the missed riders and their parents, and a bulk insert of
+#      one alert per missed child (held briefly so siblings who missed the
+#      same trip reach their parent as one digest, see app/utils/digests.py)
+#
+# The boarding window is [scheduled_start - ATTENDANCE_EARLY_MINUTES,
+# scheduled_end + ATTENDANCE_GRACE_MINUTES). A trip with no pickups at all
+# most likely wasn't scanned, not missed by everyone, so its riders are
+# recorded as `unrecorded` and no alerts go out.
+import logging
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, case, exists, func, literal, select, update
+
+from app import db
+from app.models import Attendance, Boarding, Route, Student, Trip
+from app.utils.digests import queue_notifications
+
+logger = logging.getLogger(__name__)
+
+
+def _claim_due(now, config):
+    """Claim ended, unreconciled trips; returns their (id, route_id, service_date, start, end)."""
+    table = Trip.__table__
+    grace = timedelta(minutes=config['ATTENDANCE_GRACE_MINUTES'])
+    oldest = now - timedelta(hours=config['ATTENDANCE_LOOKBACK_HOURS'])
+    result = db.session.execute(
+        update(table)
+        .where(
+            table.c.reconciled_at.is_(None),
+            table.c.status != 'cancelled',
+            table.c.scheduled_end <= now - grace,
+            table.c.scheduled_end > oldest
+        )
+        .values(reconciled_at=now)
+        .returning(table.c.id, table.c.route_id, table.c.service_date,
+                   table.c.scheduled_start, table.c.scheduled_end)
+    )
+    return result.all()
+
+
+def _attendance_insert(now):
+    """INSERT ... SELECT of one trip's expected riders, parameterized by trip window."""
+    students, boardings = Student.__table__, Boarding.__table__
+    route_id = bindparam('a_route_id')
+    window_start, window_end = bindparam('a_start'), bindparam('a_end')
+    in_window = and_(
+        boardings.c.route_id == route_id,
+        boardings.c.boarding_type == 'pickup',
+        boardings.c.boarding_time >= window_start,
+        boardings.c.boarding_time < window_end
+    )
+    scanned = exists().where(in_window)
+    boarding_id = func.min(boardings.c.id)
+
+    riders = (
+        select(
+            bindparam('a_trip_id'),
+            students.c.id,
+            route_id,
+            bindparam('a_service_date'),
+            case(
+                (boarding_id.isnot(None), 'present'),
+                (scanned, 'missed'),
+                else_='unrecorded'
+            ),
+            boarding_id,
+            literal(now)
+        )
+        .select_from(
+            students.outerjoin(boardings, and_(boardings.c.student_id == students.c.id, in_window))
+        )
+        .where(students.c.route_id == route_id, students.c.is_active.is_(True))
+        .group_by(students.c.id)
+    )
+    columns = ['trip_id', 'student_id', 'route_id', 'service_date', 'status', 'boarding_id', 'created_at']
+    return Attendance.__table__.insert().from_select(columns, riders)
+
+
+def _missed_alerts(trip_ids):
+    """One notification row per missed rider on the given trips."""
+    rows = (
+        db.session.query(Attendance.student_id, Attendance.route_id, Student.first_name,
+                         Student.parent_id, Route.name, Route.operator_id, Route.is_morning_route)
+        .join(Student, Student.id == Attendance.student_id)
+        .join(Route, Route.id == Attendance.route_id)
+        .filter(Attendance.trip_id.in_(trip_ids), Attendance.status == 'missed')
+        .all()
+    )
+    alerts = []
+    for student_id, route_id, first_name, parent_id, route_name, operator_id, is_morning in rows:
+        if is_morning:
+            message = f'{first_name} was expected on {route_name} this morning but was not checked in.'
+        else:
+            message = f'{first_name} was expected on {route_name} this afternoon but was not checked onto the bus.'
+        alerts.append({
+            'recipient_id': parent_id,
+            'sender_id': operator_id,
+            'title': f'{first_name} missed the bus',
+            'message': message,
+            'notification_type': 'boarding',
+            'priority': 'high',
+            'related_route_id': route_id,
+            'related_student_id': student_id
+        })
+    return alerts
+
+
+def reconcile_trips(now=None):
+    """Write attendance for every trip that has ended. Returns a summary dict."""
+    started = time.perf_counter()
+    config = current_app.config
+    now = now or datetime.utcnow()
+
+    trips = _claim_due(now, config)
+    counts = {'present': 0, 'missed': 0, 'unrecorded': 0}
+    sent = 0
+    if trips:
+        early = timedelta(minutes=config['ATTENDANCE_EARLY_MINUTES'])
+        grace = timedelta(minutes=config['ATTENDANCE_GRACE_MINUTES'])
+        db.session.execute(_attendance_insert(now), [
+            {
+                'a_trip_id': trip_id,
+                'a_route_id': route_id,
+                'a_service_date': service_date,
+                'a_start': start - early,
+                'a_end': end + grace
+            }
+            for trip_id, route_id, service_date, start, end in trips
+        ])
+        trip_ids = [trip[0] for trip in trips]
+        for status, count in (
+            db.session.query(Attendance.status, func.count())
+            .filter(Attendance.trip_id.in_(trip_ids))
+            .group_by(Attendance.status)
+        ):
+            counts[status] = count
+        sent = queue_notifications(_missed_alerts(trip_ids), now)
+    db.session.commit()
+
+    summary = {
+        'trips': len(trips),
+        **counts,
+        'notifications': sent,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+    if trips:
+        logger.info('Attendance reconciliation: %s', summary)
+    return summary
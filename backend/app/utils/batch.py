@@ -0,0 +1,176 @@
+# Batched API calls (POST /api/batch)
+#
+# A batch is a list of sub-requests against the existing blueprints, run
+# in-process and returned in one response, so a screen that needs five
+# resources costs one round trip on a slow link.
+#
+# Sub-requests run in order inside the batch's app context, so they share its
+# database session: the user row loaded by the first sub-request is served
+# from the identity map afterwards. Each one still goes through the normal
+# request hooks (JWT verification with the batch's own Authorization header,
+# rate limits, replica routing, metrics), so nothing is reachable through a
+# batch that isn't reachable directly. The batch's flask.g is restored after
+# every sub-request so their hooks don't clobber each other.
+#
+# Consecutive GETs form a read phase. Without writes between them their order
+# doesn't matter, so a phase runs on up to BATCH_READ_CONCURRENCY threads,
+# each with its own app context and session (a session can't be shared across
+# threads). Phases run one after another, so a read after a write sees it.
+# Reads fall back to running in order under load (when telemetry would be shed)
+# and on in-memory SQLite, where every connection is a separate database.
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from flask import current_app, g
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.test import EnvironBuilder
+
+from app.utils.db_routing import READ_AFTER_HEADER
+
+METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+FORWARDED_HEADERS = ('Authorization', READ_AFTER_HEADER, 'User-Agent')
+RETURNED_HEADERS = ('Retry-After', READ_AFTER_HEADER, 'Location')
+# Long-polls would hold the whole batch; binary frames have no JSON form
+EXCLUDED_ENDPOINTS = ('batch.run_batch_requests', 'buses.poll_bus_location', 'buses.ingest_location_frame')
+
+
+def parse_batch(payload, max_requests):
+    """Validate a batch body; returns [{id, method, path, query, body}]. Raises ValueError."""
+    items = payload.get('requests') if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError('requests must be a non-empty list')
+    if len(items) > max_requests:
+        raise ValueError(f'A batch is limited to {max_requests} requests')
+
+    adapter = current_app.url_map.bind('')
+    subrequests = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise ValueError(f'requests[{index}] needs a path')
+        method = str(item.get('method', 'GET')).upper()
+        if method not in METHODS:
+            raise ValueError(f'requests[{index}]: method must be one of {", ".join(METHODS)}')
+        url = urlsplit(item['path'])
+        if not url.path.startswith('/api/'):
+            raise ValueError(f'requests[{index}]: path must start with /api/')
+        try:
+            endpoint, _ = adapter.match(url.path, method)
+        except (NotFound, MethodNotAllowed):
+            endpoint = None  # dispatched anyway so the sub-response carries the 404/405
+        if endpoint in EXCLUDED_ENDPOINTS:
+            raise ValueError(f'requests[{index}]: {url.path} cannot be batched')
+        subrequests.append({
+            'id': item.get('id', index),
+            'method': method,
+            'path': url.path,
+            'query': url.query,
+            'body': item.get('body')
+        })
+    return subrequests
+
+
+def phases(subrequests):
+    """Split into runs of consecutive reads and single writes, in order."""
+    current = []
+    for sub in subrequests:
+        if sub['method'] == 'GET':
+            current.append(sub)
+            continue
+        if current:
+            yield current
+            current = []
+        yield [sub]
+    if current:
+        yield current
+
+
+@contextmanager
+def _isolated_globals():
+    saved = dict(g.__dict__)
+    try:
+        yield
+    finally:
+        g.__dict__.clear()
+        g.__dict__.update(saved)
+
+
+def _environ(sub, headers, remote_addr):
+    builder = EnvironBuilder(
+        path=sub['path'],
+        method=sub['method'],
+        query_string=sub['query'],
+        headers=headers,
+        json=sub['body'] if sub['body'] is not None and sub['method'] != 'GET' else None,
+        environ_base={'REMOTE_ADDR': remote_addr}
+    )
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def _result(sub, response):
+    body = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+    return {
+        'id': sub['id'],
+        'status': response.status_code,
+        'headers': {name: response.headers[name] for name in RETURNED_HEADERS if name in response.headers},
+        'body': body
+    }
+
+
+def dispatch(app, sub, headers, remote_addr):
+    """Run one sub-request through the full request cycle in the current app context."""
+    from app import db
+    with _isolated_globals():
+        ctx = app.request_context(_environ(sub, headers, remote_addr))
+        ctx.push()
+        error = None
+        try:
+            response = app.full_dispatch_request()
+        except Exception as exc:
+            error = exc
+            app.logger.exception('Batched %s %s failed', sub['method'], sub['path'])
+            response = app.response_class('{"error": "Internal server error"}', status=500,
+                                          mimetype='application/json')
+        finally:
+            ctx.pop(error)
+    if error is not None or response.status_code >= 400:
+        # Don't let a failed write leave the shared session mid-transaction
+        db.session.rollback()
+    return _result(sub, response)
+
+
+def _dispatch_in_own_context(app, sub, headers, remote_addr):
+    with app.app_context():
+        return dispatch(app, sub, headers, remote_addr)
+
+
+def _read_concurrency(phase):
+    from app import db, rate_limiter
+    limit = current_app.config['BATCH_READ_CONCURRENCY']
+    if len(phase) < 2 or limit < 2:
+        return 1
+    url = db.engine.url
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return 1
+    if rate_limiter.should_shed('telemetry'):
+        return 1
+    return min(limit, len(phase))
+
+
+def run_batch(subrequests, headers, remote_addr):
+    """Run sub-requests; returns their results in request order."""
+    app = current_app._get_current_object()
+    results = []
+    for phase in phases(subrequests):
+        workers = _read_concurrency(phase)
+        if workers == 1:
+            results.extend(dispatch(app, sub, headers, remote_addr) for sub in phase)
+            continue
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch') as pool:
+            results.extend(pool.map(
+                lambda sub: _dispatch_in_own_context(app, sub, headers, remote_addr), phase
+            ))
+    return results
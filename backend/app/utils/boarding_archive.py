@@ -0,0 +1,427 @@
+# Tiered storage for boarding history
+#
+# Closed months of `boardings` rows are rolled into compressed columnar files
+# on local disk so the hot table only holds the current term. Each month is a
+# single file; every column is stored as its own zlib-compressed block so a
+# query only inflates the columns it needs. A JSON manifest lists the archived
+# months and is the only thing readers consult to decide whether a time
+# window touches cold storage.
+#
+# A month is published (segment written, manifest updated) before its rows
+# are deleted, so its rows are always in at least one of the two. If the
+# delete fails, the previous manifest entry is put back and the new segment
+# removed. Between publishing and the commit a month is briefly in both, so
+# readers that merge the archive into hot rows skip ids they already have.
+import json
+import os
+import struct
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.models import Boarding
+
+MAGIC = b'KBAR'
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+# Null markers for the fixed-width columns
+NULL_INT = -1
+NULL_TIME = -(2 ** 63)
+
+# (column name, type code). i = int64, f = float64, t = timestamp, s = string
+COLUMNS = [
+    ('id', 'i'),
+    ('student_id', 'i'),
+    ('bus_id', 'i'),
+    ('route_id', 'i'),
+    ('boarding_type', 's'),
+    ('boarding_time', 't'),
+    ('latitude', 'f'),
+    ('longitude', 'f'),
+    ('verified_by_id', 'i'),
+    ('verification_method', 's'),
+    ('notes', 's'),
+    ('created_at', 't'),
+]
+COLUMN_TYPES = dict(COLUMNS)
+
+EPOCH = datetime(1970, 1, 1)
+SEGMENT_CACHE_SIZE = 64  # segments whose decoded columns stay in memory per worker
+
+_cache_lock = threading.Lock()
+_column_cache = OrderedDict()  # path -> (mtime, {column: values}), least recently used first
+
+
+def archive_dir():
+    return current_app.config['BOARDING_ARCHIVE_DIR']
+
+
+def month_bounds(year, month):
+    start = datetime(year, month, 1)
+    if month == 12:
+        end = datetime(year + 1, 1, 1)
+    else:
+        end = datetime(year, month + 1, 1)
+    return start, end
+
+
+def _month_key(year, month):
+    return f'{year:04d}-{month:02d}'
+
+
+def _to_micros(value):
+    if value is None:
+        return NULL_TIME
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _from_micros(value):
+    if value == NULL_TIME:
+        return None
+    return EPOCH + timedelta(microseconds=value)
+
+
+# --- Column encoding -------------------------------------------------------
+
+def _encode_column(type_code, values):
+    if type_code == 'i':
+        return array('q', [NULL_INT if v is None else v for v in values]).tobytes()
+    if type_code == 'f':
+        return array('d', [float('nan') if v is None else v for v in values]).tobytes()
+    if type_code == 't':
+        return array('q', [_to_micros(v) for v in values]).tobytes()
+
+    # Strings are dictionary encoded: a JSON list of distinct values followed
+    # by one uint32 index per row (0 means NULL).
+    dictionary = {}
+    indexes = array('I')
+    for v in values:
+        if v is None:
+            indexes.append(0)
+            continue
+        if v not in dictionary:
+            dictionary[v] = len(dictionary) + 1
+        indexes.append(dictionary[v])
+    header = json.dumps(list(dictionary)).encode('utf-8')
+    return struct.pack('<I', len(header)) + header + indexes.tobytes()
+
+
+def _decode_column(type_code, raw):
+    if type_code == 's':
+        (header_len,) = struct.unpack_from('<I', raw)
+        dictionary = [None] + json.loads(raw[4:4 + header_len].decode('utf-8'))
+        indexes = array('I')
+        indexes.frombytes(raw[4 + header_len:])
+        return [dictionary[i] for i in indexes]
+
+    values = array('d' if type_code == 'f' else 'q')
+    values.frombytes(raw)
+    if type_code == 'i':
+        return [None if v == NULL_INT else v for v in values]
+    if type_code == 'f':
+        return [None if v != v else v for v in values]
+    return [_from_micros(v) for v in values]
+
+
+def write_segment(path, rows):
+    """Write boarding rows (dicts keyed by column name) to a columnar file."""
+    blocks = []
+    for name, type_code in COLUMNS:
+        data = zlib.compress(_encode_column(type_code, [row[name] for row in rows]), 9)
+        blocks.append((name.encode('utf-8'), type_code.encode('ascii'), data))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(MAGIC)
+        fh.write(struct.pack('<HIH', FORMAT_VERSION, len(rows), len(blocks)))
+        # Column directory first so readers can seek straight to a column
+        offset = 0
+        for name, type_code, data in blocks:
+            fh.write(struct.pack('<B', len(name)) + name + type_code)
+            fh.write(struct.pack('<QQ', offset, len(data)))
+            offset += len(data)
+        for _, _, data in blocks:
+            fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_segment(path, columns=None):
+    """Read the requested columns of a segment file. Returns {name: [values]}."""
+    wanted = set(columns or COLUMN_TYPES)
+    with open(path, 'rb') as fh:
+        if fh.read(4) != MAGIC:
+            raise ValueError(f'{path} is not a boarding archive segment')
+        version, row_count, column_count = struct.unpack('<HIH', fh.read(8))
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Unsupported archive format version {version}')
+
+        directory = []
+        for _ in range(column_count):
+            (name_len,) = struct.unpack('<B', fh.read(1))
+            name = fh.read(name_len).decode('utf-8')
+            type_code = fh.read(1).decode('ascii')
+            offset, length = struct.unpack('<QQ', fh.read(16))
+            directory.append((name, type_code, offset, length))
+
+        data_start = fh.tell()
+        result = {}
+        for name, type_code, offset, length in directory:
+            if name not in wanted:
+                continue
+            fh.seek(data_start + offset)
+            result[name] = _decode_column(type_code, zlib.decompress(fh.read(length)))
+    return result
+
+
+def _cached_columns(path, columns):
+    # Decoded columns are cached per (file, mtime); segments are immutable once
+    # written so the cache only needs invalidating if a month is re-archived.
+    mtime = os.path.getmtime(path)
+    with _cache_lock:
+        cached = _column_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, {})
+            _column_cache[path] = cached
+            while len(_column_cache) > SEGMENT_CACHE_SIZE:
+                _column_cache.popitem(last=False)
+        else:
+            _column_cache.move_to_end(path)
+        missing = [c for c in columns if c not in cached[1]]
+    if missing:
+        loaded = read_segment(path, missing)
+        with _cache_lock:
+            cached[1].update(loaded)
+    return {c: cached[1][c] for c in columns}
+
+
+# --- Manifest --------------------------------------------------------------
+
+def load_manifest(directory=None):
+    path = os.path.join(directory or archive_dir(), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'version': FORMAT_VERSION, 'segments': {}}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def _save_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, path)
+
+
+# --- Archival --------------------------------------------------------------
+
+def closed_months(now=None):
+    """Months that are old enough to leave the hot table, oldest first."""
+    now = now or datetime.utcnow()
+    hot_months = current_app.config['BOARDING_HOT_MONTHS']
+
+    year, month = now.year, now.month
+    for _ in range(hot_months):
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    cutoff, _ = month_bounds(year, month)
+
+    oldest = db.session.query(db.func.min(Boarding.boarding_time)).scalar()
+    months = []
+    if oldest is None:
+        return months
+    y, m = oldest.year, oldest.month
+    while datetime(y, m, 1) < cutoff:
+        months.append((y, m))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return months
+
+
+def archive_month(year, month):
+    """Move one month of boardings into a segment file and purge it from the DB.
+
+    If the month already has a segment, the new rows are merged into it so a
+    late check-in that lands after archival is not lost.
+    """
+    directory = archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    start, end = month_bounds(year, month)
+    key = _month_key(year, month)
+
+    window = Boarding.query.filter(
+        Boarding.boarding_time >= start,
+        Boarding.boarding_time < end
+    )
+    rows = [
+        {name: getattr(b, name) for name, _ in COLUMNS}
+        for b in window.order_by(Boarding.id).all()
+    ]
+    if not rows:
+        return 0
+
+    manifest = load_manifest(directory)
+    previous = manifest['segments'].get(key)
+    # A new file per run, so the published segment stays intact until the purge commits
+    now = datetime.utcnow()
+    filename = f'boardings-{key}-{now:%Y%m%dT%H%M%S%f}.kba'
+    path = os.path.join(directory, filename)
+    previous_path = os.path.join(directory, previous['file']) if previous else None
+
+    if previous_path and os.path.exists(previous_path):
+        existing = read_segment(previous_path)
+        count = len(existing['id'])
+        merged = [{name: existing[name][i] for name, _ in COLUMNS} for i in range(count)]
+        seen = set(existing['id'])
+        rows = merged + [row for row in rows if row['id'] not in seen]
+        rows.sort(key=lambda row: row['id'])
+
+    write_segment(path, rows)
+
+    student_ids = [row['student_id'] for row in rows]
+    manifest['segments'][key] = {
+        'file': filename,
+        'rows': len(rows),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'min_id': rows[0]['id'],
+        'max_id': rows[-1]['id'],
+        'min_student_id': min(student_ids),
+        'max_student_id': max(student_ids),
+        'bytes': os.path.getsize(path),
+        'archived_at': now.isoformat(),
+    }
+    _save_manifest(directory, manifest)
+
+    # Segment and manifest are on disk; now the rows can leave the hot table
+    try:
+        window.delete(synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        manifest = load_manifest(directory)
+        if previous:
+            manifest['segments'][key] = previous
+        else:
+            manifest['segments'].pop(key, None)
+        _save_manifest(directory, manifest)
+        os.remove(path)
+        raise
+
+    if previous_path and previous_path != path and os.path.exists(previous_path):
+        os.remove(previous_path)
+    return len(rows)
+
+
+def archive_closed_months(now=None):
+    """Archive every closed month. Returns {month key: rows archived}."""
+    archived = {}
+    for year, month in closed_months(now):
+        count = archive_month(year, month)
+        if count:
+            archived[_month_key(year, month)] = count
+    return archived
+
+
+# --- Reads -----------------------------------------------------------------
+
+def segments_for_window(start=None, end=None, manifest=None):
+    manifest = manifest or load_manifest()
+    segments = []
+    for key in sorted(manifest['segments'], reverse=True):
+        segment = manifest['segments'][key]
+        seg_start = datetime.fromisoformat(segment['start'])
+        seg_end = datetime.fromisoformat(segment['end'])
+        if start and seg_end <= start:
+            continue
+        if end and seg_start >= end:
+            continue
+        segments.append(segment)
+    return segments
+
+
+def archived_boardings(student_id=None, route_id=None, start=None, end=None, limit=None, exclude_ids=None,
+                       bus_id=None):
+    """Archived boardings matching the filters, newest first, as row dicts.
+
+    exclude_ids skips boardings the caller already read from the hot table.
+    """
+    directory = archive_dir()
+    manifest = load_manifest(directory)
+    results = []
+
+    for segment in segments_for_window(start, end, manifest):
+        if student_id is not None and not (
+            segment['min_student_id'] <= student_id <= segment['max_student_id']
+        ):
+            continue
+        path = os.path.join(directory, segment['file'])
+
+        # Filter on the narrow columns first, then materialise matching rows
+        filter_columns = ['boarding_time']
+        if student_id is not None:
+            filter_columns.append('student_id')
+        if route_id is not None:
+            filter_columns.append('route_id')
+        if bus_id is not None:
+            filter_columns.append('bus_id')
+        if exclude_ids:
+            filter_columns.append('id')
+        cols = _cached_columns(path, filter_columns)
+
+        matches = []
+        for i, boarding_time in enumerate(cols['boarding_time']):
+            if student_id is not None and cols['student_id'][i] != student_id:
+                continue
+            if route_id is not None and cols['route_id'][i] != route_id:
+                continue
+            if bus_id is not None and cols['bus_id'][i] != bus_id:
+                continue
+            if exclude_ids and cols['id'][i] in exclude_ids:
+                continue
+            if start and (boarding_time is None or boarding_time < start):
+                continue
+            if end and (boarding_time is None or boarding_time >= end):
+                continue
+            matches.append(i)
+        if not matches:
+            continue
+
+        full = _cached_columns(path, [name for name, _ in COLUMNS])
+        rows = [{name: full[name][i] for name, _ in COLUMNS} for i in matches]
+        rows.sort(key=lambda row: row['boarding_time'] or EPOCH, reverse=True)
+        results.extend(rows)
+        if limit and len(results) >= limit:
+            break
+
+    return results[:limit] if limit else results
+
+
+def archived_row_to_dict(row, student=None):
+    """Serialize an archived row the same way Boarding.to_dict does."""
+    return {
+        'id': row['id'],
+        'student_id': row['student_id'],
+        'student': student.to_dict() if student else None,
+        'bus_id': row['bus_id'],
+        'route_id': row['route_id'],
+        'boarding_type': row['boarding_type'],
+        'boarding_time': row['boarding_time'].isoformat() if row['boarding_time'] else None,
+        'location': {
+            'latitude': row['latitude'],
+            'longitude': row['longitude']
+        } if row['latitude'] and row['longitude'] else None,
+        'verified_by_id': row['verified_by_id'],
+        'verification_method': row['verification_method'],
+        'notes': row['notes'],
+        'created_at': row['created_at'].isoformat() if row['created_at'] else None,
+        'archived': True
+    }
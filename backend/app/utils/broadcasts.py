@@ -0,0 +1,169 @@
+# Broadcasts stored once, fanned out on read
+#
+# A broadcast to every parent on a route (or every parent an operator has)
+# used to be one notifications row per recipient, each with its own copy of
+# the title and message. Large broadcasts are now one broadcasts row plus
+# the audience resolved at send time, as bucketed membership rows:
+#
+#   - user ids are split into buckets of 64 consecutive ids; a
+#     broadcast_members row (bucket, broadcast_id, members) holds a 64-bit
+#     mask of which ids in that bucket received it. Buckets without
+#     recipients have no row, so a route broadcast is a few dozen rows and a
+#     broadcast to 20k parents about 300.
+#   - "broadcasts addressed to user u" is a scan of the primary key for
+#     u's bucket, newest broadcast first, with the membership bit tested in
+#     SQL. LIMIT and the deleted-receipt filter run in the database, so an
+#     inbox page reads only the rows it returns plus broadcasts to
+#     neighbouring ids that don't include u.
+#
+# Per-recipient state is a sparse overlay: a broadcast_receipts row exists
+# only once a recipient reads or deletes the broadcast. Inboxes merge the
+# user's own notifications with the broadcasts whose audience contains them,
+# minus the ones they deleted (app/utils/inbox.py).
+#
+# Newest first is by broadcast id, which follows created_at: ids come from
+# the insert and broadcasts are never backdated.
+#
+# Unread counts stop at UNREAD_COUNT_LIMIT, so a user who never reads
+# broadcasts doesn't make every home screen count their whole history. The
+# inbox caps its direct-notification count, and the total, the same way.
+from datetime import datetime
+
+from sqlalchemy import BigInteger, and_, func, literal
+
+from app import db
+from app.models import Broadcast, BroadcastMember, BroadcastReceipt
+
+BUCKET_BITS = 6  # 64 user ids per membership row
+UNREAD_COUNT_LIMIT = 999
+
+
+def bucket_of(user_id):
+    """(bucket, bit mask) for a user id; the mask is signed like the column."""
+    offset = user_id & ((1 << BUCKET_BITS) - 1)
+    bit = 1 << offset
+    return user_id >> BUCKET_BITS, bit - (1 << 64) if offset == 63 else bit
+
+
+def membership_rows(broadcast_id, user_ids):
+    """broadcast_members rows for an audience."""
+    buckets = {}
+    for user_id in set(user_ids):
+        bucket, bit = bucket_of(user_id)
+        buckets[bucket] = buckets.get(bucket, 0) | bit
+    return [
+        {'bucket': bucket, 'broadcast_id': broadcast_id, 'members': members}
+        for bucket, members in sorted(buckets.items())
+    ]
+
+
+def create_broadcast(recipient_ids, sender_id, title, message, **fields):
+    """Store one broadcast for a snapshot of recipient_ids. The caller commits.
+
+    `fields` are notification_type, priority, delivery_method and
+    related_route_id. Returns the Broadcast, or None without recipients.
+    """
+    recipients = set(recipient_ids)
+    if not recipients:
+        return None
+    broadcast = Broadcast(
+        sender_id=sender_id,
+        title=title,
+        message=message,
+        recipient_count=len(recipients),
+        **fields
+    )
+    db.session.add(broadcast)
+    db.session.flush()
+    db.session.execute(BroadcastMember.__table__.insert(), membership_rows(broadcast.id, recipients))
+    return broadcast
+
+
+def _addressed(user_id):
+    """BroadcastMember rows for broadcasts whose audience contains user_id."""
+    bucket, bit = bucket_of(user_id)
+    return BroadcastMember.query.filter(
+        BroadcastMember.bucket == bucket,
+        BroadcastMember.members.op('&')(literal(bit, BigInteger)) != 0
+    )
+
+
+def broadcasts_for(user_id, after_id=0, notification_type=None, include_deleted=False, unread_only=False,
+                   limit=None):
+    """[(broadcast, receipt or None)] addressed to user_id, newest first.
+
+    after_id skips broadcasts up to that id (e.g. under a read watermark);
+    unread_only skips ones with a read receipt.
+    """
+    query = (
+        _addressed(user_id)
+        .join(Broadcast, Broadcast.id == BroadcastMember.broadcast_id)
+        .outerjoin(BroadcastReceipt, and_(
+            BroadcastReceipt.broadcast_id == BroadcastMember.broadcast_id,
+            BroadcastReceipt.user_id == user_id
+        ))
+        .with_entities(Broadcast, BroadcastReceipt)
+    )
+    if after_id:
+        query = query.filter(BroadcastMember.broadcast_id > after_id)
+    if notification_type:
+        query = query.filter(Broadcast.notification_type == notification_type)
+    if unread_only:
+        query = query.filter(BroadcastReceipt.read_at.is_(None))
+    elif not include_deleted:
+        query = query.filter(BroadcastReceipt.deleted_at.is_(None))
+    query = query.order_by(BroadcastMember.broadcast_id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def count_unread(user_id, after_id=0, limit=UNREAD_COUNT_LIMIT):
+    """Unread broadcasts to user_id above after_id, counting at most `limit`."""
+    unread = (
+        _addressed(user_id)
+        .outerjoin(BroadcastReceipt, and_(
+            BroadcastReceipt.broadcast_id == BroadcastMember.broadcast_id,
+            BroadcastReceipt.user_id == user_id
+        ))
+        .filter(BroadcastMember.broadcast_id > after_id, BroadcastReceipt.read_at.is_(None))
+        .with_entities(BroadcastMember.broadcast_id)
+        .limit(limit)
+        .subquery()
+    )
+    return db.session.query(func.count()).select_from(unread).scalar()
+
+
+def get_addressed(broadcast_id, user_id):
+    """(broadcast, receipt) if user_id is in its audience and hasn't deleted it."""
+    if not _addressed(user_id).filter(BroadcastMember.broadcast_id == broadcast_id).count():
+        return None, None
+    broadcast = Broadcast.query.get(broadcast_id)
+    receipt = BroadcastReceipt.query.get((user_id, broadcast_id))
+    if broadcast is None or (receipt is not None and receipt.deleted_at is not None):
+        return None, None
+    return broadcast, receipt
+
+
+def _receipt(broadcast_id, user_id, receipt):
+    if receipt is None:
+        receipt = BroadcastReceipt(user_id=user_id, broadcast_id=broadcast_id)
+        db.session.add(receipt)
+    return receipt
+
+
+def mark_broadcast_read(broadcast_id, user_id, receipt=None):
+    """Record the read; returns the receipt. The caller commits."""
+    receipt = _receipt(broadcast_id, user_id, receipt)
+    if receipt.read_at is None:
+        receipt.read_at = datetime.utcnow()
+    return receipt
+
+
+def delete_broadcast_for(broadcast_id, user_id, receipt=None):
+    """Hide the broadcast from user_id's inbox. The caller commits."""
+    receipt = _receipt(broadcast_id, user_id, receipt)
+    now = datetime.utcnow()
+    receipt.read_at = receipt.read_at or now
+    receipt.deleted_at = now
+    return receipt
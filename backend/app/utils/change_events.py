@@ -0,0 +1,279 @@
+# Transactional outbox and change-event bus
+#
+# Writes to buses, routes, students and schools used to commit and return
+# without any other process finding out, so nothing could be cached across
+# gunicorn workers. Now every flush that inserts, updates or deletes one of
+# those rows also inserts a compact change_events row (entity, id, action,
+# changed columns) on the same connection, so the event commits or rolls
+# back with the change itself. No handler has to remember to record it.
+#
+# Delivery:
+#
+#   - in this worker, subscribers are called from the session's after_commit,
+#     i.e. only for committed changes
+#   - on PostgreSQL the same flush issues pg_notify(), which Postgres only
+#     delivers when the transaction commits. Each worker runs a listener
+#     thread on its own connection (LISTEN) that hands other workers' events
+#     to its subscribers. After losing the connection it replays the
+#     change_events rows it missed.
+#   - elsewhere (SQLite in development and tests) the local stand-in only
+#     delivers in-process; deliver() accepts a payload as if it came from
+#     another worker
+#
+# Delivery is at least once, so subscribers should be idempotent
+# (invalidate, re-read, wake a waiter). They run on the committing request's
+# thread or on the listener thread, so they must be quick and must not touch
+# db.session. Exceptions are logged and swallowed.
+#
+# announce() sends a transient event with no outbox row, for high-rate
+# changes like location flushes where only waking other workers matters.
+import json
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, func, inspect, select as sql_select
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'kiddiebus_changes'
+TRACKED = {'Bus': 'bus', 'Route': 'route', 'Student': 'student', 'School': 'school'}
+NOTIFY_CHUNK = 500  # ids per transient payload; NOTIFY payloads are capped at 8000 bytes
+PENDING_KEY = 'change_events'
+
+
+def _changed_columns(obj):
+    state = inspect(obj)
+    return [
+        attr.key for attr in state.mapper.column_attrs
+        if state.attrs[attr.key].history.has_changes()
+    ]
+
+
+class ChangeEventBus:
+    def __init__(self, app=None):
+        self._token = uuid.uuid4().hex[:12]
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._listener = None
+        self._pid = None
+        self._last_id = 0
+        self._app = None
+        self._session_events = False
+        self.published = 0
+        self.received = 0
+        self.subscriber_errors = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app.utils.db_routing import RoutingSession
+        self._app = app
+        if not self._session_events:
+            event.listen(RoutingSession, 'after_flush', self._after_flush)
+            event.listen(RoutingSession, 'after_commit', self._after_commit)
+            event.listen(RoutingSession, 'after_soft_rollback', self._after_rollback)
+            self._session_events = True
+        app.before_request(self._ensure_listener)
+        app.extensions['change_events'] = self
+
+    @property
+    def origin(self):
+        # Forked workers share the token, so the pid tells them apart
+        return f'{self._token}:{os.getpid()}'
+
+    def backend(self, engine):
+        configured = self._app.config['CHANGE_EVENTS_BACKEND']
+        if configured == 'auto':
+            return 'postgres' if engine.dialect.name == 'postgresql' else 'local'
+        return configured
+
+    # --- Subscribers -------------------------------------------------------
+
+    def subscribe(self, fn, entities=None):
+        """Call fn(event) for committed changes to `entities` (default: all)."""
+        with self._lock:
+            entry = (frozenset(entities) if entities else None, fn)
+            if entry not in self._subscribers:  # create_app may run more than once
+                self._subscribers.append(entry)
+
+    def _dispatch(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for change in events:
+            for entities, fn in subscribers:
+                if entities is not None and change['entity'] not in entities:
+                    continue
+                try:
+                    fn(change)
+                except Exception:
+                    self.subscriber_errors += 1
+                    logger.exception('Change subscriber %r failed on %s', fn, change)
+
+    def deliver(self, payload):
+        """Handle a payload from another worker (the listener, or tests)."""
+        change = json.loads(payload)
+        if change.get('origin') == self.origin:
+            return  # already delivered locally at commit
+        if change.get('id'):
+            self._last_id = max(self._last_id, change['id'])
+        self.received += 1
+        if 'ids' in change:
+            self._dispatch([{**change, 'entity_id': entity_id} for entity_id in change.pop('ids')])
+        else:
+            self._dispatch([change])
+
+    # --- Recording -----------------------------------------------------------
+
+    def _after_flush(self, session, flush_context):
+        changes = []
+        for obj, action in [(o, 'created') for o in session.new] + \
+                [(o, 'updated') for o in session.dirty] + [(o, 'deleted') for o in session.deleted]:
+            entity = TRACKED.get(type(obj).__name__)
+            if entity is None:
+                continue
+            fields = _changed_columns(obj) if action == 'updated' else None
+            if action == 'updated' and not fields:
+                continue
+            changes.append((entity, obj.id, action, fields))
+        if not changes:
+            return
+
+        from app.models import ChangeEvent
+        table = ChangeEvent.__table__
+        connection = session.connection()
+        postgres = self.backend(connection.engine) == 'postgres'
+        now = datetime.utcnow()
+        pending = session.info.setdefault(PENDING_KEY, [])
+        for entity, entity_id, action, fields in changes:
+            row = {
+                'entity': entity,
+                'entity_id': entity_id,
+                'action': action,
+                'fields': ','.join(fields) if fields else None,
+                'created_at': now
+            }
+            event_id = connection.execute(table.insert().returning(table.c.id), row).scalar()
+            change = {
+                'id': event_id,
+                'entity': entity,
+                'entity_id': entity_id,
+                'action': action,
+                'fields': fields,
+                'at': now.isoformat()
+            }
+            pending.append(change)
+            if postgres:
+                connection.execute(sql_select(func.pg_notify(CHANNEL, json.dumps({**change, 'origin': self.origin}))))
+
+    def announce(self, session, entity, ids):
+        """Tell other workers about a transient change to `ids` when `session` commits."""
+        connection = session.connection()
+        if self.backend(connection.engine) != 'postgres':
+            return
+        ids = list(ids)
+        for start in range(0, len(ids), NOTIFY_CHUNK):
+            payload = json.dumps({'entity': entity, 'action': 'updated', 'ids': ids[start:start + NOTIFY_CHUNK],
+                                  'origin': self.origin})
+            connection.execute(sql_select(func.pg_notify(CHANNEL, payload)))
+
+    def _after_commit(self, session):
+        events = session.info.pop(PENDING_KEY, None)
+        if events:
+            self.published += len(events)
+            self._last_id = max(self._last_id, max(e['id'] for e in events))
+            self._dispatch(events)
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop(PENDING_KEY, None)
+
+    # --- Listener (PostgreSQL) ----------------------------------------------
+
+    def _ensure_listener(self):
+        # One listener per gunicorn worker, started after fork
+        if self._pid == os.getpid() and self._listener is not None and self._listener.is_alive():
+            return
+        from app import db
+        if self.backend(db.engine) != 'postgres' or not self._app.config['CHANGE_EVENTS_LISTEN']:
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._listener is None or not self._listener.is_alive():
+                self._pid = os.getpid()
+                self._listener = threading.Thread(target=self._listen_forever, name='change-events', daemon=True)
+                self._listener.start()
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                logger.exception('Change event listener failed; reconnecting')
+            time.sleep(1)
+
+    def _listen(self):
+        from app import db
+        with self._app.app_context():
+            connection = db.engine.raw_connection()
+        connection.detach()  # autocommit and LISTEN must not leak back into the pool
+        try:
+            raw = connection.driver_connection
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            self._replay()
+            while True:
+                if select.select([raw], [], [], 5) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    self.deliver(raw.notifies.pop(0).payload)
+        finally:
+            connection.close()
+
+    def _replay(self):
+        """Deliver events committed while the listener wasn't connected."""
+        if not self._last_id:
+            return
+        from app import db
+        from app.models import ChangeEvent
+        with self._app.app_context():
+            try:
+                rows = ChangeEvent.query.filter(ChangeEvent.id > self._last_id).order_by(ChangeEvent.id).all()
+                missed = [row.to_event() for row in rows]
+            finally:
+                db.session.remove()
+        if missed:
+            logger.info('Replaying %d change events', len(missed))
+            self._last_id = missed[-1]['id']
+            self.received += len(missed)
+            self._dispatch(missed)
+
+    def prometheus_samples(self):
+        return [
+            ('kiddiebus_change_events_published_total', 'counter',
+             'Change events committed by this process.', [({}, self.published)]),
+            ('kiddiebus_change_events_received_total', 'counter',
+             'Change events received from other processes.', [({}, self.received)]),
+            ('kiddiebus_change_subscriber_errors_total', 'counter',
+             'Change subscribers that raised.', [({}, self.subscriber_errors)]),
+        ]
+
+
+def prune_change_events(hours=None, now=None):
+    """Delete outbox rows older than CHANGE_EVENTS_RETENTION_HOURS. Commits."""
+    from app import db
+    from app.models import ChangeEvent
+    hours = hours if hours is not None else current_app.config['CHANGE_EVENTS_RETENTION_HOURS']
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=hours)
+    deleted = ChangeEvent.query.filter(ChangeEvent.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+change_events = ChangeEventBus()
@@ -0,0 +1,187 @@
+# Bus double-booking detection
+#
+# A route occupies its bus for [scheduled_start_time, scheduled_end_time) on
+# every day in its days_mask. Those windows are laid out on a week of minutes
+# (Monday 00:00 = 0), so two routes conflict exactly when one of their week
+# intervals overlap; overnight and Sunday-to-Monday windows are split.
+#
+# BusIntervalIndex holds one bus's intervals sorted by start with a running
+# maximum of end times, so "does [s, e) overlap anything" is one bisect:
+# among intervals starting before e, the largest end must be > s. It is built
+# from a single indexed query on routes.bus_id when an assignment is checked,
+# with the bus row locked so two concurrent assignments can't both pass.
+#
+# fleet_conflicts() reports every overlapping pair in the fleet from one query
+# and one sweep over the intervals sorted by (bus, start).
+import heapq
+from bisect import bisect_left
+
+from flask import current_app
+
+from app.utils.schedule import DAY_NAMES
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def week_intervals(days_mask, start_time, end_time, buffer_minutes=0):
+    """[(start, end)] week-minute intervals for a schedule, split at week end."""
+    if not days_mask or start_time is None:
+        return []
+    start = _minutes(start_time)
+    if end_time is None:
+        duration = current_app.config['TRIP_DEFAULT_DURATION_MINUTES']
+    else:
+        duration = (_minutes(end_time) - start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+    duration += buffer_minutes
+
+    intervals = []
+    for day in range(7):
+        if days_mask & (1 << day):
+            begin = day * MINUTES_PER_DAY + start
+            end = begin + duration
+            if end > MINUTES_PER_WEEK:
+                intervals.append((begin, MINUTES_PER_WEEK))
+                intervals.append((0, end - MINUTES_PER_WEEK))
+            else:
+                intervals.append((begin, end))
+    return intervals
+
+
+def describe_interval(start, end):
+    """Day name and HH:MM bounds; times past midnight read 24:00, 25:30, ..."""
+    day_start = start // MINUTES_PER_DAY * MINUTES_PER_DAY
+    begin, finish = start - day_start, end - day_start
+    return {
+        'day': DAY_NAMES[start // MINUTES_PER_DAY],
+        'start': f'{begin // 60:02d}:{begin % 60:02d}',
+        'end': f'{finish // 60:02d}:{finish % 60:02d}'
+    }
+
+
+class BusIntervalIndex:
+    def __init__(self, entries):
+        # entries: (start, end, route_id)
+        self.entries = sorted(entries)
+        self.starts = [start for start, _, _ in self.entries]
+        self.max_end = []
+        running = -1
+        for _, end, _ in self.entries:
+            running = max(running, end)
+            self.max_end.append(running)
+
+    def overlaps(self, start, end):
+        """True if any interval overlaps [start, end). O(log n)."""
+        i = bisect_left(self.starts, end)
+        return i > 0 and self.max_end[i - 1] > start
+
+    def conflicting(self, start, end):
+        """Entries overlapping [start, end)."""
+        i = bisect_left(self.starts, end)
+        found = []
+        while i > 0 and self.max_end[i - 1] > start:
+            i -= 1
+            if self.entries[i][1] > start:
+                found.append(self.entries[i])
+        return found
+
+
+def _buffer():
+    return current_app.config['ROUTE_CONFLICT_BUFFER_MINUTES']
+
+
+def bus_index(bus_id, exclude_route_id=None):
+    from app.models import Bus, Route
+    # Serialize concurrent assignments to the same bus (no-op on SQLite)
+    Bus.query.filter_by(id=bus_id).with_for_update().first()
+    query = Route.query.filter(
+        Route.bus_id == bus_id,
+        Route.status == 'active',
+        Route.scheduled_start_time.isnot(None),
+        Route.days_mask != 0
+    )
+    if exclude_route_id is not None:
+        query = query.filter(Route.id != exclude_route_id)
+    routes = {route.id: route for route in query}
+    entries = [
+        (start, end, route.id)
+        for route in routes.values()
+        for start, end in week_intervals(route.days_mask, route.scheduled_start_time,
+                                         route.scheduled_end_time, _buffer())
+    ]
+    return BusIntervalIndex(entries), routes
+
+
+def assignment_conflicts(bus_id, days_mask, start_time, end_time, route_id=None):
+    """Routes already using `bus_id` in the proposed schedule's windows."""
+    if bus_id is None:
+        return []
+    proposed = week_intervals(days_mask, start_time, end_time, _buffer())
+    if not proposed:
+        return []
+    index, routes = bus_index(bus_id, exclude_route_id=route_id)
+
+    conflicts = []
+    for start, end in proposed:
+        if not index.overlaps(start, end):
+            continue
+        for other_start, other_end, other_id in index.conflicting(start, end):
+            conflicts.append({
+                'route_id': other_id,
+                'route_name': routes[other_id].name,
+                **describe_interval(max(start, other_start), min(end, other_end))
+            })
+    return conflicts
+
+
+def fleet_conflicts(operator_id=None):
+    """Every overlapping pair of active routes sharing a bus, in one sweep."""
+    from app import db
+    from app.models import Route
+
+    rows = (
+        db.session.query(Route.id, Route.name, Route.bus_id, Route.operator_id, Route.days_mask,
+                         Route.scheduled_start_time, Route.scheduled_end_time)
+        .filter(Route.bus_id.isnot(None), Route.status == 'active',
+                Route.scheduled_start_time.isnot(None), Route.days_mask != 0)
+        .all()
+    )
+    names = {row.id: row.name for row in rows}
+    owners = {row.id: row.operator_id for row in rows}
+    buffer_minutes = _buffer()
+    intervals = sorted(
+        (row.bus_id, start, end, row.id)
+        for row in rows
+        for start, end in week_intervals(row.days_mask, row.scheduled_start_time,
+                                         row.scheduled_end_time, buffer_minutes)
+    )
+
+    pairs = {}
+    current_bus = None
+    open_intervals = []  # heap of (end, start, route_id) still running
+    for bus_id, start, end, route_id in intervals:
+        if bus_id != current_bus:
+            current_bus, open_intervals = bus_id, []
+        while open_intervals and open_intervals[0][0] <= start:
+            heapq.heappop(open_intervals)
+        for other_end, _, other_id in open_intervals:
+            if other_id == route_id:
+                continue
+            key = (bus_id, min(route_id, other_id), max(route_id, other_id))
+            pairs.setdefault(key, []).append(describe_interval(start, min(end, other_end)))
+        heapq.heappush(open_intervals, (end, start, route_id))
+
+    report = []
+    for (bus_id, first, second), overlaps in sorted(pairs.items()):
+        if operator_id is not None and operator_id not in (owners[first], owners[second]):
+            continue
+        report.append({
+            'bus_id': bus_id,
+            'routes': [{'id': first, 'name': names[first]}, {'id': second, 'name': names[second]}],
+            'overlaps': overlaps
+        })
+    return report
@@ -0,0 +1,205 @@
+# Incrementally maintained dashboard aggregates
+#
+# The operator dashboard reads a handful of counters instead of counting buses,
+# trips, boardings and notifications on every load. Counters live in
+# dashboard_counters as (scope, name) -> value, with scopes
+#
+#   fleet          buses:<status>, stale_trackers
+#   day:<date>     onboard:<bus_id>, trips:<operator_id|all>:<state>
+#   user:<id>      unread (own notifications above the read watermark;
+#                  broadcasts are counted on read)
+#
+# so the dashboard is one primary-key read of three scopes.
+#
+# Event-driven counters are bumped by the write paths in the same transaction
+# as the change (bus create/update/delete, check-in, notification insert,
+# read and delete), with an upsert that adds to the stored value. Time-driven
+# ones (trip states move as the clock passes scheduled times, trackers go
+# stale) are recomputed by refresh_time_counters() on every delay-detector
+# pass and whenever trips are materialized. `flask dashboard rebuild`
+# recomputes everything from the source tables.
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import db
+from app.models import Boarding, Bus, DashboardCounter, Notification, ReadWatermark, Trip
+from app.utils.schedule import local_today, to_utc
+
+FLEET = 'fleet'
+TRIP_STATES = ('scheduled', 'in_progress', 'completed', 'cancelled', 'late')
+
+
+def day_scope(service_date):
+    return f'day:{service_date.isoformat()}'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def _upsert(rows, increment):
+    table = DashboardCounter.__table__
+    insert = pg_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    statement = insert(table)
+    value = table.c.value + statement.excluded.value if increment else statement.excluded.value
+    statement = statement.on_conflict_do_update(
+        index_elements=['scope', 'name'],
+        set_={'value': value, 'updated_at': statement.excluded.updated_at}
+    )
+    now = datetime.utcnow()
+    db.session.execute(statement, [{**row, 'updated_at': now} for row in rows])
+
+
+def bump_many(deltas):
+    """Add to counters: {(scope, name): delta}. The caller commits."""
+    rows = [
+        {'scope': scope, 'name': name, 'value': delta}
+        for (scope, name), delta in deltas.items() if delta
+    ]
+    if rows:
+        _upsert(rows, increment=True)
+
+
+def bump(scope, name, delta=1):
+    bump_many({(scope, name): delta})
+
+
+def replace_counters(scope, prefix, values):
+    """Set every counter named prefix* in scope to `values` ({name: value})."""
+    DashboardCounter.query.filter(
+        DashboardCounter.scope == scope,
+        DashboardCounter.name.startswith(prefix)
+    ).delete(synchronize_session=False)
+    if values:
+        _upsert([{'scope': scope, 'name': name, 'value': value} for name, value in values.items()],
+                increment=False)
+
+
+def read_counters(scopes):
+    """{scope: {name: value}} and the latest update time, in one query."""
+    counters = {scope: {} for scope in scopes}
+    latest = None
+    for row in DashboardCounter.query.filter(DashboardCounter.scope.in_(scopes)):
+        counters[row.scope][row.name] = row.value
+        if row.updated_at and (latest is None or row.updated_at > latest):
+            latest = row.updated_at
+    return counters, latest
+
+
+# --- Write-path hooks ----------------------------------------------------
+
+def bus_status_changed(old, new):
+    if old != new:
+        bump_many({(FLEET, f'buses:{old}'): -1 if old else 0, (FLEET, f'buses:{new}'): 1})
+
+
+def boarding_recorded(bus_id, boarding_type):
+    bump(day_scope(local_today()), f'onboard:{bus_id}', 1 if boarding_type == 'pickup' else -1)
+
+
+def unread_changed(deltas):
+    """{user_id: delta} unread notifications.
+
+    Call before inserting the notifications: the counter rows are locked in
+    user id order, and ids allocated after that sort above any watermark a
+    concurrent mark-all takes (see app/utils/inbox.py).
+    """
+    bump_many({(user_scope(user_id), 'unread'): delta for user_id, delta in sorted(deltas.items())})
+
+
+def lock_unread(user_id):
+    """Hold the user's unread counter row until commit; inserts for them wait."""
+    _upsert([{'scope': user_scope(user_id), 'name': 'unread', 'value': 0}], increment=True)
+
+
+def reset_unread(user_id, value=0):
+    _upsert([{'scope': user_scope(user_id), 'name': 'unread', 'value': value}], increment=False)
+
+
+# --- Time-driven counters -------------------------------------------------
+
+def refresh_trip_counters(now=None):
+    """Recompute today's trips by state per operator. The caller commits."""
+    now = now or datetime.utcnow()
+    today = local_today()
+    threshold = current_app.config['DELAY_THRESHOLD_MINUTES']
+    rows = (
+        db.session.query(Trip.operator_id, Trip.status, Trip.scheduled_start,
+                         Trip.scheduled_end, Trip.delay_minutes)
+        .filter(Trip.service_date == today)
+        .all()
+    )
+    values = {}
+    for operator_id, status, start, end, delay in rows:
+        if status == 'cancelled':
+            states = ['cancelled']
+        elif end <= now:
+            states = ['completed']
+        elif start <= now:
+            states = ['in_progress']
+        else:
+            states = ['scheduled']
+        if status != 'cancelled' and delay is not None and delay >= threshold:
+            states.append('late')
+        for owner in (operator_id, 'all'):
+            for state in states:
+                key = f'trips:{owner}:{state}'
+                values[key] = values.get(key, 0) + 1
+    replace_counters(day_scope(today), 'trips:', values)
+
+
+def refresh_stale_trackers(now=None):
+    """Count active buses without a fix in DASHBOARD_STALE_TRACKER_MINUTES."""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(minutes=current_app.config['DASHBOARD_STALE_TRACKER_MINUTES'])
+    stale = Bus.query.filter(
+        Bus.status == 'active',
+        db.or_(Bus.last_location_update.is_(None), Bus.last_location_update < cutoff)
+    ).count()
+    replace_counters(FLEET, 'stale_trackers', {'stale_trackers': stale})
+
+
+def refresh_time_counters(now=None):
+    """Trip states and stale trackers; drops counters of past days. Commits."""
+    today = local_today()
+    refresh_trip_counters(now)
+    refresh_stale_trackers(now)
+    DashboardCounter.query.filter(
+        DashboardCounter.scope.startswith('day:'),
+        DashboardCounter.scope < day_scope(today - timedelta(days=1))
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def rebuild_counters(now=None):
+    """Recompute every counter from the source tables. Commits."""
+    today = local_today()
+    DashboardCounter.query.delete(synchronize_session=False)
+
+    values = {
+        (FLEET, f'buses:{status}'): count
+        for status, count in db.session.query(Bus.status, func.count()).group_by(Bus.status)
+    }
+    onboard = func.sum(case((Boarding.boarding_type == 'pickup', 1), else_=-1))
+    for bus_id, count in (
+        db.session.query(Boarding.bus_id, onboard)
+        .filter(Boarding.boarding_time >= to_utc(today, datetime.min.time()))
+        .group_by(Boarding.bus_id)
+    ):
+        values[(day_scope(today), f'onboard:{bus_id}')] = count
+    for user_id, count in (
+        db.session.query(Notification.recipient_id, func.count())
+        .outerjoin(ReadWatermark, ReadWatermark.user_id == Notification.recipient_id)
+        .filter(Notification.is_read.is_(False),
+                Notification.id > func.coalesce(ReadWatermark.notification_id, 0))
+        .group_by(Notification.recipient_id)
+    ):
+        values[(user_scope(user_id), 'unread')] = count
+    bump_many(values)
+
+    refresh_time_counters(now)
+    return len(values)
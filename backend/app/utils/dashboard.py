@@ -0,0 +1,148 @@
+# Home-screen aggregates
+#
+# parent_home() returns everything the parent home screen shows in one
+# response, from a fixed number of queries however many children there are:
+#
+#   1. children with their school, route and bus (one joined query)
+#   2. each child's latest boarding today
+#   3. today's trips for those routes
+#   4. the unread notification count (own notifications plus broadcasts,
+#      above the read watermark)
+#
+# Bus positions come from the database row, overlaid with any newer fix the
+# location buffer still holds in this worker.
+#
+# operator_summary() is a single read of the counters kept by
+# app/utils/counters.py, so its cost doesn't grow with the fleet's history.
+# Unread broadcasts aren't counted there (that would mean a counter write per
+# recipient); they are added from app/utils/inbox.py.
+from datetime import datetime, time
+
+from sqlalchemy import and_, func
+
+from app import db
+from app.models import Boarding, Route, Student, Trip
+from app.utils.counters import FLEET, TRIP_STATES, day_scope, read_counters, user_scope
+from app.utils.inbox import unread_broadcast_count, unread_count
+from app.utils.location_buffer import location_buffer
+from app.utils.schedule import local_today, to_utc
+
+
+def live_location(bus):
+    """Bus current_location, preferring a buffered fix newer than the stored one."""
+    fix = location_buffer.latest([bus.id]).get(bus.id)
+    if fix and (bus.last_location_update is None or fix[2] > bus.last_location_update):
+        latitude, longitude, reported_at = fix
+    elif bus.current_latitude and bus.current_longitude:
+        latitude, longitude, reported_at = bus.current_latitude, bus.current_longitude, bus.last_location_update
+    else:
+        return None
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'updated_at': reported_at.isoformat() if reported_at else None
+    }
+
+
+def latest_boardings(student_ids, since):
+    """student_id -> most recent Boarding at or after `since`."""
+    if not student_ids:
+        return {}
+    latest = (
+        db.session.query(Boarding.student_id, func.max(Boarding.boarding_time).label('boarding_time'))
+        .filter(Boarding.student_id.in_(student_ids), Boarding.boarding_time >= since)
+        .group_by(Boarding.student_id)
+        .subquery()
+    )
+    rows = Boarding.query.join(latest, and_(
+        Boarding.student_id == latest.c.student_id,
+        Boarding.boarding_time == latest.c.boarding_time
+    )).order_by(Boarding.id)
+    # Check-ins in the same second tie on boarding_time; the last one recorded wins
+    return {boarding.student_id: boarding for boarding in rows}
+
+
+def boarding_state(boarding):
+    if boarding is None:
+        return {'status': 'not_boarded', 'boarding_time': None, 'bus_id': None, 'route_id': None}
+    return {
+        'status': 'on_bus' if boarding.boarding_type == 'pickup' else 'dropped_off',
+        'boarding_time': boarding.boarding_time.isoformat(),
+        'bus_id': boarding.bus_id,
+        'route_id': boarding.route_id
+    }
+
+
+def parent_home(parent_id):
+    today = local_today()
+    children = (
+        Student.query
+        .options(db.joinedload(Student.school), db.joinedload(Student.route).joinedload(Route.bus))
+        .filter(Student.parent_id == parent_id, Student.is_active.is_(True))
+        .order_by(Student.first_name)
+        .all()
+    )
+    routes = {child.route.id: child.route for child in children if child.route}
+
+    boardings = latest_boardings([child.id for child in children], to_utc(today, time(0)))
+    trips = {
+        trip.route_id: trip
+        for trip in Trip.query.filter(Trip.route_id.in_(list(routes)), Trip.service_date == today)
+    } if routes else {}
+    unread = unread_count(parent_id)
+
+    route_list = []
+    for route in routes.values():
+        data = route.to_dict()
+        if route.bus:
+            data['bus']['current_location'] = live_location(route.bus)
+        trip = trips.get(route.id)
+        data['today_trip'] = {
+            'id': trip.id,
+            'scheduled_start': trip.scheduled_start.isoformat(),
+            'scheduled_end': trip.scheduled_end.isoformat(),
+            'status': trip.status,
+            'delay_minutes': trip.delay_minutes
+        } if trip else None
+        route_list.append(data)
+
+    return {
+        'children': [
+            {**child.to_dict(), 'boarding_state': boarding_state(boardings.get(child.id))}
+            for child in children
+        ],
+        'routes': route_list,
+        'unread_count': unread,
+        'service_date': today.isoformat(),
+        'generated_at': datetime.utcnow().isoformat()
+    }
+
+
+def operator_summary(user):
+    """Fleet, today's trips, onboard counts, stale trackers and unread alerts."""
+    today = local_today()
+    day, inbox = day_scope(today), user_scope(user.id)
+    counters, refreshed_at = read_counters([FLEET, day, inbox])
+    fleet, daily = counters[FLEET], counters[day]
+    owner = user.id if user.role == 'operator' else 'all'
+
+    by_status = {
+        name.split(':', 1)[1]: value
+        for name, value in fleet.items() if name.startswith('buses:') and value > 0
+    }
+    onboard = sorted(
+        (int(name.split(':', 1)[1]), value)
+        for name, value in daily.items() if name.startswith('onboard:') and value > 0
+    )
+    return {
+        'fleet': {'total': sum(by_status.values()), 'by_status': by_status},
+        'trips': {state: daily.get(f'trips:{owner}:{state}', 0) for state in TRIP_STATES},
+        'onboard': {
+            'total': sum(count for _, count in onboard),
+            'by_bus': [{'bus_id': bus_id, 'count': count} for bus_id, count in onboard]
+        },
+        'stale_trackers': fleet.get('stale_trackers', 0),
+        'unread_alerts': max(0, counters[inbox].get('unread', 0)) + unread_broadcast_count(user.id),
+        'service_date': today.isoformat(),
+        'refreshed_at': refreshed_at.isoformat() if refreshed_at else None
+    }
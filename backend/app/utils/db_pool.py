@@ -0,0 +1,204 @@
+# Engine options and connection pool telemetry
+#
+# Pool sizing comes from Config (DB_POOL_SIZE etc.). Every engine gets a
+# QueuePool subclass that times how long a request waits for a connection,
+# and cursor listeners that count statements and slow queries. The metrics
+# blueprint reads the numbers back through pool_stats().
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_SAMPLES = 20
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records checkout wait times and timeouts."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+        self.checkout_timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.checkout_timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.checkout_wait_total += waited
+                self.checkout_wait_max = max(self.checkout_wait_max, waited)
+
+    def recreate(self):
+        # Keep counters across pool recreation (e.g. after a disconnect)
+        pool = super().recreate()
+        pool.checkouts = self.checkouts
+        pool.checkout_wait_total = self.checkout_wait_total
+        pool.checkout_wait_max = self.checkout_wait_max
+        pool.checkout_timeouts = self.checkout_timeouts
+        return pool
+
+
+class QueryStats:
+    def __init__(self, slow_threshold):
+        self.slow_threshold = slow_threshold
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total_time = 0.0
+        self.slow_count = 0
+        self.slow_samples = deque(maxlen=SLOW_QUERY_SAMPLES)
+
+    def record(self, statement, elapsed):
+        with self.lock:
+            self.count += 1
+            self.total_time += elapsed
+            if elapsed >= self.slow_threshold:
+                self.slow_count += 1
+                self.slow_samples.append({
+                    'statement': ' '.join(statement.split())[:300],
+                    'duration_ms': round(elapsed * 1000, 1),
+                    'at': time.time()
+                })
+                return True
+        return False
+
+
+_query_stats = weakref.WeakKeyDictionary()
+
+# Callables invoked as observer(statement, elapsed_seconds) after every query
+query_observers = []
+
+
+def engine_options(config, uri=None):
+    """Build SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings in Config."""
+    uri = uri or config['SQLALCHEMY_DATABASE_URI']
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+
+    # SQLite (tests, local benchmarks) manages its own pooling
+    if uri.startswith('sqlite'):
+        return options
+
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    })
+    if config['DB_STATEMENT_TIMEOUT_MS'] and uri.startswith('postgresql'):
+        options['connect_args'] = {
+            'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"
+        }
+    return options
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start_time'].pop()
+    elapsed = time.perf_counter() - started
+    stats = _query_stats.get(conn.engine)
+    if stats and stats.record(statement, elapsed):
+        logger.warning('Slow query (%.0f ms): %s', elapsed * 1000, statement[:300])
+    for observer in query_observers:
+        observer(statement, elapsed)
+
+
+def _handle_error(context):
+    # The statement never reached after_cursor_execute; drop its start time
+    if context.connection is not None and context.connection.info.get('query_start_time'):
+        context.connection.info['query_start_time'].pop()
+
+
+def instrument_engine(engine, slow_query_ms):
+    if engine in _query_stats:
+        return
+    _query_stats[engine] = QueryStats(slow_query_ms / 1000.0)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+def init_db_metrics(app, db):
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_engine(engine, app.config['DB_SLOW_QUERY_MS'])
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool_class': type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'in_use': pool.checkedout(),
+            'overflow': pool.overflow(),
+        })
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            stats.update({
+                'checkouts': pool.checkouts,
+                'checkout_wait_avg_ms': round(pool.checkout_wait_total * 1000 / pool.checkouts, 3) if pool.checkouts else 0.0,
+                'checkout_wait_max_ms': round(pool.checkout_wait_max * 1000, 3),
+                'checkout_timeouts': pool.checkout_timeouts,
+            })
+
+    query_stats = _query_stats.get(engine)
+    if query_stats:
+        with query_stats.lock:
+            stats['queries'] = {
+                'count': query_stats.count,
+                'total_ms': round(query_stats.total_time * 1000, 1),
+                'slow_threshold_ms': round(query_stats.slow_threshold * 1000),
+                'slow_count': query_stats.slow_count,
+                'recent_slow': list(query_stats.slow_samples),
+            }
+    return stats
+
+
+def prometheus_samples(engines):
+    """Collector for the /api/metrics exposition (see instrumentation)."""
+    gauges = {'size': [], 'in_use': [], 'overflow': []}
+    checkouts, waits, timeouts, slow = [], [], [], []
+    for key, engine in engines.items():
+        labels = {'bind': key or 'primary'}
+        stats = pool_stats(engine)
+        for name in gauges:
+            if name in stats:
+                gauges[name].append((labels, stats[name]))
+        pool = engine.pool
+        if isinstance(pool, InstrumentedQueuePool):
+            checkouts.append((labels, pool.checkouts))
+            waits.append((labels, pool.checkout_wait_total))
+            timeouts.append((labels, pool.checkout_timeouts))
+        if 'queries' in stats:
+            slow.append((labels, stats['queries']['slow_count']))
+
+    return [
+        ('kiddiebus_db_pool_size', 'gauge', 'Configured pool size.', gauges['size']),
+        ('kiddiebus_db_pool_in_use', 'gauge', 'Connections checked out.', gauges['in_use']),
+        ('kiddiebus_db_pool_overflow', 'gauge', 'Overflow connections open.', gauges['overflow']),
+        ('kiddiebus_db_pool_checkouts_total', 'counter', 'Connection checkouts.', checkouts),
+        ('kiddiebus_db_pool_checkout_wait_seconds_total', 'counter', 'Time spent waiting for a connection.', waits),
+        ('kiddiebus_db_pool_checkout_timeouts_total', 'counter', 'Checkouts that hit DB_POOL_TIMEOUT.', timeouts),
+        ('kiddiebus_db_slow_queries_total', 'counter', 'Queries slower than DB_SLOW_QUERY_MS.', slow),
+    ]
@@ -0,0 +1,121 @@
+# Read/write splitting between the primary database and read replicas
+#
+# Each URL in DATABASE_REPLICA_URLS is registered as a 'replica_<n>' bind.
+# GET/HEAD requests handled by a blueprint listed in DB_REPLICA_BLUEPRINTS
+# read from one replica, picked once per request. Everything else (writes,
+# flushes, other blueprints, and non-request code such as `flask db` migrations
+# and CLI commands) stays on the primary.
+#
+# Read-your-writes: once a user writes, their reads go to the primary for
+# DB_REPLICA_STICKY_SECONDS. The window is tracked per worker and also handed
+# to the client in the X-Read-After header, which the client echoes back so
+# the next request is pinned even if it lands on a different worker.
+import random
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND_PREFIX = 'replica_'
+READ_METHODS = ('GET', 'HEAD')
+READ_AFTER_HEADER = 'X-Read-After'
+
+_sticky_lock = threading.Lock()
+_sticky_until = {}
+
+
+def replica_binds(uris):
+    return {f'{REPLICA_BIND_PREFIX}{i}': uri for i, uri in enumerate(uris)}
+
+
+def use_primary():
+    """Pin the rest of the current request to the primary database."""
+    if has_request_context():
+        g.db_use_primary = True
+
+
+def _current_identity():
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        # JWT not verified for this request
+        return None
+
+
+def _is_sticky():
+    read_after = request.headers.get(READ_AFTER_HEADER, type=float)
+    now = time.time()
+    if read_after and read_after > now:
+        return True
+
+    identity = _current_identity()
+    if identity is None:
+        return False
+    with _sticky_lock:
+        until = _sticky_until.get(identity)
+    return until is not None and until > now
+
+
+def mark_write():
+    """Record that the current request wrote to the primary."""
+    if has_request_context():
+        g.db_wrote = True
+
+
+def before_request():
+    # g outlives the request when an app context is already pushed (tests, CLI)
+    for key in ('db_replica', 'db_wrote', 'db_use_primary'):
+        g.pop(key, None)
+
+
+def after_request(response):
+    """Extend the user's read-your-writes window after a write."""
+    if not g.get('db_wrote'):
+        return response
+
+    until = time.time() + current_app.config['DB_REPLICA_STICKY_SECONDS']
+    identity = _current_identity()
+    if identity is not None:
+        with _sticky_lock:
+            _sticky_until[identity] = until
+            if len(_sticky_until) > 10000:
+                now = time.time()
+                for key in [k for k, v in _sticky_until.items() if v <= now]:
+                    del _sticky_until[key]
+    response.headers[READ_AFTER_HEADER] = f'{until:.3f}'
+    return response
+
+
+def _replica_engine(engines):
+    if not has_request_context():
+        return None
+    if g.get('db_use_primary') or g.get('db_wrote'):
+        return None
+    if 'db_replica' in g:
+        return engines.get(g.db_replica) if g.db_replica else None
+
+    g.db_replica = None
+    if (
+        request.method in READ_METHODS
+        and request.blueprint in current_app.config['DB_REPLICA_BLUEPRINTS']
+        and not _is_sticky()
+    ):
+        keys = [key for key in engines if key and key.startswith(REPLICA_BIND_PREFIX)]
+        if keys:
+            g.db_replica = random.choice(keys)
+    return engines.get(g.db_replica) if g.db_replica else None
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                mark_write()
+            else:
+                engine = _replica_engine(self._db.engines)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
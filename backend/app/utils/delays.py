@@ -0,0 +1,189 @@
+# Automatic delay detection
+#
+# detect_delays() evaluates every active trip (app.utils.schedule) in a fixed
+# number of queries, regardless of fleet size:
+#
+#   1. active trips with their route and bus (one joined query)
+#   2. first pickup boarding per route for its active trip (GROUP BY route)
+#   3. one executemany UPDATE of the changed delay estimates
+#   4. for newly late trips: one claiming UPDATE, one recipient lookup and a
+#      bulk insert per late route
+#
+# A trip's delay is the larger of
+#
+#   - start delay: the first pickup's lateness against scheduled_start, or, if
+#     nothing has been picked up and a fresh position shows the bus still at
+#     the start point, how long past scheduled_start it is now;
+#   - arrival delay: now + remaining distance / DELAY_AVERAGE_SPEED_KMH
+#     compared with scheduled_end, from a fresh bus position.
+#
+# With no pickup and no fresh position there is no evidence either way (the
+# tracker may just be offline), so the delay is unknown (None) and nobody is
+# alerted.
+#
+# There are no stop-level schedules, so the route's end point stands in for
+# the last stop's ETA.
+#
+# When the delay reaches DELAY_THRESHOLD_MINUTES the trip is claimed with a
+# conditional UPDATE (delay_notified_at IS NULL), so parents get one alert per
+# trip even with several detectors running, and one `delay` alert per parent
+# on the route is queued in bulk. A parent whose children ride several late
+# buses gets them as one digest (app/utils/digests.py).
+import logging
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, func, or_, update
+
+from app import db
+from app.models import Boarding, Route, Student, Trip
+from app.utils.digests import queue_notifications
+from app.utils.schedule import active_trips
+from app.utils.track import distance_m
+
+logger = logging.getLogger(__name__)
+
+
+def _minutes(delta):
+    return delta.total_seconds() / 60
+
+
+def estimate_delay(trip, route, bus, first_pickup, now, config):
+    """Minutes late (>= 0) for one trip, or None without any evidence either way."""
+    position_fresh = bool(
+        bus and bus.current_latitude is not None and bus.last_location_update
+        and timedelta(0) <= now - bus.last_location_update <= timedelta(minutes=config['DELAY_POSITION_STALE_MINUTES'])
+    )
+    if first_pickup is None and not position_fresh:
+        # Tracker offline and nobody scanned yet: the bus may well be on time
+        return None
+
+    if first_pickup is not None:
+        start_delay = _minutes(first_pickup - trip.scheduled_start)
+    elif route.start_latitude is not None:
+        away = distance_m(bus.current_latitude, bus.current_longitude,
+                          route.start_latitude, route.start_longitude)
+        departed = away > config['DELAY_DEPARTED_RADIUS_M'] and bus.last_location_update >= trip.scheduled_start
+        # Only a bus seen still at the start point is late to leave
+        start_delay = 0 if departed else _minutes(now - trip.scheduled_start)
+    else:
+        start_delay = 0
+
+    arrival_delay = 0
+    if position_fresh and route.end_latitude is not None:
+        remaining_km = distance_m(bus.current_latitude, bus.current_longitude,
+                                  route.end_latitude, route.end_longitude) / 1000
+        eta = now + timedelta(hours=remaining_km / config['DELAY_AVERAGE_SPEED_KMH'])
+        arrival_delay = _minutes(eta - trip.scheduled_end)
+
+    return max(0, round(max(start_delay, arrival_delay)))
+
+
+def first_pickups(trips):
+    """route_id -> earliest pickup for that route's active trip.
+
+    Pickups from ATTENDANCE_EARLY_MINUTES before the start count, as they do
+    for attendance.
+    """
+    if not trips:
+        return {}
+    early = timedelta(minutes=current_app.config['ATTENDANCE_EARLY_MINUTES'])
+    windows = [
+        and_(Boarding.route_id == trip.route_id, Boarding.boarding_time >= trip.scheduled_start - early)
+        for trip in trips
+    ]
+    rows = (
+        db.session.query(Boarding.route_id, func.min(Boarding.boarding_time))
+        .filter(or_(*windows), Boarding.boarding_type == 'pickup')
+        .group_by(Boarding.route_id)
+    )
+    return dict(rows)
+
+
+def _claim(trip_ids, now):
+    """Mark trips as notified; returns the ids this call won."""
+    table = Trip.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(trip_ids), table.c.delay_notified_at.is_(None))
+        .values(delay_notified_at=now)
+        .returning(table.c.id)
+    )
+    return {trip_id for (trip_id,) in result}
+
+
+def notify_delays(late, now):
+    """Alert parents on each newly late (trip, route, minutes). Returns notifications sent."""
+    if not late:
+        return 0
+    won = _claim([trip.id for trip, _, _ in late], now)
+    claimed = [(trip, route, minutes) for trip, route, minutes in late if trip.id in won]
+    if not claimed:
+        return 0
+
+    parents = {}
+    rows = (
+        db.session.query(Student.route_id, Student.parent_id)
+        .filter(Student.route_id.in_([route.id for _, route, _ in claimed]), Student.is_active.is_(True))
+        .distinct()
+    )
+    for route_id, parent_id in rows:
+        parents.setdefault(route_id, []).append(parent_id)
+
+    return queue_notifications([
+        {
+            'recipient_id': parent_id,
+            'sender_id': route.operator_id,
+            'title': f'{route.name} is running late',
+            'message': f'The bus on {route.name} is running about {minutes} minutes behind schedule.',
+            'notification_type': 'delay',
+            'priority': 'high',
+            'related_route_id': route.id
+        }
+        for trip, route, minutes in claimed
+        for parent_id in dict.fromkeys(parents.get(route.id, []))
+    ], now)
+
+
+def detect_delays(now=None):
+    """Evaluate every active trip once. Returns a summary dict."""
+    started = time.perf_counter()
+    config = current_app.config
+    now = now or datetime.utcnow()
+
+    trips = active_trips(at=now)
+    route_ids = [trip.route_id for trip in trips]
+    routes = {
+        route.id: route
+        for route in Route.query.options(db.joinedload(Route.bus)).filter(Route.id.in_(route_ids))
+    } if route_ids else {}
+    pickups = first_pickups(trips)
+
+    changed, late = [], []
+    for trip in trips:
+        route = routes[trip.route_id]
+        minutes = estimate_delay(trip, route, route.bus, pickups.get(trip.route_id), now, config)
+        if minutes != trip.delay_minutes:
+            changed.append({'t_id': trip.id, 't_delay': minutes})
+        if minutes is not None and minutes >= config['DELAY_THRESHOLD_MINUTES'] and trip.delay_notified_at is None:
+            late.append((trip, route, minutes))
+
+    if changed:
+        table = Trip.__table__
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('t_id')).values(delay_minutes=bindparam('t_delay')),
+            changed
+        )
+    sent = notify_delays(late, now)
+    db.session.commit()
+
+    summary = {
+        'trips': len(trips),
+        'late': len(late),
+        'notifications': sent,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+    if late:
+        logger.info('Delay detector: %s', summary)
+    return summary
@@ -0,0 +1,147 @@
+# Notification coalescing and digests
+#
+# Automatic alerts come in bursts: a parent with three children can get a
+# missed-pickup alert per child at the end of one trip, and delay alerts for
+# each of their routes within the same minute. queue_notifications() sits in
+# front of create_notifications() and holds such alerts back for a short
+# window instead of writing them out one by one:
+#
+#   - urgent alerts bypass batching and are created at once
+#   - high priority alerts wait NOTIFICATION_DIGEST_HIGH_WINDOW_SECONDS,
+#     normal and low NOTIFICATION_DIGEST_WINDOW_SECONDS (0 = no batching)
+#
+# Held alerts sit in pending_notifications with the time they are due.
+# flush_digests() (`flask notifications watch`) picks every (recipient, type)
+# group with an alert due, claims the whole group with one DELETE ...
+# RETURNING so concurrent flushers never send an alert twice, and creates one
+# notification per group: the alert itself if it was alone, otherwise a
+# digest listing each message, at the group's highest priority, from the
+# sender of the latest alert. The window is counted from the first alert of a
+# burst, so later ones don't hold it back.
+#
+# Each group is written in its own savepoint: a group the database rejects is
+# logged and dropped instead of rolling back (and holding forever) every
+# other parent's digests.
+import logging
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app import db
+from app.models import PendingNotification
+from app.utils.notifications import create_notifications
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ('low', 'normal', 'high', 'urgent')
+DIGEST_TITLES = {
+    'delay': '{count} delay alerts',
+    'boarding': '{count} boarding alerts',
+    'emergency': '{count} emergency alerts',
+}
+DEFAULT_DIGEST_TITLE = '{count} notifications'
+
+
+def batching_window(priority, config):
+    """Seconds an alert of this priority may be held; 0 sends it at once."""
+    if priority == 'urgent':
+        return 0
+    if priority == 'high':
+        return config['NOTIFICATION_DIGEST_HIGH_WINDOW_SECONDS']
+    return config['NOTIFICATION_DIGEST_WINDOW_SECONDS']
+
+
+def queue_notifications(rows, now=None):
+    """Create or hold notifications given as dicts of Notification columns.
+
+    Same rows as create_notifications(). The caller commits. Returns the
+    number of alerts accepted.
+    """
+    config = current_app.config
+    now = now or datetime.utcnow()
+    immediate, held = [], []
+    for row in rows:
+        window = batching_window(row.get('priority', 'normal'), config)
+        if window <= 0:
+            immediate.append(row)
+        else:
+            held.append({
+                'sender_id': None,
+                'notification_type': 'general',
+                'priority': 'normal',
+                'delivery_method': 'in_app',
+                'related_route_id': None,
+                'related_student_id': None,
+                **row,
+                'created_at': now,
+                'due_at': now + timedelta(seconds=window)
+            })
+    create_notifications(immediate)
+    if held:
+        db.session.execute(PendingNotification.__table__.insert(), held)
+    return len(rows)
+
+
+def _shared(events, column, mixed=None):
+    values = {event[column] for event in events}
+    return values.pop() if len(values) == 1 else mixed
+
+
+def digest(events):
+    """One notification row for a (recipient, type) group of held alerts."""
+    first, latest = events[0], events[-1]
+    if len(events) == 1:
+        return {column: first[column] for column in (
+            'recipient_id', 'sender_id', 'title', 'message', 'notification_type', 'priority',
+            'delivery_method', 'related_route_id', 'related_student_id'
+        )}
+    title = DIGEST_TITLES.get(first['notification_type'], DEFAULT_DIGEST_TITLE)
+    return {
+        'recipient_id': first['recipient_id'],
+        'sender_id': latest['sender_id'],
+        'title': title.format(count=len(events)),
+        'message': '\n'.join(event['message'] for event in events),
+        'notification_type': first['notification_type'],
+        'priority': max((event['priority'] for event in events), key=PRIORITIES.index),
+        'delivery_method': _shared(events, 'delivery_method', mixed='all'),
+        'related_route_id': _shared(events, 'related_route_id'),
+        'related_student_id': _shared(events, 'related_student_id')
+    }
+
+
+def flush_digests(now=None):
+    """Send every group with an alert due, as one notification each. Commits."""
+    started = time.perf_counter()
+    now = now or datetime.utcnow()
+    table = PendingNotification.__table__
+    group = tuple_(table.c.recipient_id, table.c.notification_type)
+    due = select(table.c.recipient_id, table.c.notification_type).where(table.c.due_at <= now).distinct()
+    claimed = db.session.execute(
+        delete(table).where(group.in_(due)).returning(*table.c)
+    ).mappings().all()
+
+    groups = {}
+    for event in sorted(claimed, key=lambda event: event['id']):
+        groups.setdefault((event['recipient_id'], event['notification_type']), []).append(event)
+    sent = dropped = 0
+    for (recipient_id, notification_type), events in groups.items():
+        try:
+            with db.session.begin_nested():
+                sent += create_notifications([digest(events)])
+        except (DataError, IntegrityError):
+            dropped += len(events)
+            logger.exception('Dropping %d held %s alerts to user %s', len(events), notification_type, recipient_id)
+    db.session.commit()
+
+    summary = {
+        'alerts': len(claimed),
+        'notifications': sent,
+        'dropped': dropped,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+    if claimed:
+        logger.info('Notification digests: %s', summary)
+    return summary
@@ -0,0 +1,162 @@
+# Response compression and MessagePack negotiation
+#
+# List payloads (students with nested coordinates, routes embedding their bus)
+# are mostly repeated keys and compress 5-10x. Responses are compressed in an
+# after_request hook when the client sends Accept-Encoding:
+#
+#   - br (brotli) is preferred when the brotli package is installed, then gzip
+#   - only compressible types (JSON, MessagePack, text) of at least
+#     COMPRESSION_MIN_SIZE bytes; below that the headers outweigh the saving
+#   - buffered bodies are compressed in one call; streamed responses are
+#     wrapped in an incremental compressor so they keep streaming
+#
+# Clients that send `Accept: application/msgpack` get MessagePack instead of
+# JSON. The switch happens in the JSON provider's response(), i.e. where
+# jsonify() serializes, so the payload is encoded once in the chosen format.
+# MessagePack needs the msgpack package; without it everyone gets JSON.
+#
+# The hook is registered after the instrumentation, so request metrics record
+# the bytes actually sent.
+import gzip
+import threading
+import zlib
+from collections import Counter
+
+from flask import current_app, has_request_context, request
+
+from app.utils.instrumentation import TimedJSONProvider
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+COMPRESSIBLE = (JSON_MIMETYPE, *MSGPACK_MIMETYPES, 'text/plain', 'text/html', 'text/csv')
+
+
+def negotiated_mimetype():
+    """The response type the client prefers: JSON unless it asks for MessagePack."""
+    if msgpack is None or not has_request_context():
+        return JSON_MIMETYPE
+    # JSON first, so */* and equal preferences stay JSON
+    return request.accept_mimetypes.best_match((JSON_MIMETYPE, *MSGPACK_MIMETYPES), JSON_MIMETYPE)
+
+
+class NegotiatingJSONProvider(TimedJSONProvider):
+    """jsonify() that answers in MessagePack when the client asks for it."""
+
+    def response(self, *args, **kwargs):
+        mimetype = negotiated_mimetype()
+        if mimetype == JSON_MIMETYPE:
+            response = super().response(*args, **kwargs)
+        else:
+            data = self._prepare_response_obj(args, kwargs)
+            body = msgpack.packb(data, default=self.default, use_bin_type=True)
+            response = self._app.response_class(body, mimetype=mimetype)
+        if msgpack is not None:
+            response.vary.add('Accept')
+        return response
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        out = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        out = compressor.process(chunk.encode() if isinstance(chunk, str) else chunk)
+        if out:
+            yield out
+    yield compressor.finish()
+
+
+class ResponseEncoder:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.responses = Counter()  # encoding -> responses
+        self.bytes_in = Counter()  # encoding -> uncompressed bytes
+        self.bytes_out = Counter()  # encoding -> bytes sent
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.json = NegotiatingJSONProvider(app)
+        app.after_request(self._after_request)
+        app.extensions['response_encoder'] = self
+
+    def offered_encodings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def choose_encoding(self, response):
+        config = current_app.config
+        if not config['COMPRESSION_ENABLED'] or 'Content-Encoding' in response.headers:
+            return None
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return None
+        if response.mimetype not in COMPRESSIBLE or response.direct_passthrough:
+            return None
+        if not response.is_streamed and (response.content_length or 0) < config['COMPRESSION_MIN_SIZE']:
+            return None
+        return request.accept_encodings.best_match(self.offered_encodings())
+
+    def _after_request(self, response):
+        encoding = self.choose_encoding(response)
+        if encoding is None:
+            if response.mimetype in COMPRESSIBLE:
+                response.vary.add('Accept-Encoding')
+            return response
+
+        config = current_app.config
+        if response.is_streamed:
+            chunks = response.response
+            if encoding == 'br':
+                response.response = _brotli_stream(chunks, config['COMPRESSION_BROTLI_QUALITY'])
+            else:
+                response.response = _gzip_stream(chunks, config['COMPRESSION_GZIP_LEVEL'])
+            response.headers.pop('Content-Length', None)
+            size = None
+        else:
+            body = response.get_data()
+            if encoding == 'br':
+                compressed = brotli.compress(body, quality=config['COMPRESSION_BROTLI_QUALITY'])
+            else:
+                compressed = gzip.compress(body, compresslevel=config['COMPRESSION_GZIP_LEVEL'], mtime=0)
+            response.set_data(compressed)
+            size = (len(body), len(compressed))
+
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        with self._lock:
+            self.responses[encoding] += 1
+            if size:
+                self.bytes_in[encoding] += size[0]
+                self.bytes_out[encoding] += size[1]
+        return response
+
+    def prometheus_samples(self):
+        with self._lock:
+            encodings = sorted(self.responses)
+            return [
+                ('kiddiebus_http_compressed_responses_total', 'counter',
+                 'Responses sent compressed, by encoding.',
+                 [({'encoding': e}, self.responses[e]) for e in encodings]),
+                ('kiddiebus_http_compression_input_bytes_total', 'counter',
+                 'Uncompressed bytes of buffered compressed responses.',
+                 [({'encoding': e}, self.bytes_in[e]) for e in encodings]),
+                ('kiddiebus_http_compression_output_bytes_total', 'counter',
+                 'Bytes sent for buffered compressed responses.',
+                 [({'encoding': e}, self.bytes_out[e]) for e in encodings]),
+            ]
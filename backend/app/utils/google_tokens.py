@@ -0,0 +1,196 @@
+# Local verification of Google ID tokens
+#
+# google.oauth2.id_token.verify_oauth2_token downloads Google's signing
+# certificates on every call. Here the keys are cached per process for as
+# long as the response's Cache-Control max-age allows, refreshed in a
+# background thread shortly before they expire, and re-fetched on demand when
+# a token is signed with a key id we haven't seen (key rotation). Verifying a
+# token is then a local RS256 signature check plus claim validation.
+#
+# GOOGLE_CERTS_URL accepts either a JWKS document ({"keys": [...]}, Google's
+# v3 endpoint) or a {kid: PEM certificate} map (the v1 endpoint), so a local
+# JWKS stand-in can be used in tests.
+import base64
+import json
+import logging
+import re
+import threading
+import time
+
+import requests
+from google.auth import crypt
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+DEFAULT_MAX_AGE = 3600
+# Start a background refresh when this fraction of the lifetime has passed
+REFRESH_AT = 0.9
+# Minimum seconds between forced refreshes for unknown key ids
+MIN_FORCED_REFRESH_INTERVAL = 30
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def _b64int(segment):
+    return int.from_bytes(_b64decode(segment), 'big')
+
+
+def _der(tag, body):
+    length = len(body)
+    if length < 0x80:
+        return bytes([tag, length]) + body
+    size = (length.bit_length() + 7) // 8
+    return bytes([tag, 0x80 | size]) + length.to_bytes(size, 'big') + body
+
+
+def _der_int(value):
+    return _der(0x02, value.to_bytes(value.bit_length() // 8 + 1, 'big'))
+
+
+def rsa_public_pem(n, e):
+    """PKCS#1 PEM for an RSA public key, the form crypt.RSAVerifier loads."""
+    der = _der(0x30, _der_int(n) + _der_int(e))
+    body = base64.encodebytes(der).decode('ascii').replace('\n', '')
+    lines = [body[i:i + 64] for i in range(0, len(body), 64)]
+    return '\n'.join(['-----BEGIN RSA PUBLIC KEY-----', *lines, '-----END RSA PUBLIC KEY-----', ''])
+
+
+def parse_keys(document):
+    """Map kid -> verifier for a JWKS document or a {kid: PEM} map."""
+    verifiers = {}
+    if 'keys' in document:
+        for jwk in document['keys']:
+            if jwk.get('kty') != 'RSA':
+                continue
+            pem = rsa_public_pem(_b64int(jwk['n']), _b64int(jwk['e']))
+            verifiers[jwk['kid']] = crypt.RSAVerifier.from_string(pem)
+    else:
+        for kid, pem in document.items():
+            verifiers[kid] = crypt.RSAVerifier.from_string(pem)
+    return verifiers
+
+
+def _max_age(response):
+    match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+class GoogleTokenVerifier:
+    def __init__(self, certs_url, http_timeout=5):
+        self.certs_url = certs_url
+        self.http_timeout = http_timeout
+        self._lock = threading.Lock()
+        self._verifiers = {}
+        self._fetched_at = 0.0
+        self._expires_at = 0.0
+        self._last_forced = 0.0
+        self._refreshing = False
+
+    # --- Certificate cache -------------------------------------------------
+
+    def refresh(self):
+        response = requests.get(self.certs_url, timeout=self.http_timeout)
+        response.raise_for_status()
+        verifiers = parse_keys(response.json())
+        now = time.monotonic()
+        with self._lock:
+            self._verifiers = verifiers
+            self._fetched_at = now
+            self._expires_at = now + _max_age(response)
+        return verifiers
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            # Keep serving the cached keys until they actually expire
+            logger.exception('Background refresh of Google certificates failed')
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _verifiers_for(self, kid):
+        now = time.monotonic()
+        with self._lock:
+            verifiers = self._verifiers
+            expired = now >= self._expires_at
+            refresh_due = now >= self._fetched_at + (self._expires_at - self._fetched_at) * REFRESH_AT
+            start_background = refresh_due and not expired and not self._refreshing
+            if start_background:
+                self._refreshing = True
+
+        if expired:
+            verifiers = self.refresh()
+        elif start_background:
+            threading.Thread(target=self._background_refresh, name='google-certs', daemon=True).start()
+
+        if kid not in verifiers:
+            # Google rotated keys before our cache expired
+            with self._lock:
+                allowed = now - self._last_forced >= MIN_FORCED_REFRESH_INTERVAL
+                if allowed:
+                    self._last_forced = now
+            if allowed:
+                verifiers = self.refresh()
+        return verifiers
+
+    # --- Verification ------------------------------------------------------
+
+    def verify(self, token, audience, clock_skew=10):
+        """Return the claims of a valid Google ID token or raise ValueError."""
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        if not isinstance(token, bytes):
+            raise ValueError('Malformed token: not a string')
+        try:
+            signed_section, signature_segment = token.rsplit(b'.', 1)
+            header_segment, payload_segment = signed_section.split(b'.')
+            header = json.loads(_b64decode(header_segment.decode('ascii')))
+            claims = json.loads(_b64decode(payload_segment.decode('ascii')))
+            signature = _b64decode(signature_segment.decode('ascii'))
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ValueError(f'Malformed token: {e}')
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise ValueError('Malformed token: header and payload must be JSON objects')
+
+        if header.get('alg') != 'RS256':
+            raise ValueError('Unsupported token algorithm')
+
+        try:
+            verifiers = self._verifiers_for(header.get('kid'))
+        except requests.RequestException as e:
+            raise ValueError(f'Could not fetch Google certificates: {e}')
+        verifier = verifiers.get(header.get('kid'))
+        if verifier is None:
+            raise ValueError('Token signed with an unknown key')
+        if not verifier.verify(signed_section, signature):
+            raise ValueError('Invalid token signature')
+
+        now = time.time()
+        if not isinstance(claims.get('iat'), (int, float)) or not isinstance(claims.get('exp'), (int, float)):
+            raise ValueError('Token is missing iat/exp')
+        if claims['iat'] > now + clock_skew:
+            raise ValueError('Token used too early')
+        if claims['exp'] < now - clock_skew:
+            raise ValueError('Token expired')
+        if audience and claims.get('aud') != audience:
+            raise ValueError('Token has the wrong audience')
+        if claims.get('iss') not in GOOGLE_ISSUERS:
+            raise ValueError('Wrong issuer')
+        return claims
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier(app):
+    """Process-wide verifier for the app's GOOGLE_CERTS_URL."""
+    global _verifier
+    with _verifier_lock:
+        if _verifier is None or _verifier.certs_url != app.config['GOOGLE_CERTS_URL']:
+            _verifier = GoogleTokenVerifier(app.config['GOOGLE_CERTS_URL'])
+        return _verifier
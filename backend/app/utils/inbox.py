@@ -0,0 +1,127 @@
+# Notification inboxes and read state
+#
+# A notification is read if any of these holds:
+#
+#   - its own is_read flag (set when it is opened)
+#   - for a broadcast, the recipient's broadcast_receipts row has read_at
+#   - its id is at or below the user's read watermark
+#
+# "Mark all as read" only moves the watermark: one read_watermarks row per
+# user holding the highest notification and broadcast ids at that moment,
+# instead of an UPDATE over the whole unread backlog. Unread queries look
+# above the watermark only, using the (recipient_id, is_read, id) index.
+#
+# The watermark is the highest id among the rows the user can see at that
+# moment: their own unread notifications and the broadcasts addressed to
+# them. Ids are allocated at insert but become visible at commit, so "the
+# highest id in the table" would cover a lower-id row still being committed.
+# For notifications mark_all_read() first locks the user's unread counter
+# row, which every insert for that user takes before allocating ids
+# (counters.unread_changed); an insert either commits before the watermark is
+# read or gets an id above it. The counter is then set to zero rather than
+# decremented, so an earlier drift is corrected too.
+#
+# Broadcasts don't touch per-user rows, so a broadcast committing during a
+# mark-all with a lower id than one the user already sees is treated as read.
+# That needs two broadcasts to the same user committing out of order within
+# the same instant; it is not counted anywhere, so nothing drifts.
+from datetime import datetime
+
+from sqlalchemy import func
+
+from app import db
+from app.models import Notification, ReadWatermark
+from app.utils.broadcasts import UNREAD_COUNT_LIMIT, broadcasts_for, count_unread
+from app.utils.counters import lock_unread, reset_unread
+
+
+def watermark_for(user_id):
+    return ReadWatermark.query.get(user_id)
+
+
+def _floors(watermark):
+    return (watermark.notification_id, watermark.broadcast_id) if watermark else (0, 0)
+
+
+def notification_is_read(notification, watermark):
+    return notification.is_read or (watermark is not None and watermark.covers_notification(notification))
+
+
+def _unread_notifications(user_id, floor):
+    return Notification.query.filter(
+        Notification.recipient_id == user_id,
+        Notification.is_read.is_(False),
+        Notification.id > floor
+    )
+
+
+def _count_unread_notifications(user_id, floor, limit=UNREAD_COUNT_LIMIT):
+    """Like count_unread() for broadcasts: stops counting at `limit`."""
+    unread = _unread_notifications(user_id, floor).with_entities(Notification.id).limit(limit).subquery()
+    return db.session.query(func.count()).select_from(unread).scalar()
+
+
+def inbox(user_id, unread_only=False, notification_type=None, limit=50):
+    """(newest notifications and broadcasts as dicts, unread count) for a user."""
+    watermark = watermark_for(user_id)
+    notification_floor, broadcast_floor = _floors(watermark)
+
+    if unread_only:
+        query = _unread_notifications(user_id, notification_floor)
+    else:
+        query = Notification.query.filter_by(recipient_id=user_id)
+    if notification_type:
+        query = query.filter_by(notification_type=notification_type)
+    notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
+
+    # Unread broadcasts are all above the watermark and without a read receipt
+    broadcasts = broadcasts_for(
+        user_id,
+        after_id=broadcast_floor if unread_only else 0,
+        notification_type=notification_type,
+        unread_only=unread_only,
+        limit=limit
+    )
+
+    items = [n.to_dict(watermark) for n in notifications] + [
+        broadcast.to_notification_dict(user_id, receipt, watermark)
+        for broadcast, receipt in broadcasts
+    ]
+    items.sort(key=lambda item: item['created_at'] or '', reverse=True)
+
+    unread = min(_count_unread_notifications(user_id, notification_floor)
+                 + unread_broadcast_count(user_id, watermark), UNREAD_COUNT_LIMIT)
+    return items[:limit], unread
+
+
+def unread_broadcast_count(user_id, watermark=None):
+    watermark = watermark or watermark_for(user_id)
+    return count_unread(user_id, after_id=_floors(watermark)[1])
+
+
+def unread_count(user_id):
+    watermark = watermark_for(user_id)
+    return min(_count_unread_notifications(user_id, _floors(watermark)[0])
+               + unread_broadcast_count(user_id, watermark), UNREAD_COUNT_LIMIT)
+
+
+def mark_all_read(user_id):
+    """Move the user's watermark past everything they can see. The caller commits."""
+    lock_unread(user_id)
+    watermark = watermark_for(user_id)
+    notification_floor, broadcast_floor = _floors(watermark)
+    top_notification = _unread_notifications(user_id, notification_floor).with_entities(
+        func.max(Notification.id)).scalar() or notification_floor
+    latest = broadcasts_for(user_id, after_id=broadcast_floor, include_deleted=True, limit=1)
+    top_broadcast = latest[0][0].id if latest else broadcast_floor
+
+    # Everything unread is now under the watermark
+    reset_unread(user_id)
+
+    if watermark is None:
+        watermark = ReadWatermark(user_id=user_id)
+        db.session.add(watermark)
+    watermark.notification_id = top_notification
+    watermark.broadcast_id = top_broadcast
+    watermark.read_at = datetime.utcnow()
+    return watermark
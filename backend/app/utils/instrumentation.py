@@ -0,0 +1,255 @@
+# Request instrumentation
+#
+# Records, per endpoint: latency histogram, SQL statements and SQL time per
+# request, JSON serialization time and response size. Everything is kept in
+# process memory and rendered in Prometheus text format by GET /api/metrics;
+# each gunicorn worker reports its own numbers.
+#
+# Other subsystems can add their own series with
+# `instrumentation.add_collector(fn)`, where fn() returns a list of
+# (name, type, help, [(labels dict, value), ...]) tuples.
+#
+# The opt-in sampling profiler (PROFILE_SLOW_REQUEST_MS > 0) samples the stack
+# of sampled requests every PROFILE_SAMPLE_INTERVAL_MS and, when a request is
+# slower than the threshold, writes the stacks in collapsed format
+# ("frame;frame;frame count") ready for flamegraph.pl or speedscope. It reads
+# OS thread stacks, which don't show greenlets, so it is switched off under
+# the gevent worker (WEB_WORKER_CLASS=gevent).
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+from app.utils import db_pool
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that adds serialization time to the current request."""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            if has_request_context() and 'instrument_start' in g:
+                g.instrument_serialize_time += time.perf_counter() - started
+
+
+class StackSampler:
+    """Background thread that samples the stacks of registered threads."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._active.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+
+def _greenlet_workers():
+    """True when gevent has patched threading, i.e. requests run in greenlets."""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def _collapse(frame):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+class Instrumentation:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self._queries = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+        self._sql_time = defaultdict(float)
+        self._serialize_time = defaultdict(float)
+        self._sizes = defaultdict(lambda: Histogram(SIZE_BUCKETS))
+        self._responses = Counter()
+        self._collectors = []
+        self._sampler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.config = app.config
+        app.json = TimedJSONProvider(app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        if self._on_query not in db_pool.query_observers:
+            db_pool.query_observers.append(self._on_query)
+        if app.config['PROFILE_SLOW_REQUEST_MS'] and self._sampler is None:
+            if _greenlet_workers():
+                logger.warning('PROFILE_SLOW_REQUEST_MS is set but the stack sampler cannot see '
+                               'greenlets; slow-request profiling is disabled under gevent')
+            else:
+                self._sampler = StackSampler(app.config['PROFILE_SAMPLE_INTERVAL_MS'] / 1000.0)
+        app.extensions['instrumentation'] = self
+
+    def add_collector(self, collector):
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    # --- Request hooks -----------------------------------------------------
+
+    def _before_request(self):
+        g.instrument_start = time.perf_counter()
+        g.instrument_queries = 0
+        g.instrument_sql_time = 0.0
+        g.instrument_serialize_time = 0.0
+        g.instrument_sampled = bool(
+            self._sampler and random.random() < self.config['PROFILE_SAMPLE_RATE']
+        )
+        if g.instrument_sampled:
+            self._sampler.start(threading.get_ident())
+
+    def _on_query(self, statement, elapsed):
+        if has_request_context() and 'instrument_start' in g:
+            g.instrument_queries += 1
+            g.instrument_sql_time += elapsed
+
+    def _after_request(self, response):
+        if 'instrument_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.pop('instrument_start')
+        endpoint = request.endpoint or 'unmatched'
+        key = (endpoint, request.method)
+        size = response.content_length or 0
+
+        with self._lock:
+            self._latency[key].observe(elapsed)
+            self._queries[key].observe(g.instrument_queries)
+            self._sql_time[key] += g.instrument_sql_time
+            self._serialize_time[key] += g.instrument_serialize_time
+            self._sizes[key].observe(size)
+            self._responses[key + (str(response.status_code),)] += 1
+
+        if g.instrument_queries >= self.config['SQL_QUERIES_WARN_THRESHOLD']:
+            logger.warning(
+                '%s %s ran %d SQL statements (%.0f ms); possible N+1',
+                request.method, request.path, g.instrument_queries, g.instrument_sql_time * 1000
+            )
+
+        if g.pop('instrument_sampled', False):
+            stacks = self._sampler.stop(threading.get_ident())
+            if stacks and elapsed * 1000 >= self.config['PROFILE_SLOW_REQUEST_MS']:
+                self._dump_profile(endpoint, elapsed, stacks)
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request is skipped when a view raises; don't leak the sampler slot
+        if g.pop('instrument_sampled', False):
+            self._sampler.stop(threading.get_ident())
+
+    def _dump_profile(self, endpoint, elapsed, stacks):
+        directory = self.config['PROFILE_OUTPUT_DIR']
+        os.makedirs(directory, exist_ok=True)
+        filename = f'{int(time.time() * 1000)}-{endpoint.replace(".", "_")}-{int(elapsed * 1000)}ms.folded'
+        path = os.path.join(directory, filename)
+        with open(path, 'w') as fh:
+            for stack, count in stacks.most_common():
+                fh.write(f'{stack} {count}\n')
+        logger.warning('Slow request %s (%.0f ms); profile written to %s', endpoint, elapsed * 1000, path)
+
+    # --- Prometheus exposition ---------------------------------------------
+
+    def render_prometheus(self):
+        lines = []
+
+        def header(name, metric_type, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+        def histogram(name, help_text, series):
+            header(name, 'histogram', help_text)
+            for (endpoint, method), hist in sorted(series.items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f'{name}_sum{{{labels}}} {hist.sum}')
+                lines.append(f'{name}_count{{{labels}}} {hist.count}')
+
+        def counter(name, help_text, series):
+            header(name, 'counter', help_text)
+            for (endpoint, method), value in sorted(series.items()):
+                lines.append(f'{name}{{endpoint="{endpoint}",method="{method}"}} {value}')
+
+        with self._lock:
+            histogram('kiddiebus_request_duration_seconds', 'Request latency.', self._latency)
+            histogram('kiddiebus_request_sql_queries', 'SQL statements per request.', self._queries)
+            counter('kiddiebus_request_sql_seconds_total', 'Time spent in SQL.', self._sql_time)
+            counter('kiddiebus_request_serialize_seconds_total', 'Time spent serializing JSON.', self._serialize_time)
+            histogram('kiddiebus_response_size_bytes', 'Response body size.', self._sizes)
+
+            header('kiddiebus_responses_total', 'counter', 'Responses by status code.')
+            for (endpoint, method, status), value in sorted(self._responses.items()):
+                lines.append(
+                    f'kiddiebus_responses_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {value}'
+                )
+
+        for collector in self._collectors:
+            for name, metric_type, help_text, samples in collector():
+                header(name, metric_type, help_text)
+                for labels, value in samples:
+                    label_text = ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+                    lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,501 @@
+# Background jobs: schedules, a durable queue and worker pools
+#
+# Periodic work (delay detection, attendance, digests, counters, retention)
+# runs in `flask jobs worker` processes instead of one hand-rolled watch loop
+# per Procfile entry. Jobs are declared in app/jobs.py with @job:
+#
+#   @job('trips.materialize', cron='10 0 * * *', pool='maintenance')
+#   @job('delays.detect', every='DELAY_DETECTOR_INTERVAL_SECONDS')
+#
+# cron is the usual five fields (minute hour day month weekday, 0 = Sunday)
+# in SCHEDULE_TIMEZONE; every is seconds, or the name of a config setting.
+# enabled names a boolean setting that must be on for the schedule to run;
+# the job can still be enqueued by hand when it is off.
+#
+# Every run is a row in `jobs`:
+#
+#   - the scheduler inserts one row per schedule tick with a dedupe key
+#     (name@tick) and ON CONFLICT DO NOTHING, so a tick is enqueued once
+#     however many nodes run it. Only the elected leader schedules; a new
+#     leader enqueues the latest tick it finds missed within
+#     JOBS_SCHEDULE_LOOKBACK_MINUTES, missed ticks are not replayed one by one
+#   - workers claim due rows with UPDATE ... RETURNING (FOR UPDATE SKIP
+#     LOCKED on PostgreSQL) and take a lease of the job's timeout. A row
+#     whose lease ran out (the worker died) is claimed again, so every run
+#     happens at least once; jobs must be safe to repeat
+#   - failures are retried with backoff up to max_attempts
+#
+# Each pool (JOBS_POOLS) is a thread pool of fixed size, and a worker only
+# claims as many rows as its pools have free threads, so a slow archive run
+# can't starve the one-minute jobs.
+#
+# Leader election and singleton jobs use PostgreSQL advisory locks held on a
+# dedicated connection: the scheduler leader holds one for as long as it
+# lives, and a singleton job (the default) holds its own while it runs. If a
+# node dies its connection closes and the lock passes on. Without
+# PostgreSQL the locks are per-process, which is enough for one worker.
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import and_, case, func, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import db
+from app.models import Job
+from app.utils.schedule import schedule_zone
+
+logger = logging.getLogger(__name__)
+
+JOBS = {}  # name -> JobDefinition
+LOCK_NAMESPACE = 0x6B62  # first key of the two-key advisory lock form
+FINISHED = ('done', 'failed', 'skipped')
+
+
+# --- Schedules -------------------------------------------------------------
+
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+
+def _cron_field(spec, low, high):
+    values = set()
+    for part in spec.split(','):
+        part, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-'))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f'Cron field {spec!r} is out of range {low}-{high}')
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class Cron:
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'Cron expression {expression!r} needs 5 fields')
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            _cron_field(spec, low, high) for spec, (low, high) in zip(fields, CRON_FIELDS)
+        )
+        # As in cron, day and weekday both restricted means either may match
+        self.either_day = fields[2] != '*' and fields[4] != '*'
+
+    def matches(self, local):
+        if local.minute not in self.minutes or local.hour not in self.hours or local.month not in self.months:
+            return False
+        day, weekday = local.day in self.days, local.isoweekday() % 7 in self.weekdays
+        return (day or weekday) if self.either_day else (day and weekday)
+
+    def latest_tick(self, now, lookback_minutes):
+        """The latest matching minute in [now - lookback, now], as naive UTC."""
+        zone = schedule_zone()
+        local = now.replace(tzinfo=timezone.utc).astimezone(zone).replace(second=0, microsecond=0)
+        for minutes in range(lookback_minutes + 1):
+            candidate = local - timedelta(minutes=minutes)
+            if self.matches(candidate):
+                return candidate.astimezone(timezone.utc).replace(tzinfo=None)
+        return None
+
+    def __str__(self):
+        return f'cron {self.expression}'
+
+
+class Every:
+    def __init__(self, seconds):
+        self.seconds = seconds  # int, or a config setting name
+
+    def interval(self):
+        if isinstance(self.seconds, str):
+            return current_app.config[self.seconds]
+        return self.seconds
+
+    def latest_tick(self, now, lookback_minutes):
+        interval = self.interval()
+        epoch = int(now.replace(tzinfo=timezone.utc).timestamp())
+        return datetime.utcfromtimestamp(epoch - epoch % interval)
+
+    def __str__(self):
+        return f'every {self.seconds}s' if isinstance(self.seconds, int) else f'every {self.seconds}'
+
+
+class JobDefinition:
+    def __init__(self, name, fn, schedule=None, pool='default', singleton=True, max_attempts=3, timeout=600,
+                 enabled=None):
+        self.name = name
+        self.fn = fn
+        self.schedule = schedule
+        self.enabled = enabled  # config setting gating the schedule, or None
+        self.pool = pool
+        self.singleton = singleton
+        self.max_attempts = max_attempts
+        self.timeout = timeout  # seconds; the lease on a claimed run
+
+    @property
+    def scheduled(self):
+        return self.schedule is not None and (self.enabled is None or bool(current_app.config[self.enabled]))
+
+
+def job(name, cron=None, every=None, pool='default', singleton=True, max_attempts=3, timeout=600, enabled=None):
+    """Register fn as a background job, optionally on a cron or interval schedule."""
+    if cron and every:
+        raise ValueError('A job has either a cron or an interval schedule')
+    schedule = Cron(cron) if cron else Every(every) if every else None
+
+    def register(fn):
+        JOBS[name] = JobDefinition(name, fn, schedule, pool, singleton, max_attempts, timeout, enabled)
+        return fn
+    return register
+
+
+# --- Queue -----------------------------------------------------------------
+
+def _insert_ignoring_duplicates(rows):
+    insert = pg_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    statement = insert(Job.__table__).on_conflict_do_nothing(index_elements=['dedupe_key'])
+    return db.session.execute(statement, rows)
+
+
+def _job_row(name, args=None, run_at=None, dedupe_key=None, now=None):
+    now = now or datetime.utcnow()
+    return {
+        'name': name,
+        'args': json.dumps(args) if args else None,
+        'status': 'queued',
+        'run_at': run_at or now,
+        'dedupe_key': dedupe_key,
+        'attempts': 0,
+        'max_attempts': JOBS[name].max_attempts,
+        'created_at': now
+    }
+
+
+def enqueue(name, args=None, run_at=None, dedupe_key=None):
+    """Queue a run of a registered job. The caller commits."""
+    if name not in JOBS:
+        raise KeyError(f'Unknown job {name!r}')
+    if dedupe_key:
+        _insert_ignoring_duplicates([_job_row(name, args, run_at, dedupe_key)])
+    else:
+        db.session.execute(Job.__table__.insert(), [_job_row(name, args, run_at)])
+
+
+class Scheduler:
+    """Enqueues schedule ticks; only the elected leader calls tick()."""
+
+    def __init__(self):
+        self._last = {}  # name -> last tick enqueued by this process
+
+    def tick(self, now=None):
+        """Enqueue every job whose latest tick isn't queued yet. Commits; returns the names."""
+        now = now or datetime.utcnow()
+        lookback = current_app.config['JOBS_SCHEDULE_LOOKBACK_MINUTES']
+        ticks = {}
+        for definition in JOBS.values():
+            if not definition.scheduled:
+                continue
+            tick = definition.schedule.latest_tick(now, lookback)
+            if tick is not None and self._last.get(definition.name) != tick:
+                ticks[definition.name] = tick
+        if not ticks:
+            return []
+        _insert_ignoring_duplicates([
+            _job_row(name, run_at=tick, now=now, dedupe_key=f'{name}@{tick:%Y-%m-%dT%H:%M:%S}')
+            for name, tick in ticks.items()
+        ])
+        db.session.commit()
+        self._last.update(ticks)
+        return list(ticks)
+
+
+def claim(names, limit, worker_id, now=None):
+    """Lease up to `limit` due runs of `names`. Commits; returns [(id, name, args, attempts, max_attempts)]."""
+    if not names or limit <= 0:
+        return []
+    now = now or datetime.utcnow()
+    table = Job.__table__
+    due = (
+        select(table.c.id)
+        .where(
+            table.c.name.in_(names),
+            or_(
+                and_(table.c.status == 'queued', table.c.run_at <= now),
+                and_(table.c.status == 'running', table.c.locked_until < now,
+                     table.c.attempts < table.c.max_attempts)
+            )
+        )
+        .order_by(table.c.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    lease = case(
+        {name: now + timedelta(seconds=JOBS[name].timeout) for name in names},
+        value=table.c.name
+    )
+    rows = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(due))
+        .values(status='running', locked_by=worker_id, locked_until=lease,
+                attempts=table.c.attempts + 1, started_at=now)
+        .returning(table.c.id, table.c.name, table.c.args, table.c.attempts, table.c.max_attempts)
+    ).all()
+    db.session.commit()
+    return [tuple(row) for row in rows]
+
+
+def _finish(job_id, worker_id, status, error=None, run_at=None):
+    table = Job.__table__
+    values = {'status': status, 'locked_until': None, 'last_error': error}
+    if status == 'queued':
+        values['run_at'] = run_at
+    else:
+        values['finished_at'] = datetime.utcnow()
+    # A run whose lease expired and was claimed elsewhere is no longer ours to settle
+    db.session.execute(
+        update(table).where(table.c.id == job_id, table.c.locked_by == worker_id).values(**values)
+    )
+    db.session.commit()
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(30 * 2 ** (attempts - 1), 3600))
+
+
+def execute(app, claimed, worker_id):
+    """Run one claimed job in its own app context and record the outcome."""
+    job_id, name, args, attempts, max_attempts = claimed
+    definition = JOBS[name]
+    with app.app_context():
+        lock = AdvisoryLock(f'job:{name}') if definition.singleton else None
+        try:
+            if lock is not None and not lock.try_acquire():
+                _finish(job_id, worker_id, 'skipped', 'Another run of this job is in progress')
+                return
+            started = time.perf_counter()
+            try:
+                result = definition.fn(**json.loads(args or '{}'))
+            except Exception as exc:
+                db.session.rollback()
+                logger.exception('Job %s (%s) failed, attempt %d of %d', name, job_id, attempts, max_attempts)
+                error = f'{type(exc).__name__}: {exc}'[:2000]
+                if attempts < max_attempts:
+                    _finish(job_id, worker_id, 'queued', error, datetime.utcnow() + retry_delay(attempts))
+                else:
+                    _finish(job_id, worker_id, 'failed', error)
+                return
+            _finish(job_id, worker_id, 'done')
+            logger.info('Job %s (%s) done in %.0f ms: %s', name, job_id,
+                        (time.perf_counter() - started) * 1000, result)
+        finally:
+            if lock is not None:
+                lock.release()
+            db.session.remove()
+
+
+def prune_jobs(days=None, now=None):
+    """Delete finished runs older than JOBS_RETENTION_DAYS and give up on abandoned ones. Commits."""
+    now = now or datetime.utcnow()
+    days = days if days is not None else current_app.config['JOBS_RETENTION_DAYS']
+    # Leases that ran out on the last attempt are never claimed again
+    abandoned = Job.query.filter(
+        Job.status == 'running', Job.locked_until < now, Job.attempts >= Job.max_attempts
+    ).update({'status': 'failed', 'finished_at': now, 'last_error': 'Lease expired on the last attempt'},
+             synchronize_session=False)
+    deleted = Job.query.filter(
+        Job.status.in_(FINISHED), Job.finished_at < now - timedelta(days=days)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return {'deleted': deleted, 'abandoned': abandoned}
+
+
+def job_status():
+    """Registered jobs with their schedule and latest run."""
+    latest = {}
+    newest = (
+        db.session.query(Job.name, func.max(Job.id).label('id'))
+        .group_by(Job.name)
+        .subquery()
+    )
+    for row in Job.query.join(newest, Job.id == newest.c.id):
+        latest[row.name] = row
+    return [
+        {
+            'name': name,
+            'schedule': str(definition.schedule) if definition.scheduled else None,
+            'pool': definition.pool,
+            'singleton': definition.singleton,
+            'last_run': latest[name].to_dict() if name in latest else None
+        }
+        for name, definition in sorted(JOBS.items())
+    ]
+
+
+# --- Locks -----------------------------------------------------------------
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def _lock_key(name):
+    key = zlib.crc32(name.encode())
+    return key - 2 ** 32 if key >= 2 ** 31 else key  # int4
+
+
+class AdvisoryLock:
+    """A named lock across nodes: a PostgreSQL advisory lock, or per-process elsewhere."""
+
+    def __init__(self, name):
+        self.name = name
+        self.held = False
+        self._connection = None
+        self._local = None
+
+    def try_acquire(self):
+        if self.held:
+            return self._still_held()
+        if db.engine.dialect.name != 'postgresql':
+            with _local_locks_guard:
+                self._local = _local_locks.setdefault(self.name, threading.Lock())
+            self.held = self._local.acquire(blocking=False)
+            return self.held
+        # The lock lives as long as this connection's session
+        connection = db.engine.connect()
+        try:
+            acquired = connection.execute(
+                text('SELECT pg_try_advisory_lock(:namespace, :key)'),
+                {'namespace': LOCK_NAMESPACE, 'key': _lock_key(self.name)}
+            ).scalar()
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self._connection, self.held = connection, True
+        return True
+
+    def _still_held(self):
+        if self._connection is None:
+            return True
+        try:
+            self._connection.execute(text('SELECT 1'))
+            self._connection.commit()
+            return True
+        except Exception:
+            # The connection died, and the lock with it
+            logger.warning('Lost advisory lock %s', self.name)
+            self._connection.invalidate()
+            self._connection, self.held = None, False
+            return False
+
+    def release(self):
+        if not self.held:
+            return
+        self.held = False
+        if self._local is not None:
+            self._local.release()
+            return
+        connection, self._connection = self._connection, None
+        try:
+            connection.execute(
+                text('SELECT pg_advisory_unlock(:namespace, :key)'),
+                {'namespace': LOCK_NAMESPACE, 'key': _lock_key(self.name)}
+            )
+            connection.commit()
+        finally:
+            connection.close()
+
+
+# --- Worker ----------------------------------------------------------------
+
+def parse_pools(spec):
+    """'default=4,maintenance=1' -> {'default': 4, 'maintenance': 1}"""
+    pools = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, size = part.partition('=')
+        pools[name.strip()] = int(size or 1)
+    return pools
+
+
+class Worker:
+    def __init__(self, app, pools=None, schedule=True):
+        self.app = app
+        self.pools = pools or parse_pools(app.config['JOBS_POOLS'])
+        self.schedule = schedule
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.scheduler = Scheduler()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = Counter()
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def _done(self, pool):
+        def callback(future):
+            with self._lock:
+                self._in_flight[pool] -= 1
+            if future.exception() is not None:
+                logger.error('Job runner crashed', exc_info=future.exception())
+        return callback
+
+    def run_once(self, executors, leader):
+        """One scheduling and claiming pass."""
+        if self.schedule and leader.try_acquire():
+            self.scheduler.tick()
+        for pool, size in self.pools.items():
+            names = [name for name, definition in JOBS.items() if definition.pool == pool]
+            with self._lock:
+                free = size - self._in_flight[pool]
+            for claimed in claim(names, free, self.worker_id):
+                with self._lock:
+                    self._in_flight[pool] += 1
+                executors[pool].submit(execute, self.app, claimed, self.worker_id).add_done_callback(self._done(pool))
+
+    def run(self):
+        unknown = {definition.pool for definition in JOBS.values()} - set(self.pools)
+        if unknown:
+            logger.warning('No threads for job pools %s; their jobs will not run here', ', '.join(sorted(unknown)))
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        executors = {
+            pool: ThreadPoolExecutor(max_workers=size, thread_name_prefix=f'jobs-{pool}')
+            for pool, size in self.pools.items()
+        }
+        interval = self.app.config['JOBS_POLL_SECONDS']
+        logger.info('Job worker %s started with pools %s', self.worker_id, self.pools)
+        with self.app.app_context():
+            leader = AdvisoryLock('scheduler')
+            try:
+                while not self._stop.is_set():
+                    try:
+                        self.run_once(executors, leader)
+                    except Exception:
+                        db.session.rollback()
+                        logger.exception('Job worker pass failed')
+                    finally:
+                        db.session.remove()
+                    self._stop.wait(interval)
+            finally:
+                # Let running jobs finish; their leases cover a hard kill
+                for executor in executors.values():
+                    executor.shutdown(wait=True)
+                leader.release()
+                logger.info('Job worker %s stopped', self.worker_id)
@@ -0,0 +1,59 @@
+# In-process change notification for long-polling clients
+#
+# Handlers that wait for a change (e.g. a parent waiting for the next bus
+# location) block on a condition here instead of holding a DB connection.
+# Under the gevent worker the threading primitives are monkey-patched, so a
+# waiting request costs a greenlet rather than a worker. Updates made by other
+# workers arrive through the change-event bus (app/utils/change_events.py) on
+# PostgreSQL; waiters still re-check the database every
+# LONG_POLL_RECHECK_SECONDS in case a notification is lost.
+import threading
+import time
+
+
+class ChangeBroker:
+    """Per-key version counters with a condition variable per key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conditions = {}
+        self._versions = {}
+
+    def _condition(self, key):
+        with self._lock:
+            condition = self._conditions.get(key)
+            if condition is None:
+                condition = self._conditions[key] = threading.Condition()
+            return condition
+
+    def publish(self, key):
+        condition = self._condition(key)
+        with condition:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            condition.notify_all()
+
+    def version(self, key):
+        return self._versions.get(key, 0)
+
+    def wait(self, key, version, timeout):
+        """Block until `key` moves past `version` or `timeout` seconds pass.
+
+        Returns True if a change was published.
+        """
+        condition = self._condition(key)
+        deadline = time.monotonic() + timeout
+        with condition:
+            while self._versions.get(key, 0) == version:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                condition.wait(remaining)
+            return True
+
+
+bus_locations = ChangeBroker()
+
+
+def wake_bus_waiters(change):
+    """Change-event subscriber: a bus row or its location changed in some worker."""
+    bus_locations.publish(change['entity_id'])
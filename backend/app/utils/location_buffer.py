@@ -0,0 +1,278 @@
+# Write-behind buffer for bus location pings
+#
+# Trackers send a fix every few seconds and only the latest one per bus
+# matters, so PUT /api/buses/<id>/location stores the fix in a per-bus map and
+# returns 202 straight away. A background thread writes the map to the
+# database in one executemany UPDATE every LOCATION_FLUSH_INTERVAL_MS, or
+# sooner once LOCATION_FLUSH_MAX_UPDATES pings have arrived, so the row-update
+# rate follows the number of buses rather than the ping rate.
+#
+# Durability: pending fixes are flushed when the worker exits (atexit and
+# gunicorn's worker_exit hook). If flushing falls behind or the database is
+# unavailable, a ping that finds a fix older than LOCATION_MAX_STALENESS_MS
+# flushes inline, so requests slow down instead of the map silently aging.
+# A crash can lose at most one flush interval of fixes, which the next ping
+# replaces anyway. Batches that fail because the database is unreachable are
+# requeued; any other failure means a fix the database rejects, so the batch
+# is retried bus by bus and the rejected fixes are dropped rather than
+# blocking every later flush.
+#
+# Every fix (not just the latest) is also appended to bus_positions in the
+# same transaction when LOCATION_HISTORY_ENABLED, for trip replay.
+#
+# The UPDATE only applies a fix newer than the stored one, so workers
+# flushing out of order never move a bus backwards. Long-poll waiters are
+# woken after the flush, once the new location is readable; waiters in other
+# workers through a transient change event sent with the commit.
+#
+# LOCATION_FLUSH_INTERVAL_MS=0 writes through synchronously (tests), in the
+# request's own app context so the write counts for read-your-writes.
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, or_, update
+from sqlalchemy.exc import OperationalError, TimeoutError
+
+from app.utils.change_events import change_events
+from app.utils.live import bus_locations
+
+logger = logging.getLogger(__name__)
+
+
+def _transient(exc):
+    """Errors worth retrying the same batch for: the database, not the data."""
+    return isinstance(exc, (OperationalError, TimeoutError)) or getattr(exc, 'connection_invalidated', False)
+
+
+class LocationBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # bus_id -> (latitude, longitude, reported_at)
+        self._flushing = {}  # the batch being written, still readable via latest()
+        self._history = []  # every fix since the last flush
+        self._pending_since = None
+        self._since_flush = 0
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._app = None
+        self._atexit_registered = False
+        self.known_buses = set()
+        self.accepted = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.flush_errors = 0
+        self.fixes_dropped = 0
+
+    def init_app(self, app):
+        self._app = app
+        self.known_buses = set()
+        if not self._atexit_registered:
+            atexit.register(self._flush_at_exit)
+            self._atexit_registered = True
+
+    @property
+    def write_through(self):
+        return not self._app.config['LOCATION_FLUSH_INTERVAL_MS']
+
+    def _ensure_thread(self):
+        # One flusher per gunicorn worker, started after fork
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._run, name='location-flush', daemon=True)
+                    self._thread.start()
+
+    def submit(self, bus_id, latitude, longitude, reported_at=None):
+        """Record the latest fix for a bus."""
+        self.submit_many([(bus_id, latitude, longitude, reported_at or datetime.utcnow(), None, None)])
+
+    def submit_many(self, fixes):
+        """Record (bus_id, latitude, longitude, reported_at, speed, heading) fixes."""
+        config = self._app.config
+        now = time.monotonic()
+        with self._lock:
+            if self._pending_since is None:
+                self._pending_since = now
+            for fix in fixes:
+                bus_id, latitude, longitude, reported_at = fix[:4]
+                self._history.append(fix)
+                current = self._pending.get(bus_id)
+                if current is None or current[2] <= reported_at:
+                    self._pending[bus_id] = (latitude, longitude, reported_at)
+                self._since_flush += 1
+                self.accepted += 1
+            backlog = self._since_flush >= config['LOCATION_FLUSH_MAX_UPDATES']
+            stale = (now - self._pending_since) * 1000 >= config['LOCATION_MAX_STALENESS_MS']
+
+        if self.write_through or stale:
+            self.flush()
+            return
+        self._ensure_thread()
+        if backlog:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def latest(self, bus_ids):
+        """Fixes this worker holds that may not be in the database yet.
+
+        Returns {bus_id: (latitude, longitude, reported_at)}; callers overlay
+        them on the stored position when newer.
+        """
+        with self._lock:
+            found = {}
+            for bus_id in bus_ids:
+                fix = self._pending.get(bus_id) or self._flushing.get(bus_id)
+                if fix is not None:
+                    found[bus_id] = fix
+            return found
+
+    def _run(self):
+        while True:
+            interval = self._app.config['LOCATION_FLUSH_INTERVAL_MS'] / 1000.0
+            self._wakeup.wait(interval or 1.0)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing buffered bus locations failed')
+
+    def flush(self):
+        """Write all pending fixes in one statement. Returns the number written."""
+        if self._app is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+                history, self._history = self._history, []
+                pending_since, self._pending_since = self._pending_since, None
+                self._since_flush = 0
+            if not batch:
+                return 0
+
+            try:
+                written = self._write(batch, history)
+            except Exception as e:
+                self.flush_errors += 1
+                if _transient(e):
+                    self._requeue(batch, history, pending_since)
+                    raise
+                # A bad fix would fail every later batch too; write buses one
+                # at a time and drop the ones the database rejects
+                logger.exception('Location flush failed; retrying bus by bus')
+                batch, written = self._write_each(batch, history, pending_since)
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+            self.flushes += 1
+            self.rows_written += written
+        for bus_id in batch:
+            bus_locations.publish(bus_id)
+        return written
+
+    def _write(self, batch, history):
+        from app import db
+        from app.models import Bus, BusPosition
+        table = Bus.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam('b_id'))
+            .where(or_(table.c.last_location_update.is_(None),
+                       table.c.last_location_update < bindparam('b_at')))
+            .values(current_latitude=bindparam('b_lat'),
+                    current_longitude=bindparam('b_lng'),
+                    last_location_update=bindparam('b_at'))
+        )
+        params = [
+            {'b_id': bus_id, 'b_lat': lat, 'b_lng': lng, 'b_at': at}
+            for bus_id, (lat, lng, at) in batch.items()
+        ]
+
+        def write():
+            db.session.execute(statement, params)
+            if history and self._app.config['LOCATION_HISTORY_ENABLED']:
+                db.session.execute(BusPosition.__table__.insert(), [
+                    {'bus_id': bus_id, 'recorded_at': at, 'latitude': lat,
+                     'longitude': lng, 'speed': speed, 'heading': heading}
+                    for bus_id, lat, lng, at, speed, heading in history
+                ])
+            change_events.announce(db.session, 'bus_location', batch)
+            db.session.commit()
+
+        # A request writing through (or flushing inline) keeps its own context,
+        # so the write is recorded in its g for read-your-writes routing
+        if has_app_context() and current_app._get_current_object() is self._app:
+            try:
+                write()
+            except Exception:
+                db.session.rollback()
+                raise
+        else:
+            with self._app.app_context():
+                try:
+                    write()
+                finally:
+                    db.session.remove()
+        return len(params)
+
+    def _write_each(self, batch, history, pending_since):
+        """Write each bus separately; returns (the batch that was written, rows)."""
+        written = {}
+        for bus_id, entry in batch.items():
+            fixes = [fix for fix in history if fix[0] == bus_id]
+            try:
+                self._write({bus_id: entry}, fixes)
+            except Exception as e:
+                if _transient(e):
+                    self._requeue({bus_id: entry}, fixes, pending_since)
+                    continue
+                self.fixes_dropped += max(len(fixes), 1)
+                logger.exception('Dropping buffered location for bus %s: %r', bus_id, entry)
+            else:
+                written[bus_id] = entry
+        return written, len(written)
+
+    def _requeue(self, batch, history, pending_since):
+        # Keep failed fixes unless a newer one arrived meanwhile
+        with self._lock:
+            for bus_id, entry in batch.items():
+                self._pending.setdefault(bus_id, entry)
+            self._history[:0] = history
+            self._pending_since = pending_since
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Could not flush buffered bus locations at exit')
+
+    def prometheus_samples(self):
+        return [
+            ('kiddiebus_location_updates_accepted_total', 'counter',
+             'Bus location pings accepted.', [({}, self.accepted)]),
+            ('kiddiebus_location_rows_written_total', 'counter',
+             'Bus rows updated by location flushes.', [({}, self.rows_written)]),
+            ('kiddiebus_location_flushes_total', 'counter',
+             'Batched location flushes.', [({}, self.flushes)]),
+            ('kiddiebus_location_flush_errors_total', 'counter',
+             'Location flushes that failed.', [({}, self.flush_errors)]),
+            ('kiddiebus_location_fixes_dropped_total', 'counter',
+             'Buffered fixes the database rejected and were dropped.', [({}, self.fixes_dropped)]),
+            ('kiddiebus_location_pending', 'gauge',
+             'Buses with a fix waiting to be written.', [({}, self.pending())]),
+        ]
+
+
+location_buffer = LocationBuffer()
@@ -0,0 +1,60 @@
+# Brute-force protection for password logins
+#
+# Failed attempts are counted in a sliding window per account (email) and per
+# client IP. Once either passes its limit, further attempts are refused with
+# 429 until the oldest failure ages out of the window. Counters are kept per
+# worker process, which bounds an attacker to limit * workers attempts per
+# window.
+import threading
+import time
+from collections import deque
+
+MAX_TRACKED_KEYS = 50000
+
+
+class LoginThrottle:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = {}
+
+    def _recent(self, key, window, now):
+        attempts = self._failures.get(key)
+        if attempts is None:
+            return None
+        while attempts and attempts[0] <= now - window:
+            attempts.popleft()
+        if not attempts:
+            del self._failures[key]
+            return None
+        return attempts
+
+    def retry_after(self, limits, now=None):
+        """Seconds until an attempt is allowed, or 0.
+
+        `limits` is a list of (key, max_failures, window_seconds).
+        """
+        now = now or time.monotonic()
+        wait = 0
+        with self._lock:
+            for key, max_failures, window in limits:
+                attempts = self._recent(key, window, now)
+                if attempts and len(attempts) >= max_failures:
+                    wait = max(wait, int(attempts[-max_failures] + window - now) + 1)
+        return wait
+
+    def record_failure(self, keys, now=None):
+        now = now or time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._failures.setdefault(key, deque(maxlen=1000)).append(now)
+            if len(self._failures) > MAX_TRACKED_KEYS:
+                # Forget keys with no failure in the last hour
+                for key in [k for k, v in self._failures.items() if v[-1] <= now - 3600]:
+                    del self._failures[key]
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+login_throttle = LoginThrottle()
@@ -0,0 +1,59 @@
+# Bulk notification creation
+#
+# Broadcasts and automatic alerts can address thousands of parents at once.
+# Building one ORM object per recipient costs a Python object, an identity-map
+# entry and (on some drivers) a round trip each; notify_many() inserts the rows
+# with a single executemany instead. create_notifications() does the same for
+# alerts whose text differs per recipient.
+from datetime import datetime
+
+from app import db
+from app.models import Notification
+from app.utils.counters import unread_changed
+
+
+def _defaults(now):
+    return {
+        'sender_id': None,
+        'notification_type': 'general',
+        'priority': 'normal',
+        'delivery_method': 'in_app',
+        'related_route_id': None,
+        'related_student_id': None,
+        'is_read': False,
+        'sms_sent': False,
+        'email_sent': False,
+        'created_at': now
+    }
+
+
+def create_notifications(rows):
+    """Insert notifications given as dicts of Notification columns.
+
+    Each row needs recipient_id, title and message; other columns default as
+    on the model. The caller commits. Returns the number created.
+    """
+    if not rows:
+        return 0
+    base = _defaults(datetime.utcnow())
+    unread = {}
+    for row in rows:
+        if not row.get('is_read'):
+            unread[row['recipient_id']] = unread.get(row['recipient_id'], 0) + 1
+    # Counters first, so the ids are allocated under the counter row locks
+    unread_changed(unread)
+    db.session.execute(Notification.__table__.insert(), [{**base, **row} for row in rows])
+    return len(rows)
+
+
+def notify_many(recipient_ids, sender_id, title, message, **fields):
+    """Insert one notification per recipient. Returns the number created.
+
+    `fields` are extra Notification columns (notification_type, priority,
+    delivery_method, related_route_id, ...). The caller commits.
+    """
+    shared = {'sender_id': sender_id, 'title': title, 'message': message, **fields}
+    return create_notifications([
+        {**shared, 'recipient_id': recipient_id}
+        for recipient_id in dict.fromkeys(recipient_ids)
+    ])
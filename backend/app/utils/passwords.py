@@ -0,0 +1,115 @@
+# Password hashing off the request path
+#
+# bcrypt is deliberately CPU-bound. Hashing inline inside a gunicorn worker
+# means a 7am login storm starves every other request on that worker, so
+# hashes are computed in a small per-worker process pool instead. At most
+# AUTH_HASH_MAX_PENDING hash jobs may be queued or running; beyond that new
+# requests are rejected immediately with HashingBusy (503 + Retry-After)
+# rather than queueing without bound.
+#
+# AUTH_HASH_WORKERS=0 hashes inline (tests, CLI).
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from flask import current_app
+
+
+class HashingBusy(Exception):
+    """The hash pool is saturated; the caller should retry later."""
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(password_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        # Malformed hash
+        return False
+
+
+def hash_rounds(password_hash):
+    """Cost factor of a bcrypt hash ($2b$12$...), or None if unparseable."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class HashPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._slots = None
+
+    def _get_executor(self, workers, max_pending):
+        # One pool per gunicorn worker process, created after fork
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+                self._slots = threading.BoundedSemaphore(max_pending)
+            return self._executor
+
+    def run(self, fn, *args):
+        config = current_app.config
+        workers = config['AUTH_HASH_WORKERS']
+        if not workers:
+            return fn(*args)
+
+        executor = self._get_executor(workers, config['AUTH_HASH_MAX_PENDING'])
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            slots.release()
+            self._reset(executor)
+            raise HashingBusy()
+        except BaseException:
+            slots.release()
+            raise
+        # The slot is held until the job really finishes, even if we stop waiting
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            return future.result(timeout=config['AUTH_HASH_TIMEOUT'])
+        except FutureTimeout:
+            future.cancel()
+            raise HashingBusy()
+        except BrokenProcessPool:
+            # A hashing process died; start a fresh pool for the next request
+            self._reset(executor)
+            raise HashingBusy()
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+
+hash_pool = HashPool()
+
+
+def generate_password_hash(password):
+    return hash_pool.run(_hash_password, password, current_app.config['BCRYPT_LOG_ROUNDS'])
+
+
+def check_password_hash(password_hash, password):
+    return hash_pool.run(_check_password, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    return hash_rounds(password_hash) != current_app.config['BCRYPT_LOG_ROUNDS']
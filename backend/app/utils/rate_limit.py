@@ -0,0 +1,187 @@
+# Token-bucket rate limiting and priority load shedding for write endpoints
+#
+# Each limited endpoint names a rule in RATE_LIMITS:
+#
+#   'location': {'priority': 'telemetry', 'identity': (50, 200), 'device': (1, 5)}
+#
+# `identity` and `device` are (tokens per second, burst) buckets keyed by the
+# JWT identity and by identity plus a device id (e.g. the bus id for tracker
+# pings). Buckets are charged before the view authorizes the request, so the
+# device bucket includes the identity: otherwise any signed-in user could
+# drain a bus's bucket with requests that would be refused anyway, and lock
+# out its real tracker. A request over either bucket gets 429 with Retry-After.
+#
+# Independently of the buckets, when the worker is overloaded (share of the
+# primary's connection pool in use, or in-flight requests over
+# LOAD_SHED_MAX_INFLIGHT) lower-priority requests are shed with 503 first:
+# telemetry, then normal. Critical traffic such as check-ins is never shed.
+#
+# Buckets live in process memory unless RATE_LIMIT_STORAGE_URL points at a
+# Redis server shared by all workers (requires the `redis` package).
+import math
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.pool import QueuePool
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, rate, burst, cost=1, now=None):
+        """Take `cost` tokens. Returns (allowed, seconds until allowed)."""
+        now = now or time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return True, 0.0
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > 100000:
+                self._prune(now)
+            return False, (cost - tokens) / rate
+
+    def _prune(self, now):
+        # Buckets untouched for 10 minutes are full again; drop them
+        stale = [key for key, (_, updated) in self._buckets.items() if now - updated > 600]
+        for key in stale:
+            del self._buckets[key]
+
+
+class RedisBackend:
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local cost = tonumber(ARGV[4])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    local retry = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    else
+        retry = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(retry)}
+    """
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst, cost=1, now=None):
+        allowed, retry = self._script(
+            keys=[f'kiddiebus:rl:{key}'],
+            args=[rate, burst, now or time.time(), cost]
+        )
+        return bool(allowed), float(retry)
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.backend = None
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self.rejected = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get('RATE_LIMIT_STORAGE_URL')
+        self.backend = RedisBackend(url) if url else MemoryBackend()
+        app.before_request(self._enter)
+        app.teardown_request(self._leave)
+        app.extensions['rate_limiter'] = self
+
+    def _enter(self):
+        with self._lock:
+            self._inflight += 1
+
+    def _leave(self, exc):
+        with self._lock:
+            self._inflight -= 1
+
+    def load(self):
+        """Current load as a fraction (1.0 = saturated)."""
+        from app import db
+        config = current_app.config
+        load = self._inflight / config['LOAD_SHED_MAX_INFLIGHT']
+        pool = db.engine.pool
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + max(config['DB_MAX_OVERFLOW'], 0)
+            load = max(load, pool.checkedout() / capacity)
+        return load
+
+    def should_shed(self, priority):
+        threshold = current_app.config['LOAD_SHED_THRESHOLDS'].get(priority)
+        return threshold is not None and self.load() >= threshold
+
+    def check(self, rule_name, device_id=None):
+        """Return an error response if the request must be refused, else None."""
+        config = current_app.config
+        if not config['RATE_LIMIT_ENABLED']:
+            return None
+        rule = config['RATE_LIMITS'][rule_name]
+
+        if self.should_shed(rule['priority']):
+            self.rejected[(rule_name, 'shed')] += 1
+            return jsonify({'error': 'Server is busy, please retry'}), 503, {'Retry-After': '5'}
+
+        buckets = []
+        identity = get_jwt_identity()
+        if 'identity' in rule and identity is not None:
+            buckets.append((f'{rule_name}:user:{identity}', rule['identity']))
+        if 'device' in rule and device_id is not None:
+            buckets.append((f'{rule_name}:device:{identity}:{device_id}', rule['device']))
+
+        for key, (rate, burst) in buckets:
+            allowed, retry_after = self.backend.take(key, rate, burst)
+            if not allowed:
+                self.rejected[(rule_name, 'limited')] += 1
+                return (
+                    jsonify({'error': 'Rate limit exceeded', 'retry_after': math.ceil(retry_after)}),
+                    429,
+                    {'Retry-After': str(max(1, math.ceil(retry_after)))}
+                )
+        return None
+
+    def prometheus_samples(self):
+        return [(
+            'kiddiebus_rate_limit_rejections_total', 'counter',
+            'Requests refused by rate limiting (limited) or load shedding (shed).',
+            [({'rule': rule, 'reason': reason}, count) for (rule, reason), count in sorted(self.rejected.items())]
+        ), (
+            'kiddiebus_inflight_requests', 'gauge', 'Requests currently being handled by this worker.',
+            [({}, self._inflight)]
+        )]
+
+
+def rate_limit(rule_name, device_arg=None):
+    """Apply RATE_LIMITS[rule_name] to a view. Place below @jwt_required()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            limiter = current_app.extensions['rate_limiter']
+            device_id = kwargs.get(device_arg) if device_arg else None
+            if device_id is None:
+                device_id = request.headers.get('X-Device-Id')
+            refused = limiter.check(rule_name, device_id)
+            if refused is not None:
+                return refused
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
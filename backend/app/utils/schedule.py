@@ -0,0 +1,190 @@
+# Route schedules and materialized trips
+#
+# Route.days_of_week stays the API-facing "mon,tue,..." string; Route.days_mask
+# mirrors it as a bitmask (bit 0 = Monday ... bit 6 = Sunday, matching
+# date.weekday()) so "routes running on a weekday" is an integer test in SQL
+# instead of string parsing in Python.
+#
+# Routes' scheduled times are local wall-clock times in SCHEDULE_TIMEZONE.
+# materialize_trips() turns them into concrete `trips` rows for the next
+# TRIP_HORIZON_DAYS, with start/end stored as naive UTC like every other
+# timestamp in the database. A nightly `flask trips materialize` rolls the
+# horizon forward, and route edits refresh that route's future trips
+# immediately.
+#
+# active_trips() is the shared "what is running now" query for live features.
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from flask import current_app
+from app import db
+
+DAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+ALL_DAYS = (1 << len(DAY_NAMES)) - 1
+# Longest trip we expect; bounds the range scan in active_trips()
+MAX_TRIP_DURATION = timedelta(hours=12)
+
+
+def days_to_mask(days):
+    """Bitmask for "mon,tue" / ["mon", "tue"] (full names and any case accepted)."""
+    if not days:
+        return 0
+    if isinstance(days, str):
+        days = days.split(',')
+    mask = 0
+    for day in days:
+        key = day.strip().lower()[:3]
+        if key in DAY_NAMES:
+            mask |= 1 << DAY_NAMES.index(key)
+    return mask
+
+
+def mask_to_days(mask):
+    return [name for i, name in enumerate(DAY_NAMES) if mask & (1 << i)]
+
+
+def day_bit(day):
+    return 1 << day.weekday()
+
+
+def schedule_zone():
+    return ZoneInfo(current_app.config['SCHEDULE_TIMEZONE'])
+
+
+def local_today():
+    return datetime.now(schedule_zone()).date()
+
+
+def to_utc(service_date, local_time):
+    """Naive UTC datetime for a local wall-clock time on a service date."""
+    local = datetime.combine(service_date, local_time, tzinfo=schedule_zone())
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_utc(value):
+    """Naive UTC datetime from an ISO timestamp; a "Z" or other offset is converted.
+
+    Raises ValueError like datetime.fromisoformat().
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def trip_window(route, service_date):
+    """(start, end) in naive UTC for a route on a date, or None if unscheduled."""
+    if not route.scheduled_start_time:
+        return None
+    start = to_utc(service_date, route.scheduled_start_time)
+    if route.scheduled_end_time:
+        end = to_utc(service_date, route.scheduled_end_time)
+        if end <= start:
+            end += timedelta(days=1)
+    else:
+        end = start + timedelta(minutes=current_app.config['TRIP_DEFAULT_DURATION_MINUTES'])
+    return start, end
+
+
+def scheduled_routes(service_date, route_ids=None):
+    from app.models import Route
+    query = Route.query.filter(
+        Route.status == 'active',
+        Route.days_mask.op('&')(day_bit(service_date)) != 0,
+        Route.scheduled_start_time.isnot(None)
+    )
+    if route_ids is not None:
+        query = query.filter(Route.id.in_(route_ids))
+    return query.all()
+
+
+def materialize_trips(days=None, start_date=None, route_ids=None):
+    """Create, update and drop future trips so they match the route schedules.
+
+    Trips that have already started are left alone. Returns counts of
+    created / updated / removed trips.
+    """
+    from app.models import Trip
+
+    days = days if days is not None else current_app.config['TRIP_HORIZON_DAYS']
+    start_date = start_date or local_today()
+    end_date = start_date + timedelta(days=days)
+    now = datetime.utcnow()
+
+    existing_query = Trip.query.filter(Trip.service_date >= start_date, Trip.service_date < end_date)
+    if route_ids is not None:
+        existing_query = existing_query.filter(Trip.route_id.in_(route_ids))
+    existing = {(trip.route_id, trip.service_date): trip for trip in existing_query}
+
+    created = updated = removed = 0
+    wanted = set()
+    for offset in range(days):
+        service_date = start_date + timedelta(days=offset)
+        for route in scheduled_routes(service_date, route_ids):
+            start, end = trip_window(route, service_date)
+            key = (route.id, service_date)
+            wanted.add(key)
+            trip = existing.get(key)
+            if trip is None:
+                db.session.add(Trip(
+                    route_id=route.id, bus_id=route.bus_id, operator_id=route.operator_id,
+                    service_date=service_date, scheduled_start=start, scheduled_end=end
+                ))
+                created += 1
+            elif trip.scheduled_start > now and (
+                trip.scheduled_start, trip.scheduled_end, trip.bus_id, trip.operator_id
+            ) != (start, end, route.bus_id, route.operator_id):
+                trip.scheduled_start, trip.scheduled_end = start, end
+                trip.bus_id, trip.operator_id = route.bus_id, route.operator_id
+                updated += 1
+
+    for key, trip in existing.items():
+        if key not in wanted and trip.scheduled_start > now:
+            db.session.delete(trip)
+            removed += 1
+
+    from app.utils.counters import refresh_trip_counters
+    refresh_trip_counters(now)
+    db.session.commit()
+    return {'created': created, 'updated': updated, 'removed': removed}
+
+
+def refresh_route_trips(route_id):
+    """Re-materialize one route's trips after it was edited."""
+    return materialize_trips(route_ids=[route_id])
+
+
+def trips_query(operator_id=None):
+    from app.models import Trip
+    # Trip.to_dict() reads the route's name and direction
+    query = Trip.query.options(db.joinedload(Trip.route)).filter(Trip.status != 'cancelled')
+    if operator_id is not None:
+        query = query.filter(Trip.operator_id == operator_id)
+    return query
+
+
+def todays_trips(operator_id=None, service_date=None):
+    from app.models import Trip
+    service_date = service_date or local_today()
+    return (
+        trips_query(operator_id)
+        .filter(Trip.service_date == service_date)
+        .order_by(Trip.scheduled_start)
+        .all()
+    )
+
+
+def active_trips(at=None, operator_id=None):
+    """Trips whose scheduled window contains `at` (naive UTC, default now)."""
+    from app.models import Trip
+    at = at or datetime.utcnow()
+    return (
+        trips_query(operator_id)
+        .filter(
+            Trip.scheduled_start <= at,
+            Trip.scheduled_start > at - MAX_TRIP_DURATION,
+            Trip.scheduled_end > at
+        )
+        .order_by(Trip.scheduled_start)
+        .all()
+    )
@@ -0,0 +1,298 @@
+# Bus track queries for trip replay
+#
+# A week of 5-second fixes is ~120k rows per bus. Tracks are reduced in two
+# steps before they leave the server:
+#
+#   1. Time bucketing in SQL: for windows longer than max_points buckets the
+#      fixes are averaged per bucket, so the database returns at most
+#      max_points rows.
+#   2. Douglas-Peucker simplification in Python drops points that lie within
+#      `tolerance` metres of the simplified line (straight stretches, stops).
+#
+# The result is encoded as a Google encoded polyline (precision 5) plus the
+# point timestamps as seconds since the first point, delta-encoded with the
+# same varint scheme, so a trip fits in a few kilobytes.
+#
+# Boardings are placed on the track by interpolating the bucketed (not
+# simplified) series at the boarding time. They come from the hot table and
+# the boarding archive, since positions outlive BOARDING_HOT_MONTHS.
+#
+# A route's track follows the bus recorded on its trips: the window is split
+# where a trip starts on a different bus than the one before it, so a
+# reassigned route doesn't replay its current bus for the earlier trips.
+import math
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import Integer, and_, cast, func, or_
+
+from app import db
+from app.models import Boarding, BusPosition, Student, Trip
+from app.utils.boarding_archive import COLUMNS, archived_boardings
+from app.utils.schedule import parse_utc
+
+EARTH_RADIUS_M = 6371000
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch(value):
+    return (value - EPOCH).total_seconds()
+
+
+def from_epoch(seconds):
+    return datetime.utcfromtimestamp(seconds)
+
+
+def _epoch_column(column):
+    if db.engine.dialect.name == 'postgresql':
+        return cast(func.extract('epoch', column), Integer)
+    return cast(func.strftime('%s', column), Integer)
+
+
+def parse_window(args, max_days):
+    """(start, end) in naive UTC from ?start=&end= ISO timestamps; defaults to the last day."""
+    try:
+        end = parse_utc(args['end']) if args.get('end') else datetime.utcnow()
+        start = parse_utc(args['start']) if args.get('start') else end - timedelta(days=1)
+    except ValueError:
+        raise ValueError('start and end must be ISO timestamps')
+    if start >= end:
+        raise ValueError('start must be before end')
+    if end - start > timedelta(days=max_days):
+        raise ValueError(f'Window is limited to {max_days} days')
+    return start, end
+
+
+def bucket_seconds(start, end, max_points):
+    """Bucket width so that [start, end) yields at most max_points buckets."""
+    return max(1, math.ceil(to_epoch(end) - to_epoch(start)) // max_points + 1)
+
+
+def load_track(bus_id, start, end, max_points, spans=None):
+    """Return (bucket width, [(epoch seconds, lat, lng)]) for a bus and window.
+
+    spans ([(bus_id, start, end)]) follows several buses through the window
+    instead of one.
+    """
+    bucket = bucket_seconds(start, end, max_points)
+    base = db.session.query(BusPosition).filter(or_(*[
+        and_(BusPosition.bus_id == span_bus, BusPosition.recorded_at >= span_start,
+             BusPosition.recorded_at < span_end)
+        for span_bus, span_start, span_end in spans or [(bus_id, start, end)]
+    ]))
+    if bucket == 1:
+        rows = (
+            base.with_entities(BusPosition.recorded_at, BusPosition.latitude, BusPosition.longitude)
+            .order_by(BusPosition.recorded_at)
+            .all()
+        )
+        return bucket, [(to_epoch(at), lat, lng) for at, lat, lng in rows]
+
+    epoch = _epoch_column(BusPosition.recorded_at)
+    slot = (epoch // bucket).label('slot')
+    rows = (
+        base.with_entities(slot, func.min(epoch), func.avg(BusPosition.latitude), func.avg(BusPosition.longitude))
+        .group_by(slot)
+        .order_by(slot)
+        .all()
+    )
+    return bucket, [(float(first), float(lat), float(lng)) for _, first, lat, lng in rows]
+
+
+def route_spans(route, start, end):
+    """[(bus_id, start, end)] covering the window with the bus of each trip on the route."""
+    trips = (
+        db.session.query(Trip.bus_id, Trip.scheduled_start)
+        .filter(Trip.route_id == route.id, Trip.status != 'cancelled', Trip.bus_id.isnot(None),
+                Trip.scheduled_start < end, Trip.scheduled_end > start)
+        .order_by(Trip.scheduled_start)
+        .all()
+    )
+    if not trips:
+        return [(route.bus_id, start, end)] if route.bus_id else []
+    spans = []
+    for bus_id, trip_start in trips:
+        if spans and spans[-1][0] == bus_id:
+            continue
+        at = max(start, trip_start) if spans else start
+        if spans:
+            spans[-1][2] = at
+        spans.append([bus_id, at, end])
+    return [tuple(span) for span in spans]
+
+
+def window_boardings(start, end, bus_id=None, route_id=None):
+    """Hot and archived boardings in [start, end) as row dicts, oldest first."""
+    names = [name for name, _ in COLUMNS]
+    query = Boarding.query.with_entities(*[getattr(Boarding, name) for name in names]).filter(
+        Boarding.boarding_time >= start,
+        Boarding.boarding_time < end
+    )
+    if bus_id is not None:
+        query = query.filter(Boarding.bus_id == bus_id)
+    if route_id is not None:
+        query = query.filter(Boarding.route_id == route_id)
+    rows = [dict(zip(names, row)) for row in query]
+    rows += archived_boardings(bus_id=bus_id, route_id=route_id, start=start, end=end,
+                               exclude_ids={row['id'] for row in rows})
+    rows.sort(key=lambda row: row['boarding_time'])
+    return rows
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Equirectangular distance; accurate to well under 1% over a city."""
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS_M
+
+
+def simplify(points, tolerance_m):
+    """Douglas-Peucker over (t, lat, lng) points; keeps the endpoints."""
+    if len(points) < 3 or tolerance_m <= 0:
+        return list(points)
+
+    # Project to local metres once so the inner loop is plain arithmetic
+    lat0 = math.radians(points[0][1])
+    scale_x = math.cos(lat0) * EARTH_RADIUS_M * math.pi / 180
+    scale_y = EARTH_RADIUS_M * math.pi / 180
+    xy = [(lng * scale_x, lat * scale_y) for _, lat, lng in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        max_distance, index = 0.0, None
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            if length:
+                distance = abs(dy * px - dx * py + x2 * y1 - y2 * x1) / length
+            else:
+                distance = math.hypot(px - x1, py - y1)
+            if distance > max_distance:
+                max_distance, index = distance, i
+        if index is not None and max_distance > tolerance_m:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def position_at(points, t):
+    """Interpolated (lat, lng) at epoch t, or None outside the track."""
+    if not points or t < points[0][0] or t > points[-1][0]:
+        return None
+    lo, hi = 0, len(points) - 1
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if points[mid][0] <= t:
+            lo = mid
+        else:
+            hi = mid
+    t1, lat1, lng1 = points[lo]
+    t2, lat2, lng2 = points[hi]
+    if t2 == t1:
+        return lat1, lng1
+    f = (t - t1) / (t2 - t1)
+    return lat1 + (lat2 - lat1) * f, lng1 + (lng2 - lng1) * f
+
+
+def _encode_signed(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(coordinates, precision=5):
+    """Google encoded polyline for [(lat, lng), ...]."""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lng = 0
+    for lat, lng in coordinates:
+        lat, lng = round(lat * factor), round(lng * factor)
+        _encode_signed(lat - prev_lat, out)
+        _encode_signed(lng - prev_lng, out)
+        prev_lat, prev_lng = lat, lng
+    return ''.join(out)
+
+
+def encode_deltas(values):
+    """Integers delta-encoded with the polyline varint scheme."""
+    out = []
+    previous = 0
+    for value in values:
+        _encode_signed(value - previous, out)
+        previous = value
+    return ''.join(out)
+
+
+def replay(bus_id, start, end, boardings, tolerance_m, max_points, spans=None):
+    """Downsampled, encoded track for a bus with `boardings` (row dicts) placed on it."""
+    bucket, points = load_track(bus_id, start, end, max_points, spans)
+    simplified = simplify(points, tolerance_m)
+    origin = simplified[0][0] if simplified else to_epoch(start)
+
+    student_ids = {boarding['student_id'] for boarding in boardings}
+    names = {
+        student_id: f'{first_name} {last_name}'
+        for student_id, first_name, last_name in db.session.query(
+            Student.id, Student.first_name, Student.last_name
+        ).filter(Student.id.in_(student_ids))
+    } if student_ids else {}
+
+    placed = []
+    for boarding in boardings:
+        t = to_epoch(boarding['boarding_time'])
+        position = position_at(points, t)
+        lat, lng = boarding['latitude'], boarding['longitude']
+        reported = (lat, lng) if lat and lng else None
+        placed.append({
+            'id': boarding['id'],
+            'student_id': boarding['student_id'],
+            'student_name': names.get(boarding['student_id']),
+            'route_id': boarding['route_id'],
+            'boarding_type': boarding['boarding_type'],
+            'boarding_time': boarding['boarding_time'].isoformat(),
+            'offset': round(t - origin),
+            'reported_location': {'latitude': reported[0], 'longitude': reported[1]} if reported else None,
+            'bus_location': {
+                'latitude': round(position[0], 6),
+                'longitude': round(position[1], 6)
+            } if position else None,
+            # How far the check-in location was from the bus track
+            'distance_m': round(distance_m(*reported, *position)) if reported and position else None
+        })
+
+    result = {
+        'bus_id': bus_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'bucket_seconds': bucket,
+        'tolerance_m': tolerance_m,
+        'points_bucketed': len(points),
+        'points': len(simplified),
+        'origin': from_epoch(origin).isoformat(),
+        'polyline': encode_polyline((lat, lng) for _, lat, lng in simplified),
+        'offsets': encode_deltas(round(t - origin) for t, _, _ in simplified),
+        'boardings': placed
+    }
+    if spans is not None:
+        result['buses'] = [
+            {'bus_id': span_bus, 'start': span_start.isoformat(), 'end': span_end.isoformat()}
+            for span_bus, span_start, span_end in spans
+        ]
+    return result
+
+
+def prune_positions(days=None, now=None):
+    """Delete fixes older than LOCATION_HISTORY_RETENTION_DAYS. Commits; returns (deleted, cutoff)."""
+    days = days if days is not None else current_app.config['LOCATION_HISTORY_RETENTION_DAYS']
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    deleted = BusPosition.query.filter(BusPosition.recorded_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted, cutoff
@@ -0,0 +1,198 @@
+# Synthetic city-scale dataset for benchmarks
+#
+# Deterministic for a given seed: the same preset always produces the same
+# operators, schools, buses, routes, parents, students, notifications and
+# boarding history, so runs are comparable against a stored baseline.
+import random
+from datetime import datetime, time, timedelta
+
+from app import db, bcrypt
+from app.models import User, School, Bus, Route, Student, Notification, Boarding
+from app.utils.schedule import days_to_mask, materialize_trips
+
+PRESETS = {
+    'small': {
+        'operators': 3, 'schools': 8, 'buses': 20, 'students': 400,
+        'boarding_months': 1, 'notifications_per_parent': 5,
+    },
+    'city': {
+        'operators': 12, 'schools': 60, 'buses': 180, 'students': 6000,
+        'boarding_months': 3, 'notifications_per_parent': 20,
+    },
+}
+
+# Around Mandeville, Manchester
+CENTER_LAT, CENTER_LON = 18.0417, -77.5071
+PASSWORD = 'benchmark'
+CHUNK = 5000
+
+
+def _insert(model, rows):
+    for i in range(0, len(rows), CHUNK):
+        db.session.execute(model.__table__.insert(), rows[i:i + CHUNK])
+
+
+def _reset_sequences():
+    # Rows above were inserted with explicit ids; move Postgres sequences past them
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in (User, School, Bus, Route, Student):
+        table = model.__tablename__
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"
+        ))
+
+
+def _school_days(months, today):
+    days = []
+    day = today - timedelta(days=30 * months)
+    while day < today:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def generate(preset='small', seed=42, now=None):
+    """Drop and recreate every table, then fill it. Returns a summary dict."""
+    spec = PRESETS[preset]
+    rng = random.Random(seed)
+    now = now or datetime.utcnow().replace(microsecond=0)
+
+    db.drop_all()
+    db.create_all()
+
+    # One bcrypt hash shared by every account keeps generation fast
+    password_hash = bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+
+    users = [{
+        'id': 1, 'email': 'admin@bench.local', 'password_hash': password_hash,
+        'first_name': 'Bench', 'last_name': 'Admin', 'role': 'admin',
+        'is_active': True, 'created_at': now, 'updated_at': now,
+    }]
+    operator_ids = []
+    for i in range(spec['operators']):
+        user_id = len(users) + 1
+        operator_ids.append(user_id)
+        users.append({
+            'id': user_id, 'email': f'operator{i}@bench.local', 'password_hash': password_hash,
+            'first_name': 'Operator', 'last_name': str(i), 'company_name': f'Bus Co {i}',
+            'role': 'operator', 'is_active': True, 'created_at': now, 'updated_at': now,
+        })
+
+    parent_count = max(1, int(spec['students'] / 1.6))
+    parent_ids = []
+    for i in range(parent_count):
+        user_id = len(users) + 1
+        parent_ids.append(user_id)
+        users.append({
+            'id': user_id, 'email': f'parent{i}@bench.local', 'password_hash': password_hash,
+            'first_name': 'Parent', 'last_name': str(i), 'phone': f'876-555-{i % 10000:04d}',
+            'role': 'parent', 'is_active': True, 'created_at': now, 'updated_at': now,
+        })
+    _insert(User, users)
+
+    schools = [{
+        'id': i + 1, 'name': f'School {i}', 'address': f'{i} Main Road',
+        'operator_id': operator_ids[i % len(operator_ids)], 'is_active': True,
+        'city': 'Mandeville', 'parish': 'Manchester', 'created_at': now, 'updated_at': now,
+    } for i in range(spec['schools'])]
+    _insert(School, schools)
+
+    buses = [{
+        'id': i + 1, 'registration_number': f'PB{i:05d}', 'capacity': rng.choice([25, 30, 45, 60]),
+        'make': 'Toyota', 'model': 'Coaster', 'year': rng.randint(2008, 2024),
+        'status': 'active' if rng.random() > 0.05 else 'maintenance',
+        'current_latitude': CENTER_LAT + rng.uniform(-0.1, 0.1),
+        'current_longitude': CENTER_LON + rng.uniform(-0.1, 0.1),
+        'last_location_update': now - timedelta(seconds=rng.randint(0, 600)),
+        'created_at': now, 'updated_at': now,
+    } for i in range(spec['buses'])]
+    _insert(Bus, buses)
+
+    # A morning and an afternoon route per bus
+    routes = []
+    for bus in buses:
+        operator_id = operator_ids[bus['id'] % len(operator_ids)]
+        start_minute = rng.randint(0, 45)
+        for morning in (True, False):
+            routes.append({
+                'id': len(routes) + 1, 'name': f"{bus['registration_number']} {'AM' if morning else 'PM'}",
+                'bus_id': bus['id'], 'operator_id': operator_id,
+                'start_location': 'Depot', 'end_location': 'School',
+                'start_latitude': CENTER_LAT, 'start_longitude': CENTER_LON,
+                'end_latitude': CENTER_LAT + 0.02, 'end_longitude': CENTER_LON + 0.02,
+                'scheduled_start_time': time(6, start_minute) if morning else time(14, start_minute),
+                'scheduled_end_time': time(7, 30 + start_minute % 30) if morning else time(15, 30 + start_minute % 30),
+                'days_of_week': 'mon,tue,wed,thu,fri', 'days_mask': days_to_mask('mon,tue,wed,thu,fri'), 'status': 'active', 'is_morning_route': morning,
+                'created_at': now, 'updated_at': now,
+            })
+    _insert(Route, routes)
+    morning_routes = [r for r in routes if r['is_morning_route']]
+
+    students = []
+    for i in range(spec['students']):
+        route = morning_routes[i % len(morning_routes)]
+        students.append({
+            'id': i + 1, 'first_name': f'Child{i}', 'last_name': 'Bench',
+            'grade': str(rng.randint(1, 11)), 'parent_id': parent_ids[i % len(parent_ids)],
+            'route_id': route['id'], 'school_id': rng.randint(1, len(schools)),
+            'card_id': f'C{i:07d}',
+            'pickup_address': f'{i} Hill Road',
+            'pickup_latitude': CENTER_LAT + rng.uniform(-0.1, 0.1),
+            'pickup_longitude': CENTER_LON + rng.uniform(-0.1, 0.1),
+            'dropoff_address': 'School',
+            'dropoff_latitude': CENTER_LAT + 0.02, 'dropoff_longitude': CENTER_LON + 0.02,
+            'is_active': True, 'created_at': now, 'updated_at': now,
+        })
+    _insert(Student, students)
+
+    notifications = []
+    for parent_id in parent_ids:
+        for n in range(spec['notifications_per_parent']):
+            notifications.append({
+                'sender_id': operator_ids[parent_id % len(operator_ids)], 'recipient_id': parent_id,
+                'title': 'Bus update', 'message': 'Your bus is running a few minutes late this morning.',
+                'notification_type': rng.choice(['general', 'delay', 'boarding']),
+                'priority': 'normal', 'is_read': rng.random() < 0.7, 'delivery_method': 'in_app',
+                'created_at': now - timedelta(hours=n * 6),
+            })
+    _insert(Notification, notifications)
+
+    # Two boardings per student per school day
+    boardings = []
+    for day in _school_days(spec['boarding_months'], now.date()):
+        for student in students:
+            if rng.random() < 0.08:
+                continue  # absent
+            route = routes[student['route_id'] - 1]
+            pickup = datetime.combine(day, route['scheduled_start_time']) + timedelta(minutes=rng.randint(0, 40))
+            for boarding_type, when in (('pickup', pickup), ('dropoff', pickup + timedelta(minutes=rng.randint(20, 50)))):
+                boardings.append({
+                    'student_id': student['id'], 'bus_id': route['bus_id'], 'route_id': route['id'],
+                    'boarding_type': boarding_type, 'boarding_time': when,
+                    'latitude': student['pickup_latitude'], 'longitude': student['pickup_longitude'],
+                    'verified_by_id': route['operator_id'], 'verification_method': 'card',
+                    'created_at': when,
+                })
+        if len(boardings) >= CHUNK * 4:
+            _insert(Boarding, boardings)
+            boardings = []
+    _insert(Boarding, boardings)
+    _reset_sequences()
+    db.session.commit()
+    trips = materialize_trips()
+
+    return {
+        'preset': preset,
+        'seed': seed,
+        'operators': len(operator_ids),
+        'parents': len(parent_ids),
+        'schools': len(schools),
+        'buses': len(buses),
+        'routes': len(routes),
+        'students': len(students),
+        'trips': trips['created'],
+        'notifications': len(notifications),
+        'boardings': db.session.query(db.func.count(Boarding.id)).scalar(),
+    }
@@ -0,0 +1,79 @@
+# Response encoding benchmark: bytes and CPU per endpoint (run from backend/)
+#
+#   python -m benchmarks.encoding --repeat 20
+#
+# Requests a few list-heavy endpoints as plain JSON, gzip and brotli JSON, and
+# MessagePack (plain and brotli), and reports the body size and server CPU
+# time per request for each. Uses the benchmark database; generate it first
+# with `python -m benchmarks.run --generate`.
+import argparse
+import sys
+import time
+
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db
+from app.models import Route, User
+from app.utils import encoding
+
+VARIANTS = {
+    'json': {},
+    'json+gzip': {'Accept-Encoding': 'gzip'},
+    'json+br': {'Accept-Encoding': 'br'},
+    'msgpack': {'Accept': 'application/msgpack'},
+    'msgpack+br': {'Accept': 'application/msgpack', 'Accept-Encoding': 'br'},
+}
+
+
+def endpoints(route_id):
+    return [
+        ('operator', '/api/students'),
+        ('operator', '/api/routes'),
+        ('operator', '/api/buses'),
+        ('operator', f'/api/routes/{route_id}/students'),
+        ('operator', '/api/trips/today'),
+        ('parent', '/api/dashboard/parent'),
+    ]
+
+
+def measure(client, path, headers, repeat):
+    client.get(path, headers=headers)  # warm up
+    cpu = time.process_time()
+    for _ in range(repeat):
+        response = client.get(path, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError(f'{path}: {response.status_code} {response.get_data()[:200]!r}')
+    return len(response.get_data()), (time.process_time() - cpu) / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Response size and CPU by encoding')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    missing = [name for name, module in (('brotli', encoding.brotli), ('msgpack', encoding.msgpack)) if module is None]
+    if missing:
+        parser.error(f'Install {" and ".join(missing)} to compare every encoding')
+
+    app = create_app('benchmark')
+    with app.app_context():
+        users = {role: User.query.filter_by(role=role).first() for role in ('operator', 'parent')}
+        route_id = db.session.query(Route.id).order_by(Route.id).first()
+        if not all(users.values()) or not route_id:
+            parser.error('Dataset is empty; run `python -m benchmarks.run --generate` first')
+        tokens = {role: f'Bearer {create_access_token(identity=str(user.id))}' for role, user in users.items()}
+    client = app.test_client()
+
+    print(f"{'endpoint':<32}" + ''.join(f'{name:>22}' for name in VARIANTS))
+    print(f"{'':<32}" + ''.join(f"{'bytes':>12}{'cpu ms':>10}" for _ in VARIANTS))
+    for role, path in endpoints(route_id[0]):
+        row = f'{path:<32}'
+        for extra in VARIANTS.values():
+            size, cpu = measure(client, path, {'Authorization': tokens[role], **extra}, args.repeat)
+            row += f'{size:>12}{cpu * 1000:>10.2f}'
+        print(row)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# Location ingestion benchmark: JSON pings vs binary frames (run from backend/)
+#
+#   python -m benchmarks.ingest --fixes 5000 --frame-size 20
+#
+# Sends the same fixes through PUT /api/buses/<id>/location (one JSON request
+# per fix) and POST /api/buses/locations (frames of --frame-size records),
+# and reports throughput, CPU time and request+response body bytes per fix.
+# Uses the benchmark database; generate it first with
+# `python -m benchmarks.run --generate`.
+import argparse
+import json
+import random
+import sys
+import time
+
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db
+from app.models import Bus, User
+from app.utils.location_buffer import location_buffer
+from app.utils.tracker_frames import CONTENT_TYPE, Fix, decode_ack, encode_frame
+from benchmarks import datagen
+
+
+def make_fixes(bus_ids, count, seed):
+    rng = random.Random(seed)
+    now = int(time.time())
+    return [
+        Fix(rng.choice(bus_ids), now - count + i,
+            datagen.CENTER_LAT + rng.uniform(-0.1, 0.1),
+            datagen.CENTER_LON + rng.uniform(-0.1, 0.1),
+            rng.uniform(0, 70), rng.uniform(0, 360))
+        for i in range(count)
+    ]
+
+
+def run_json(client, headers, fixes):
+    wire = 0
+    for fix in fixes:
+        body = json.dumps({'latitude': fix.latitude, 'longitude': fix.longitude}).encode()
+        response = client.put(f'/api/buses/{fix.bus_id}/location', data=body,
+                              headers={**headers, 'Content-Type': 'application/json'})
+        wire += len(body) + len(response.get_data())
+        if response.status_code >= 400:
+            raise RuntimeError(f'JSON ping failed: {response.status_code} {response.get_data(as_text=True)}')
+    return wire
+
+
+def run_frames(client, headers, fixes, frame_size):
+    wire = 0
+    for i in range(0, len(fixes), frame_size):
+        body = encode_frame(fixes[i:i + frame_size])
+        response = client.post('/api/buses/locations', data=body,
+                               headers={**headers, 'Content-Type': CONTENT_TYPE})
+        wire += len(body) + len(response.get_data())
+        if response.status_code >= 400:
+            raise RuntimeError(f'Frame failed: {response.status_code} {response.get_data(as_text=True)}')
+        decode_ack(response.get_data())
+    return wire
+
+
+def measure(fn, *args):
+    location_buffer.flush()
+    wall, cpu = time.perf_counter(), time.process_time()
+    wire = fn(*args)
+    location_buffer.flush()
+    return time.perf_counter() - wall, time.process_time() - cpu, wire
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='JSON vs binary location ingestion')
+    parser.add_argument('--fixes', type=int, default=5000)
+    parser.add_argument('--frame-size', type=int, default=20, help='Records per binary frame')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    app = create_app('benchmark')
+    with app.app_context():
+        bus_ids = [bus_id for (bus_id,) in db.session.query(Bus.id)]
+        operator = User.query.filter_by(role='operator').first()
+        if not bus_ids or not operator:
+            parser.error('Dataset is empty; run `python -m benchmarks.run --generate` first')
+        headers = {'Authorization': f'Bearer {create_access_token(identity=str(operator.id))}'}
+        fixes = make_fixes(bus_ids, args.fixes, args.seed)
+        client = app.test_client()
+
+        results = {
+            'json': measure(run_json, client, headers, fixes),
+            f'binary x{args.frame_size}': measure(run_frames, client, headers, fixes, args.frame_size),
+        }
+
+    print(f"{'path':<14}{'fixes/s':>10}{'cpu us/fix':>12}{'body B/fix':>11}")
+    for name, (wall, cpu, wire) in results.items():
+        print(f'{name:<14}{args.fixes / wall:>10.0f}{cpu / args.fixes * 1e6:>12.1f}{wire / args.fixes:>11.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
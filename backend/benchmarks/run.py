@@ -0,0 +1,236 @@
+# Benchmark driver (run from backend/)
+#
+#   python -m benchmarks.run --generate --preset city
+#   python -m benchmarks.run --scenario checkin_spike --requests 5000 --concurrency 16
+#   python -m benchmarks.run --save-baseline      # store results as the baseline
+#
+# Requests are replayed in-process through Flask test clients, one per driver
+# thread, against the database in BENCHMARK_DATABASE_URL (a local SQLite file
+# by default). Results are compared with benchmarks/baseline.json when it
+# exists.
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Student, Route
+from app.utils import db_pool
+from benchmarks import datagen
+from benchmarks.scenarios import SCENARIOS
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+TOKENS_PER_ROLE = 200
+
+_local = threading.local()
+
+
+def _count_query(statement, elapsed):
+    _local.queries = getattr(_local, 'queries', 0) + 1
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA busy_timeout=30000')
+    cursor.close()
+
+
+def build_context():
+    rows = (
+        db.session.query(Student.id, Student.card_id, Student.route_id, Route.bus_id)
+        .join(Route, Student.route_id == Route.id)
+        .filter(Student.is_active.is_(True))
+        .all()
+    )
+    students = [
+        {'id': r.id, 'card_id': r.card_id, 'route_id': r.route_id, 'bus_id': r.bus_id}
+        for r in rows
+    ]
+    tokens = {}
+    for role in ('admin', 'operator', 'parent'):
+        user_ids = [u.id for u in User.query.filter_by(role=role).limit(TOKENS_PER_ROLE)]
+        tokens[role] = [create_access_token(identity=str(user_id)) for user_id in user_ids]
+    return {
+        'students': students,
+        'bus_ids': sorted({s['bus_id'] for s in students}),
+        'tokens': tokens,
+    }
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_scenario(app, ctx, name, total_requests, concurrency, seed):
+    steps = SCENARIOS[name]
+    weights = [weight for _, weight, _ in steps]
+    samples = {step: {'latencies': [], 'queries': [], 'errors': 0} for step, _, _ in steps}
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        client = app.test_client()
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            step, _, factory = rng.choices(steps, weights=weights)[0]
+            method, path, role, body = factory(ctx, rng)
+            token = rng.choice(ctx['tokens'][role])
+
+            _local.queries = 0
+            started = time.perf_counter()
+            response = client.open(path, method=method, json=body,
+                                   headers={'Authorization': f'Bearer {token}'})
+            elapsed = time.perf_counter() - started
+
+            with lock:
+                result = samples[step]
+                result['latencies'].append(elapsed)
+                result['queries'].append(_local.queries)
+                if response.status_code >= 400:
+                    result['errors'] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    report = {'wall_seconds': round(wall, 3), 'throughput_rps': round(total_requests / wall, 1), 'steps': {}}
+    for step, result in samples.items():
+        latencies = result['latencies']
+        if not latencies:
+            continue
+        report['steps'][step] = {
+            'requests': len(latencies),
+            'errors': result['errors'],
+            'throughput_rps': round(len(latencies) / wall, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'queries_avg': round(sum(result['queries']) / len(latencies), 2),
+            'queries_max': max(result['queries']),
+        }
+    return report
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions against the baseline."""
+    regressions = []
+    for scenario, report in results['scenarios'].items():
+        base_report = baseline.get('scenarios', {}).get(scenario)
+        if not base_report:
+            continue
+        for step, stats in report['steps'].items():
+            base = base_report['steps'].get(step)
+            if not base:
+                continue
+            for metric in ('p95_ms', 'p99_ms'):
+                if base[metric] and stats[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(f'{scenario}/{step}: {metric} {base[metric]} -> {stats[metric]}')
+            if stats['queries_avg'] > base['queries_avg'] + 0.5:
+                regressions.append(
+                    f"{scenario}/{step}: queries_avg {base['queries_avg']} -> {stats['queries_avg']}"
+                )
+    return regressions
+
+
+def print_report(results, baseline):
+    header = f"{'step':<26}{'req':>7}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'q/req':>7}"
+    for scenario, report in results['scenarios'].items():
+        print(f"\n== {scenario}: {report['throughput_rps']} req/s over {report['wall_seconds']}s")
+        print(header)
+        base_steps = baseline.get('scenarios', {}).get(scenario, {}).get('steps', {}) if baseline else {}
+        for step, s in report['steps'].items():
+            line = (f"{step:<26}{s['requests']:>7}{s['errors']:>5}{s['throughput_rps']:>9}"
+                    f"{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}{s['queries_avg']:>7}")
+            base = base_steps.get(step)
+            if base and base['p95_ms']:
+                line += f"   p95 {(s['p95_ms'] / base['p95_ms'] - 1) * 100:+.0f}% vs baseline"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Kiddie Bus load benchmarks')
+    parser.add_argument('--generate', action='store_true', help='(Re)generate the synthetic dataset first')
+    parser.add_argument('--preset', default='small', choices=sorted(datagen.PRESETS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Scenario to run (repeatable, default: all)')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95/p99 growth vs baseline')
+    parser.add_argument('--output', help='Write the JSON results here')
+    args = parser.parse_args(argv)
+
+    app = create_app('benchmark')
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _sqlite_pragmas)
+            db.engine.dispose()
+
+        if args.generate:
+            summary = datagen.generate(args.preset, args.seed)
+            print('Generated dataset:', json.dumps(summary))
+
+        db_pool.query_observers.append(_count_query)
+        ctx = build_context()
+        if not ctx['students']:
+            parser.error('Dataset is empty; run with --generate first')
+
+        results = {
+            'database': db.engine.dialect.name,
+            'concurrency': args.concurrency,
+            'requests_per_scenario': args.requests,
+            'scenarios': {},
+        }
+        for name in args.scenario or sorted(SCENARIOS):
+            results['scenarios'][name] = run_scenario(
+                app, ctx, name, args.requests, args.concurrency, args.seed
+            )
+            db.session.remove()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as fh:
+            json.dump(results, fh, indent=2)
+        print(f'\nBaseline saved to {args.baseline}')
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance) if baseline else []
+    if regressions:
+        print('\nRegressions:')
+        for line in regressions:
+            print('  ' + line)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# Traffic scenarios replayed by the benchmark driver
+#
+# A scenario is a list of (step name, weight, factory). The driver picks a
+# step by weight and calls factory(ctx, rng), which returns
+# (method, path, role, json body or None). `role` selects which kind of
+# user's token signs the request.
+from datetime import datetime
+
+
+def _student(ctx, rng):
+    return ctx['students'][rng.randrange(len(ctx['students']))]
+
+
+def _bus(ctx, rng):
+    return ctx['bus_ids'][rng.randrange(len(ctx['bus_ids']))]
+
+
+def checkin(ctx, rng):
+    student = _student(ctx, rng)
+    return 'POST', f"/api/students/{student['id']}/checkin", 'operator', {
+        'bus_id': student['bus_id'],
+        'route_id': student['route_id'],
+        'boarding_type': rng.choice(['pickup', 'pickup', 'pickup', 'dropoff']),
+        'verification_method': 'card',
+        'latitude': 18.04 + rng.uniform(-0.05, 0.05),
+        'longitude': -77.50 + rng.uniform(-0.05, 0.05),
+    }
+
+
+def card_lookup(ctx, rng):
+    return 'GET', f"/api/students/card/{_student(ctx, rng)['card_id']}", 'operator', None
+
+
+def gps_ping(ctx, rng):
+    return 'PUT', f'/api/buses/{_bus(ctx, rng)}/location', 'operator', {
+        'latitude': 18.04 + rng.uniform(-0.1, 0.1),
+        'longitude': -77.50 + rng.uniform(-0.1, 0.1),
+    }
+
+
+def parent_students(ctx, rng):
+    return 'GET', '/api/students', 'parent', None
+
+
+def parent_notifications(ctx, rng):
+    return 'GET', '/api/notifications?limit=20', 'parent', None
+
+
+def parent_bus(ctx, rng):
+    return 'GET', f'/api/buses/{_bus(ctx, rng)}', 'parent', None
+
+
+def parent_route(ctx, rng):
+    return 'GET', f"/api/routes/{_student(ctx, rng)['route_id']}", 'parent', None
+
+
+def parent_boardings(ctx, rng):
+    return 'GET', f"/api/students/{_student(ctx, rng)['id']}/boardings?limit=20", 'admin', None
+
+
+def operator_buses(ctx, rng):
+    return 'GET', '/api/buses', 'operator', None
+
+
+def operator_routes(ctx, rng):
+    return 'GET', '/api/routes', 'operator', None
+
+
+def operator_route_students(ctx, rng):
+    return 'GET', f"/api/routes/{_student(ctx, rng)['route_id']}/students", 'operator', None
+
+
+def broadcast(ctx, rng):
+    return 'POST', '/api/notifications/broadcast', 'operator', {
+        'title': 'Delay',
+        'message': f'Buses on this route are running late ({datetime.utcnow():%H:%M}).',
+        'notification_type': 'delay',
+        'route_id': _student(ctx, rng)['route_id'],
+    }
+
+
+SCENARIOS = {
+    # 7:30am: drivers scanning cards while parents check where the bus is
+    'checkin_spike': [
+        ('checkin', 6, checkin),
+        ('card_lookup', 2, card_lookup),
+        ('parent_bus', 2, parent_bus),
+    ],
+    # Trackers reporting positions every few seconds
+    'gps_pings': [
+        ('gps_ping', 1, gps_ping),
+    ],
+    # Home screens and the operator dashboard refreshing
+    'dashboard_polling': [
+        ('parent_students', 3, parent_students),
+        ('parent_notifications', 3, parent_notifications),
+        ('parent_route', 2, parent_route),
+        ('parent_bus', 2, parent_bus),
+        ('parent_boardings', 1, parent_boardings),
+        ('operator_buses', 1, operator_buses),
+        ('operator_routes', 1, operator_routes),
+        ('operator_route_students', 1, operator_route_students),
+    ],
+    # Operators sending route-wide alerts while parents read them
+    'broadcasts': [
+        ('broadcast', 1, broadcast),
+        ('parent_notifications', 4, parent_notifications),
+    ],
+}
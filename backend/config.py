@@ -14,6 +14,181 @@ class Config:
         SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace('postgres://', 'postgresql://', 1)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Read replicas (comma separated). GET requests to the blueprints in
+    # DB_REPLICA_BLUEPRINTS read from a replica; migrations always use the primary.
+    SQLALCHEMY_REPLICA_URIS = [
+        url.strip().replace('postgres://', 'postgresql://', 1)
+        for url in os.environ.get('DATABASE_REPLICA_URLS', os.environ.get('DATABASE_REPLICA_URL', '')).split(',')
+        if url.strip()
+    ]
+    DB_REPLICA_BLUEPRINTS = ('buses', 'routes', 'schools', 'notifications', 'students', 'trips', 'dashboard')
+    # After a write, that user's reads stay on the primary for this long
+    DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+
+    # Connection pool, per gunicorn worker. Keep
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below the server's max_connections.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))  # seconds to wait for a connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # seconds
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 15000))
+    DB_SLOW_QUERY_MS = int(os.environ.get('DB_SLOW_QUERY_MS', 500))
+
+    # Long-poll endpoints (e.g. bus location). Waiters re-read the database
+    # every LONG_POLL_RECHECK_SECONDS to see updates made by other workers.
+    LONG_POLL_TIMEOUT = int(os.environ.get('LONG_POLL_TIMEOUT', 25))
+    LONG_POLL_RECHECK_SECONDS = int(os.environ.get('LONG_POLL_RECHECK_SECONDS', 5))
+
+    # Request instrumentation. Requests issuing at least
+    # SQL_QUERIES_WARN_THRESHOLD statements are logged as possible N+1s.
+    SQL_QUERIES_WARN_THRESHOLD = int(os.environ.get('SQL_QUERIES_WARN_THRESHOLD', 50))
+    # Sampling profiler: off unless PROFILE_SLOW_REQUEST_MS > 0. A fraction
+    # (PROFILE_SAMPLE_RATE) of requests is sampled; slow ones are written to
+    # PROFILE_OUTPUT_DIR as collapsed stacks for flame graphs. Not available
+    # under the gevent worker class.
+    PROFILE_SLOW_REQUEST_MS = int(os.environ.get('PROFILE_SLOW_REQUEST_MS', 0))
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.1))
+    PROFILE_SAMPLE_INTERVAL_MS = int(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 5))
+    PROFILE_OUTPUT_DIR = os.environ.get('PROFILE_OUTPUT_DIR', '/tmp/kiddiebus-profiles')
+
+    # Google sign-in. Signing keys are cached per process (see
+    # app/utils/google_tokens.py); point GOOGLE_CERTS_URL at a local JWKS for tests.
+    GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
+    GOOGLE_CERTS_URL = os.environ.get('GOOGLE_CERTS_URL', 'https://www.googleapis.com/oauth2/v3/certs')
+
+    # Password hashing runs in a per-worker process pool (0 = inline).
+    # Stored hashes with a different cost are rehashed on the next login.
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    AUTH_HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', 2))
+    AUTH_HASH_MAX_PENDING = int(os.environ.get('AUTH_HASH_MAX_PENDING', 16))
+    AUTH_HASH_TIMEOUT = int(os.environ.get('AUTH_HASH_TIMEOUT', 5))  # seconds
+
+    # Failed password logins allowed per LOGIN_FAILURE_WINDOW seconds
+    LOGIN_MAX_FAILURES_PER_ACCOUNT = int(os.environ.get('LOGIN_MAX_FAILURES_PER_ACCOUNT', 5))
+    LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', 50))
+    LOGIN_FAILURE_WINDOW = int(os.environ.get('LOGIN_FAILURE_WINDOW', 900))
+    # Reverse proxies in front of the app (1 on Heroku). X-Forwarded-For is
+    # only trusted for this many hops; 0 = use the socket address.
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+
+    # Bus location pings are buffered per bus and written in batches
+    # (app/utils/location_buffer.py). 0 ms = write each ping synchronously.
+    LOCATION_FLUSH_INTERVAL_MS = int(os.environ.get('LOCATION_FLUSH_INTERVAL_MS', 1000))
+    LOCATION_FLUSH_MAX_UPDATES = int(os.environ.get('LOCATION_FLUSH_MAX_UPDATES', 500))
+    LOCATION_MAX_STALENESS_MS = int(os.environ.get('LOCATION_MAX_STALENESS_MS', 5000))
+
+    # Every fix is also kept in bus_positions for trip replay
+    # (GET /api/buses/<id>/history). Windows are downsampled to at most
+    # LOCATION_HISTORY_MAX_POINTS buckets before line simplification.
+    LOCATION_HISTORY_ENABLED = os.environ.get('LOCATION_HISTORY_ENABLED', 'true').lower() == 'true'
+    LOCATION_HISTORY_RETENTION_DAYS = int(os.environ.get('LOCATION_HISTORY_RETENTION_DAYS', 90))
+    LOCATION_HISTORY_MAX_DAYS = 31  # longest window per request
+    LOCATION_HISTORY_MAX_POINTS = 5000
+    LOCATION_HISTORY_TOLERANCE_M = 10
+
+    # Route times are local wall-clock times in SCHEDULE_TIMEZONE. Trips are
+    # materialized TRIP_HORIZON_DAYS ahead by `flask trips materialize`.
+    SCHEDULE_TIMEZONE = os.environ.get('SCHEDULE_TIMEZONE', 'America/Jamaica')
+    TRIP_HORIZON_DAYS = int(os.environ.get('TRIP_HORIZON_DAYS', 7))
+    TRIP_DEFAULT_DURATION_MINUTES = 90  # routes without an end time
+
+    # Delay detection (`flask delays watch`). Parents on a route are alerted
+    # once per trip when its estimated delay reaches DELAY_THRESHOLD_MINUTES.
+    DELAY_THRESHOLD_MINUTES = int(os.environ.get('DELAY_THRESHOLD_MINUTES', 10))
+    DELAY_DETECTOR_INTERVAL_SECONDS = int(os.environ.get('DELAY_DETECTOR_INTERVAL_SECONDS', 60))
+    DELAY_AVERAGE_SPEED_KMH = 25  # for arrival estimates
+    DELAY_POSITION_STALE_MINUTES = 5  # older bus positions are ignored
+    DELAY_DEPARTED_RADIUS_M = 300  # a bus this far from the route start has left
+
+    # Attendance reconciliation, every ATTENDANCE_INTERVAL_SECONDS. A trip is
+    # settled ATTENDANCE_GRACE_MINUTES after its scheduled end; pickups from
+    # ATTENDANCE_EARLY_MINUTES before its start count towards it.
+    ATTENDANCE_GRACE_MINUTES = int(os.environ.get('ATTENDANCE_GRACE_MINUTES', 15))
+    ATTENDANCE_INTERVAL_SECONDS = int(os.environ.get('ATTENDANCE_INTERVAL_SECONDS', 60))
+    ATTENDANCE_EARLY_MINUTES = 30
+    ATTENDANCE_LOOKBACK_HOURS = 24  # older unreconciled trips are left alone
+
+    # Operator dashboard counters (app/utils/counters.py). Active buses
+    # without a fix for this long count as stale trackers.
+    DASHBOARD_STALE_TRACKER_MINUTES = int(os.environ.get('DASHBOARD_STALE_TRACKER_MINUTES', 10))
+
+    # Response compression (app/utils/encoding.py). br needs the brotli
+    # package; bodies under COMPRESSION_MIN_SIZE bytes are sent as is.
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+    COMPRESSION_GZIP_LEVEL = 6
+    COMPRESSION_BROTLI_QUALITY = 4  # 0-11; higher is smaller but much slower
+
+    # POST /api/batch: sub-requests per batch, and threads for consecutive
+    # GETs (each holds its own DB connection while it runs)
+    BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+    BATCH_READ_CONCURRENCY = int(os.environ.get('BATCH_READ_CONCURRENCY', 4))
+
+    # Automatic alerts to the same parent and of the same type within this many
+    # seconds are merged into one digest (app/utils/digests.py, `flask
+    # notifications watch`). Urgent alerts are never held; 0 = no batching.
+    # Due digests are sent every NOTIFICATION_DIGEST_INTERVAL_SECONDS.
+    NOTIFICATION_DIGEST_INTERVAL_SECONDS = int(os.environ.get('NOTIFICATION_DIGEST_INTERVAL_SECONDS', 15))
+    NOTIFICATION_DIGEST_WINDOW_SECONDS = int(os.environ.get('NOTIFICATION_DIGEST_WINDOW_SECONDS', 300))
+    NOTIFICATION_DIGEST_HIGH_WINDOW_SECONDS = int(os.environ.get('NOTIFICATION_DIGEST_HIGH_WINDOW_SECONDS', 60))
+
+    # Broadcasts to at least this many recipients are stored once, with the
+    # audience as a membership bitmask per 64 user ids, instead of one
+    # notification row each (app/utils/broadcasts.py)
+    BROADCAST_SHARED_MIN_RECIPIENTS = int(os.environ.get('BROADCAST_SHARED_MIN_RECIPIENTS', 25))
+
+    # Change events for buses, routes, students and schools
+    # (app/utils/change_events.py). auto = LISTEN/NOTIFY on PostgreSQL,
+    # in-process only elsewhere. The outbox keeps CHANGE_EVENTS_RETENTION_HOURS.
+    CHANGE_EVENTS_BACKEND = os.environ.get('CHANGE_EVENTS_BACKEND', 'auto')  # auto, postgres, local
+    CHANGE_EVENTS_LISTEN = os.environ.get('CHANGE_EVENTS_LISTEN', 'true').lower() == 'true'
+    CHANGE_EVENTS_RETENTION_HOURS = int(os.environ.get('CHANGE_EVENTS_RETENTION_HOURS', 72))
+
+    # Background jobs (`flask jobs worker`, app/jobs.py). JOBS_POOLS sets the
+    # threads per pool; a worker claims due jobs every JOBS_POLL_SECONDS.
+    JOBS_POOLS = os.environ.get('JOBS_POOLS', 'default=4,maintenance=1')
+    JOBS_POLL_SECONDS = int(os.environ.get('JOBS_POLL_SECONDS', 1))
+    JOBS_SCHEDULE_LOOKBACK_MINUTES = 5  # a new leader still enqueues ticks missed this recently
+    JOBS_RETENTION_DAYS = int(os.environ.get('JOBS_RETENTION_DAYS', 7))
+
+    # Minutes a bus needs between routes; assignments closer than this conflict
+    ROUTE_CONFLICT_BUFFER_MINUTES = int(os.environ.get('ROUTE_CONFLICT_BUFFER_MINUTES', 0))
+
+    # Admission control for write-heavy endpoints (app/utils/rate_limit.py).
+    # identity/device are (requests per second, burst) token buckets; one
+    # operator account may drive many trackers, so location is mainly limited
+    # per (account, bus). RATE_LIMIT_STORAGE_URL (redis://...) shares buckets across workers.
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_STORAGE_URL = os.environ.get('RATE_LIMIT_STORAGE_URL')
+    RATE_LIMITS = {
+        'location': {'priority': 'telemetry', 'identity': (50, 200), 'device': (1, 10)},
+        'location_frames': {'priority': 'telemetry', 'identity': (20, 100), 'device': (1, 10)},
+        'checkin': {'priority': 'critical', 'identity': (10, 120)},
+        'broadcast': {'priority': 'normal', 'identity': (0.2, 10)},
+    }
+    # Under load (fraction of LOAD_SHED_MAX_INFLIGHT requests or of the DB
+    # pool in use) lower priorities are refused with 503 first. Priorities
+    # without a threshold (critical) are never shed.
+    LOAD_SHED_MAX_INFLIGHT = int(os.environ.get('LOAD_SHED_MAX_INFLIGHT', 100))
+    LOAD_SHED_THRESHOLDS = {'telemetry': 0.75, 'normal': 0.9}
+
+    # Shared secret for scraping /api/metrics without a JWT (X-Metrics-Token header)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Boarding archive: closed months are moved out of the boardings table
+    # into compressed columnar files. BOARDING_HOT_MONTHS is how many closed
+    # months stay in the database alongside the current one. The nightly
+    # boardings.archive job only runs with BOARDING_ARCHIVE_SCHEDULED=true,
+    # which needs BOARDING_ARCHIVE_DIR on storage every web and worker process
+    # shares; a local disk (e.g. a Heroku dyno's) loses the archived months.
+    BOARDING_ARCHIVE_DIR = os.environ.get(
+        'BOARDING_ARCHIVE_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive', 'boardings')
+    )
+    BOARDING_HOT_MONTHS = int(os.environ.get('BOARDING_HOT_MONTHS', 1))
+    BOARDING_ARCHIVE_SCHEDULED = os.environ.get('BOARDING_ARCHIVE_SCHEDULED', 'false').lower() == 'true'
+
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -26,11 +201,25 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    BCRYPT_LOG_ROUNDS = 4
+    AUTH_HASH_WORKERS = 0
+    LOCATION_FLUSH_INTERVAL_MS = 0
+
+
+class BenchmarkConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'BENCHMARK_DATABASE_URL',
+        'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'bench.db')
+    )
+    # The driver measures the endpoints themselves, not the limiter
+    RATE_LIMIT_ENABLED = False
 
 
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
     'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
     'default': DevelopmentConfig
 }
@@ -0,0 +1,28 @@
+# Gunicorn settings for `gunicorn -c gunicorn.conf.py run:app`
+#
+# WEB_WORKER_CLASS=sync    one request per worker (default)
+# WEB_WORKER_CLASS=gevent  evented workers; each holds up to WORKER_CONNECTIONS
+#                          open requests, so idle long-polls (bus location
+#                          waits) don't pin a worker. See DEPLOYMENT_INSTRUCTIONS.md
+#                          for the worker/connection budget.
+import os
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'sync')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 blocks the whole process unless it yields to the gevent hub
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def worker_exit(server, worker):
+    # Write buffered bus locations before the worker goes away
+    from app.utils.location_buffer import location_buffer
+    location_buffer.flush()
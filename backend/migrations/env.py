@@ -16,6 +16,7 @@ logger = logging.getLogger('alembic.env')
 
 
 def get_engine():
+    # Always the primary: replica binds are never migrated directly
     try:
         # this works with Flask-SQLAlchemy<3 and Alchemical
         return current_app.extensions['migrate'].db.get_engine()
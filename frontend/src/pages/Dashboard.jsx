@@ -2,7 +2,7 @@ import { useEffect, useState } from 'react';
 import { Link } from 'react-router-dom';
 import useAuthStore from '../store/authStore';
 import useNotificationStore from '../store/notificationStore';
-import { routesAPI, studentsAPI, busesAPI } from '../services/api';
+import { routesAPI, studentsAPI, busesAPI, dashboardAPI } from '../services/api';
 
 function Dashboard() {
   const { user, isOperator, isParent } = useAuthStore();
@@ -36,10 +36,10 @@ function Dashboard() {
           buses: busesRes.data.buses.length,
         });
       } else if (isParent()) {
-        const studentsRes = await studentsAPI.getAll();
+        const homeRes = await dashboardAPI.parentHome();
         setStats({
           ...stats,
-          students: studentsRes.data.students.length,
+          students: homeRes.data.children.length,
         });
       }
     } catch (error) {
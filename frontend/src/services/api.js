@@ -9,6 +9,10 @@ const api = axios.create({
   },
 });
 
+// Read-your-writes: after a write the API returns X-Read-After, and echoing it
+// keeps our reads on the primary database until replicas have caught up
+let readAfter = null;
+
 // Request interceptor to add auth token
 api.interceptors.request.use(
   (config) => {
@@ -16,6 +20,9 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    if (readAfter && Number(readAfter) * 1000 > Date.now()) {
+      config.headers['X-Read-After'] = readAfter;
+    }
     return config;
   },
   (error) => Promise.reject(error)
@@ -23,7 +30,12 @@ api.interceptors.request.use(
 
 // Response interceptor to handle token refresh
 api.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    if (response.headers['x-read-after']) {
+      readAfter = response.headers['x-read-after'];
+    }
+    return response;
+  },
   async (error) => {
     const originalRequest = error.config;
     const requestUrl = originalRequest?.url || '';
@@ -138,4 +150,15 @@ export const notificationsAPI = {
   delete: (id) => api.delete(`/notifications/${id}`),
 };
 
+// Dashboard API (one-call home screens)
+export const dashboardAPI = {
+  parentHome: () => api.get('/dashboard/parent'),
+};
+
+// Batch API: several calls in one round trip
+// requests: [{ id, method, path: '/api/...', body }]
+export const batchAPI = {
+  run: (requests) => api.post('/batch', { requests }),
+};
+
 export default api;